@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Optional
+
+
+def make_key(*parts) -> str:
+    """Считает sha256 по набору частей (bytes, str или JSON-сериализуемые объекты)"""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            data = part
+        elif isinstance(part, str):
+            data = part.encode("utf-8")
+        else:
+            data = json.dumps(part, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+        # Длина перед частью - чтобы ("ab", "c") и ("a", "bc") давали разные ключи
+        h.update(len(data).to_bytes(8, "big"))
+        h.update(data)
+    return h.hexdigest()
+
+
+def normalize_params(params: dict) -> dict:
+    """Нормализует параметры урока для ключа кэша: пробелы, пустые значения"""
+    normalized = {}
+    for name, value in params.items():
+        if isinstance(value, str):
+            value = " ".join(value.split())
+        if value is None or value == "":
+            value = ""
+        normalized[name] = value
+    return normalized
+
+
+class DiskCache:
+    """Кэш на диске: один JSON-файл на ключ, вытеснение по возрасту и суммарному размеру"""
+
+    def __init__(self, directory: str, max_age: float, max_bytes: int):
+        self.directory = directory
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        """Возвращает сохранённое значение или None, если записи нет или она устарела"""
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"Повреждённая запись кэша {key}: {e}")
+            return None
+
+    def put(self, key: str, value: dict) -> None:
+        """Атомарно записывает значение и запускает вытеснение"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            logging.warning(f"Не удалось записать кэш {key}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.evict()
+
+    def evict(self) -> None:
+        """Удаляет устаревшие записи, затем самые старые - пока размер больше лимита"""
+        with self._lock:
+            now = time.time()
+            entries = []
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if now - stat.st_mtime > self.max_age:
+                    self._remove(entry.path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+# Кэш готовых планов (PLAN_CACHE_DIR, PLAN_CACHE_MAX_AGE в секундах, PLAN_CACHE_MAX_MB)
+plan_cache = DiskCache(
+    directory=os.getenv("PLAN_CACHE_DIR", os.path.join(tempfile.gettempdir(), "lesson_plan_cache")),
+    max_age=float(os.getenv("PLAN_CACHE_MAX_AGE", 7 * 24 * 3600)),
+    max_bytes=int(float(os.getenv("PLAN_CACHE_MAX_MB", 100)) * 1024 * 1024),
+)
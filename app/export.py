@@ -0,0 +1,115 @@
+import io
+import os
+import time
+import uuid
+import hashlib
+import logging
+import tempfile
+import threading
+from datetime import datetime
+from collections import OrderedDict
+
+from docx import Document
+
+# Экспорт планов в .docx: документ собирается в памяти, файл пишется только для кнопки скачивания
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(tempfile.gettempdir(), "lesson_plan_exports"))
+EXPORT_MAX_AGE = float(os.getenv("EXPORT_MAX_AGE", 3600))  # секунд
+EXPORT_MAX_BYTES = int(float(os.getenv("EXPORT_MAX_MB", 200)) * 1024 * 1024)
+JANITOR_INTERVAL = 300  # секунд между уборками
+
+MEMO_SIZE = 128  # сколько последних планов помнят путь к своему .docx
+
+os.makedirs(EXPORT_DIR, exist_ok=True)
+_janitor = None
+_memo = OrderedDict()  # sha256 текста плана -> путь к .docx
+_memo_lock = threading.Lock()
+
+
+def render_docx(text: str) -> bytes:
+    """Собирает .docx из текста плана в памяти"""
+    doc = Document()
+    for line in text.split("\n"):
+        doc.add_paragraph(line)
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+def materialize(data: bytes) -> str:
+    """Пишет документ во временный файл с уникальным именем и возвращает путь"""
+    name = f"lesson_plan_{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}.docx"
+    path = os.path.join(EXPORT_DIR, name)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return path
+
+
+def generate_docx(text: str) -> str:
+    """Сохраняет текст в .docx и возвращает путь"""
+    return materialize(render_docx(text))
+
+
+def docx_for_plan(text: str) -> str:
+    """Возвращает .docx для плана, собирая его только при первом запросе (пока файл не убран уборщиком)"""
+    key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    with _memo_lock:
+        path = _memo.get(key)
+        if path and os.path.exists(path):
+            _memo.move_to_end(key)
+            return path
+
+    path = generate_docx(text)
+    with _memo_lock:
+        _memo[key] = path
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    return path
+
+
+def cleanup_exports() -> None:
+    """Удаляет экспортированные файлы старше EXPORT_MAX_AGE, затем самые старые - сверх EXPORT_MAX_BYTES"""
+    now = time.time()
+    files = []
+    for entry in os.scandir(EXPORT_DIR):
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        if now - stat.st_mtime > EXPORT_MAX_AGE:
+            _remove(entry.path)
+        else:
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= EXPORT_MAX_BYTES:
+            break
+        _remove(path)
+        total -= size
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _janitor_loop() -> None:
+    while True:
+        try:
+            cleanup_exports()
+        except Exception as e:
+            logging.error(f"Export janitor error: {e}")
+        time.sleep(JANITOR_INTERVAL)
+
+
+def start_janitor() -> None:
+    """Запускает фоновую уборку экспортов (один раз на процесс)"""
+    global _janitor
+    if _janitor is not None:
+        return
+    _janitor = threading.Thread(target=_janitor_loop, name="export-janitor", daemon=True)
+    _janitor.start()
@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+from app import http_client
+
+## Отзывы: сначала пишем в локальный спул (SQLite), в google-таблицу отправляет фоновый поток
+GOOGLE_SHEET_URL = os.getenv("FEEDBACK_GS_URL")
+# Спул хранится между перезапусками: /data - постоянное хранилище HF Spaces, иначе папка data/ проекта
+DATA_DIR = os.getenv("DATA_DIR", "/data" if os.path.isdir("/data") else
+                     os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
+SPOOL_PATH = os.getenv("FEEDBACK_SPOOL_PATH", os.path.join(DATA_DIR, "feedback_spool.sqlite3"))
+FLUSH_INTERVAL = 30  # секунд между попытками отправки
+FLUSH_DELAY = 5  # после нового отзыва ждём немного, чтобы собрать пачку
+BATCH_SIZE = 50
+# После стольких неудачных попыток отзыв переносится в feedback_dead и больше не блокирует очередь
+MAX_ATTEMPTS = int(os.getenv("FEEDBACK_MAX_ATTEMPTS", 100))
+# FEEDBACK_GS_BATCH=1 - скрипт таблицы принимает {"rows": [...]} одним запросом;
+# иначе строки пачки отправляются по одной в прежнем формате {"comment", "rate"}
+BATCH_POST = os.getenv("FEEDBACK_GS_BATCH", "0") == "1"
+
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_flusher = None
+
+
+@contextmanager
+def _spool() -> Iterator[sqlite3.Connection]:
+    """Соединение со спулом под блокировкой: коммит при успехе, закрытие всегда"""
+    with _lock:
+        os.makedirs(os.path.dirname(SPOOL_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(SPOOL_PATH, timeout=10)
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS feedback ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, "
+                "created REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0)"
+            )
+            # Недоставляемые отзывы: отклонены таблицей (4xx) или исчерпали MAX_ATTEMPTS
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS feedback_dead ("
+                "id INTEGER PRIMARY KEY, payload TEXT NOT NULL, created REAL NOT NULL, "
+                "attempts INTEGER NOT NULL, reason TEXT NOT NULL)"
+            )
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+
+def save_feedback(comment, rate) -> None:
+    """Сохраняет отзыв в спул и будит фоновую отправку - без ожидания сети"""
+    payload = json.dumps({"comment": comment, "rate": rate}, ensure_ascii=False)
+    with _spool() as conn:
+        conn.execute("INSERT INTO feedback (payload, created) VALUES (?, ?)", (payload, time.time()))
+    _wakeup.set()
+
+
+def _is_rejected(status_code: int) -> bool:
+    # 4xx (кроме таймаута и лимита запросов) - таблица не примет эти данные и при повторе
+    return 400 <= status_code < 500 and status_code not in (408, 429)
+
+
+def _send(body: dict) -> bool:
+    """True - доставлено, False - отклонено таблицей; сетевые ошибки и 5xx пробрасываются"""
+    response = http_client.post(GOOGLE_SHEET_URL, json=body)
+    if _is_rejected(response.status_code):
+        logging.error(f"Таблица отклонила отзыв: HTTP {response.status_code}")
+        return False
+    response.raise_for_status()
+    return True
+
+
+def _post_rows(rows: list[tuple[int, str]]) -> tuple[list[int], list[int], list[int]]:
+    """Отправляет строки в таблицу; возвращает id доставленных, отклонённых (4xx) и неудачных попыток.
+
+    При сетевой ошибке или 5xx отправка останавливается - неотправленное попробуем позже.
+    """
+    if BATCH_POST and len(rows) > 1:
+        try:
+            if _send({"rows": [json.loads(p) for _, p in rows]}):
+                return [row_id for row_id, _ in rows], [], []
+        except Exception as e:
+            logging.error(f"Ошибка при отправке отзывов: {e}")
+            return [], [], [row_id for row_id, _ in rows]
+        # Пачка отклонена целиком - шлём по одной, чтобы не терять остальные строки
+
+    delivered, rejected = [], []
+    for row_id, payload in rows:
+        body = {"rows": [json.loads(payload)]} if BATCH_POST else json.loads(payload)
+        try:
+            ok = _send(body)
+        except Exception as e:
+            logging.error(f"Ошибка при отправке отзыва {row_id}: {e}")
+            return delivered, rejected, [row_id]
+        (delivered if ok else rejected).append(row_id)
+    return delivered, rejected, []
+
+
+def _bury(conn: sqlite3.Connection, row_ids: list[int], reason: str) -> None:
+    """Переносит отзывы в feedback_dead - они остаются в спуле, но больше не отправляются"""
+    for row_id in row_ids:
+        conn.execute(
+            "INSERT OR REPLACE INTO feedback_dead (id, payload, created, attempts, reason) "
+            "SELECT id, payload, created, attempts, ? FROM feedback WHERE id = ?", (reason, row_id)
+        )
+        conn.execute("DELETE FROM feedback WHERE id = ?", (row_id,))
+    if row_ids:
+        logging.error(f"Отзывы {row_ids} не будут отправлены ({reason}) - сохранены в feedback_dead")
+
+
+def flush() -> int:
+    """Отправляет накопленные отзывы пачками; возвращает число доставленных"""
+    if not GOOGLE_SHEET_URL:
+        return 0
+    total = 0
+    while True:
+        with _spool() as conn:
+            rows = conn.execute(
+                "SELECT id, payload FROM feedback ORDER BY id LIMIT ?", (BATCH_SIZE,)
+            ).fetchall()
+        if not rows:
+            return total
+
+        delivered, rejected, failed = _post_rows(rows)
+
+        with _spool() as conn:
+            conn.executemany("DELETE FROM feedback WHERE id = ?", [(row_id,) for row_id in delivered])
+            _bury(conn, rejected, "rejected")
+            conn.executemany("UPDATE feedback SET attempts = attempts + 1 WHERE id = ?", [(i,) for i in failed])
+            expired = [row_id for (row_id,) in conn.execute(
+                "SELECT id FROM feedback WHERE attempts >= ?", (MAX_ATTEMPTS,)
+            )]
+            _bury(conn, expired, f"{MAX_ATTEMPTS} attempts")
+        total += len(delivered)
+        if failed:
+            # Таблица недоступна - оставшееся отправим в следующий раз
+            return total
+
+
+def _flush_loop() -> None:
+    while True:
+        if _wakeup.wait(FLUSH_INTERVAL):
+            time.sleep(FLUSH_DELAY)
+        _wakeup.clear()
+        try:
+            flush()
+        except Exception as e:
+            logging.error(f"Feedback flusher error: {e}")
+
+
+def start_flusher() -> None:
+    """Запускает фоновую отправку (один раз на процесс); сразу досылает оставшееся с прошлого запуска"""
+    global _flusher
+    if _flusher is not None:
+        return
+    if not GOOGLE_SHEET_URL:
+        logging.warning("FEEDBACK_GS_URL не задан - отзывы копятся в локальном спуле")
+    _flusher = threading.Thread(target=_flush_loop, name="feedback-flusher", daemon=True)
+    _flusher.start()
+    _wakeup.set()
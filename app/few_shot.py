@@ -0,0 +1,187 @@
+import os
+import re
+import logging
+from functools import lru_cache
+from typing import Optional
+
+from app.knowledge_base import LP_shots
+from app.knowledge_base.textbooks import GENERAL_CEFR
+from app.retrieval import methodology_key, tokenize
+from app.tokens import estimate_text_tokens
+
+# Few-shot: из готовых примеров планов (LP_shots.py) в промпт идут только подходящие этапы,
+# а не планы целиком. FEW_SHOT_MAX_TOKENS - потолок на все фрагменты (0 - отключить).
+# Общие фрагменты зависят только от методики и уровня и идут в кэшируемый префикс промпта;
+# из потолка FEW_SHOT_TL_TOKENS - на этап под target language урока (идёт после параметров)
+FEW_SHOT_MAX_TOKENS = int(os.getenv("FEW_SHOT_MAX_TOKENS", 700))
+FEW_SHOT_TL_TOKENS = min(FEW_SHOT_MAX_TOKENS, int(os.getenv("FEW_SHOT_TL_TOKENS", 200)))
+SEGMENT_MAX_TOKENS = 300  # длинный этап обрезаем по строкам
+
+# "5. PRESENTATION", "7a. PRACTICE 2a ...", "10 PRACTICE set 3", "HOMEWORK"
+STAGE_HEADING = re.compile(r"^\s*(?:\d+[a-z]?\.?\s+([A-Z]{3,}.*?)|(HOMEWORK))\s*$")
+FOOTER = re.compile(r"©[^\n]*?lesson planning example \d+\s*")
+LEVEL_LINE = re.compile(r"\b(Beginner|Elementary|Pre-Intermediate|Intermediate|Upper-Intermediate|Advanced)\s+level",
+                        re.IGNORECASE)
+TL_LINE = re.compile(r"^TARGET LANGUAGE[^\n]*?-\s*-\s*-\s*(.+)$", re.MULTILINE)
+OBJECTIVE_TL = re.compile(r"should be able to (?:use )?(?:the )?(.+?)(?: while|$)", re.MULTILINE)
+CEFR_LEVELS = ["pre-a1", "a1", "a2", "b1", "b2", "c1", "c2"]
+
+# Насколько этап полезен как образец: ядро методики важнее вспомогательных этапов
+STAGE_WEIGHTS = {
+    "presentation": 1.0, "practice": 1.0, "production": 1.0, "context": 0.7, "warmer": 0.7,
+    "input": 0.5, "introduction": 0.5, "feedback": 0.4, "homework": 0.3, "objectives": 0.2,
+}
+
+
+def stage_kind(title: str) -> str:
+    words = title.lower().split()
+    return next((w for w in words if w in STAGE_WEIGHTS), words[0] if words else "")
+
+
+def cefr_rank(value: str) -> Optional[int]:
+    """Первый уровень CEFR в строке ("A2", "A1–A2", "Pre-A1") -> номер по порядку"""
+    match = re.search(r"pre-a1|[abc][12]", str(value or "").lower())
+    return CEFR_LEVELS.index(match.group()) if match else None
+
+
+def parse_example(name: str, text: str) -> dict:
+    """Пример плана -> методика, уровень, target language и этапы [{"title", "kind", "text", "tokens", ...}]"""
+    text = FOOTER.sub("\n", text)
+    level = LEVEL_LINE.search(text)
+    tl = TL_LINE.search(text) or OBJECTIVE_TL.search(text)
+    stages, title, lines = [], None, []
+
+    def close():
+        body = "\n".join(lines).strip()
+        if title and body:
+            stages.append({"title": title, "kind": stage_kind(title), "text": body})
+
+    for line in text.split("\n"):
+        match = STAGE_HEADING.match(line)
+        if match:
+            close()
+            title, lines = (match.group(1) or match.group(2)).strip(), []
+        else:
+            lines.append(line)
+    close()
+
+    for position, stage in enumerate(stages):
+        stage["position"] = position
+        stage["text"] = truncate(stage["text"], SEGMENT_MAX_TOKENS)
+        stage["tokens"] = estimate_text_tokens(stage["text"])
+        stage["terms"] = set(tokenize(stage["text"]))
+    return {
+        "name": name,
+        "methodology": methodology_key(name.split("_")[1]),  # LP_PPP_1 -> ppp
+        "cefr": cefr_rank(GENERAL_CEFR.get(level.group(1).title(), "")) if level else None,
+        "target_language": tl.group(1).strip() if tl else "",
+        "stages": stages,
+    }
+
+
+def truncate(text: str, max_tokens: int) -> str:
+    """Обрезает текст по целым строкам до max_tokens"""
+    if estimate_text_tokens(text) <= max_tokens:
+        return text
+    kept = []
+    for line in text.split("\n"):
+        if estimate_text_tokens("\n".join(kept + [line])) > max_tokens:
+            break
+        kept.append(line)
+    return "\n".join(kept) + "\n…"
+
+
+# Этапы размечаются один раз при импорте
+EXAMPLES = [
+    parse_example(name, value) for name, value in vars(LP_shots).items()
+    if name.startswith("LP_") and isinstance(value, str)
+]
+
+
+@lru_cache(maxsize=64)
+def ranked_stages(methodology: str, cefr: Optional[int]) -> tuple:
+    """Этапы примеров той же методики, отсортированные по пользе с учётом близости уровня.
+
+    Кэш по (методика, CEFR): от конкретного урока зависит только добор по target language.
+    """
+    ranked = []
+    for example in EXAMPLES:
+        if example["methodology"] != methodology:
+            continue
+        if cefr is None or example["cefr"] is None:
+            level_factor = 0.75
+        else:
+            level_factor = max(0.25, 1 - 0.25 * abs(cefr - example["cefr"]))
+        for stage in example["stages"]:
+            ranked.append((STAGE_WEIGHTS.get(stage["kind"], 0.3) * level_factor, example, stage))
+    ranked.sort(key=lambda item: -item[0])
+    return tuple(ranked)
+
+
+@lru_cache(maxsize=64)
+def base_stages(methodology: str, cefr: Optional[int], max_tokens: int) -> tuple:
+    """Лучшие этапы в пределах max_tokens - по одному на тип этапа, в порядке хода урока"""
+    picked, kinds, used = [], set(), 0
+    for _, example, stage in ranked_stages(methodology, cefr):
+        if stage["kind"] in kinds or used + stage["tokens"] > max_tokens:
+            continue
+        picked.append((example, stage))
+        kinds.add(stage["kind"])
+        used += stage["tokens"]
+    picked.sort(key=lambda item: (item[0]["name"], item[1]["position"]))
+    return tuple(picked)
+
+
+def format_stage(example: dict, stage: dict, text: str) -> str:
+    about = f", TL: {example['target_language']}" if example["target_language"] else ""
+    return f"[{stage['title']}{about}]\n{text}"
+
+
+@lru_cache(maxsize=64)
+def select_examples(methodology: str, cefr: Optional[int],
+                    max_tokens: int = FEW_SHOT_MAX_TOKENS - FEW_SHOT_TL_TOKENS) -> str:
+    """Общие фрагменты примеров для методики и уровня - одинаковы для всех уроков, поэтому
+    стоят сразу за статическим префиксом и попадают в кэш промпта"""
+    if not methodology or max_tokens <= 0:
+        return ""
+    picked = base_stages(methodology, cefr, max_tokens)
+    if not picked:
+        return ""
+    used = sum(stage["tokens"] for _, stage in picked)
+    names = ", ".join(f"{example['name']}/{stage['title']}" for example, stage in picked)
+    logging.info(f"Few-shot: {names} (~{used} tokens)")
+    return (
+        "\nФрагменты примеров планов - образец детализации этапов (не копируй содержание):\n"
+        + "\n---\n".join(format_stage(example, stage, stage["text"]) for example, stage in picked) + "\n"
+    )
+
+
+@lru_cache(maxsize=256)
+def select_tl_example(methodology: str, cefr: Optional[int], target_language: str,
+                      max_tokens: int = FEW_SHOT_TL_TOKENS) -> str:
+    """Этап про тот же языковой материал, что и урок, - из тех, что не вошли в общие фрагменты"""
+    tl_terms = set(tokenize(target_language))
+    if not methodology or not tl_terms or max_tokens <= 0:
+        return ""
+    shown = {id(stage) for _, stage in base_stages(methodology, cefr, FEW_SHOT_MAX_TOKENS - max_tokens)}
+    best = None
+    for score, example, stage in ranked_stages(methodology, cefr):
+        overlap = len(tl_terms & stage["terms"])
+        if overlap and id(stage) not in shown and (best is None or (overlap, score) > best[:2]):
+            best = (overlap, score, example, stage)
+    if best is None:
+        return ""
+    _, _, example, stage = best
+    logging.info(f"Few-shot TL: {example['name']}/{stage['title']}")
+    return (
+        "\nФрагмент примера с похожим target language:\n"
+        + format_stage(example, stage, truncate(stage["text"], max_tokens)) + "\n"
+    )
+
+
+def few_shot_blocks(params: dict) -> tuple[str, str]:
+    """(общие фрагменты для префикса промпта, фрагмент под target language для блока параметров)"""
+    methodology = methodology_key(params.get("methodology")) or ""
+    cefr = cefr_rank(params.get("cefr"))
+    target_language = str(params.get("target_language") or "").strip().lower()
+    return select_examples(methodology, cefr), select_tl_example(methodology, cefr, target_language)
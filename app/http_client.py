@@ -0,0 +1,55 @@
+import time
+import random
+import logging
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Общая HTTP-сессия для внешних интеграций: keep-alive пул, повторы, таймауты по хостам
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5  # секунды; задержка растёт как base * 2^попытка со случайным разбросом
+DEFAULT_TIMEOUT = (3.05, 10)  # (подключение, чтение)
+HOST_TIMEOUTS = {
+    "catbox.moe": (3.05, 10),
+    "script.google.com": (3.05, 5),
+}
+
+session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20)
+session.mount("https://", _adapter)
+session.mount("http://", _adapter)
+
+
+def timeout_for(url: str) -> tuple[float, float]:
+    """Таймаут для хоста (учитываются и поддомены)"""
+    host = urlparse(url).hostname or ""
+    for known, timeout in HOST_TIMEOUTS.items():
+        if host == known or host.endswith("." + known):
+            return timeout
+    return DEFAULT_TIMEOUT
+
+
+def request(method: str, url: str, retries: int = MAX_RETRIES, **kwargs) -> requests.Response:
+    """Выполняет запрос через общую сессию; повторяет при 5xx, таймаутах и обрывах соединения.
+
+    Возвращает ответ с кодом < 500 (4xx не повторяются); после исчерпания попыток
+    пробрасывает последнее исключение.
+    """
+    kwargs.setdefault("timeout", timeout_for(url))
+    for attempt in range(retries + 1):
+        try:
+            response = session.request(method, url, **kwargs)
+            if response.status_code < 500:
+                return response
+            response.raise_for_status()
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+            if attempt == retries:
+                raise
+            delay = BACKOFF_BASE * 2 ** attempt * random.uniform(0.5, 1.5)
+            logging.warning(f"{method} {url} failed ({e}), retry {attempt + 1}/{retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
@@ -0,0 +1,195 @@
+import io
+import os
+import math
+import logging
+from typing import Optional
+
+from PIL import Image, ImageFilter, ImageOps, ImageStat
+
+# Бюджет на одно изображение после перекодирования (IMAGE_MAX_KB)
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_KB", 600)) * 1024
+JPEG_QUALITIES = (85, 75, 65, 55)
+CROP_MIN_AREA = 0.4  # обрезаем до страницы, только если она занимает не меньше 40% кадра
+BORDER_SHARE = 0.03  # полосы по краям кадра, по которым определяем цвет фона
+BACKGROUND_DISTANCE = 40  # полоса ближе к цвету фона (RGB) - фон, дальше - ещё страница
+
+# Модели, которые считают изображение патчами 32x32 (остальные - тайлами 512x512)
+PATCH_MODELS = {
+    "o4-mini": 1.72,
+    "gpt-4.1-mini": 1.62,
+    "gpt-4.1-nano": 2.46,
+}
+PATCH_SIZE = 32
+MAX_PATCHES = 1536  # больше модель не принимает - уменьшает сама
+# Сколько патчей оставляем странице (IMAGE_MAX_PATCHES): ~1000 патчей (~880x1150 для A4) хватает,
+# чтобы читался текст учебника, и это на треть дешевле предела модели
+IMAGE_MAX_PATCHES = min(int(os.getenv("IMAGE_MAX_PATCHES", 1024)), MAX_PATCHES)
+# detail=low патчевые модели не учитывают - для них "low" значит, что мы сами уменьшаем изображение
+LOW_DETAIL_PATCHES = 500
+
+# Тайловые модели: (база, за тайл 512x512); у gpt-4o-mini изображения в токенах ~33 раза дороже
+TILE_COSTS = {
+    "gpt-4o-mini": (2833, 5667),
+}
+DEFAULT_TILE_COST = (85, 170)
+
+
+def estimate_image_tokens(width: int, height: int, model: str, detail: str = "high",
+                          max_patches: Optional[int] = None) -> int:
+    """Оценивает стоимость изображения во входных токенах по правилам OpenAI (после prepare_image).
+
+    max_patches=MAX_PATCHES - стоимость изображения, отправленного без нашей подготовки.
+    """
+    if model in PATCH_MODELS:
+        w, h = fit_size(width, height, model, detail, max_patches)
+        patches = math.ceil(w / PATCH_SIZE) * math.ceil(h / PATCH_SIZE)
+        return math.ceil(min(patches, MAX_PATCHES) * PATCH_MODELS[model])
+    base, per_tile = TILE_COSTS.get(model, DEFAULT_TILE_COST)
+    if detail == "low":
+        return base
+    w, h = fit_size(width, height, model)
+    tiles = math.ceil(w / 512) * math.ceil(h / 512)
+    return base + per_tile * tiles
+
+
+def fit_size(width: int, height: int, model: str, detail: str = "high",
+             max_patches: Optional[int] = None) -> tuple[int, int]:
+    """Размер, до которого уменьшаем изображение перед отправкой.
+
+    Тайловые модели - размер, до которого модель уменьшит изображение сама (больше отправлять бессмысленно).
+    Патчевые - целевое число патчей: IMAGE_MAX_PATCHES, при detail="low" - LOW_DETAIL_PATCHES,
+    либо явно заданное max_patches.
+    """
+    if model in PATCH_MODELS:
+        limit = max_patches or (LOW_DETAIL_PATCHES if detail == "low" else IMAGE_MAX_PATCHES)
+        patches = math.ceil(width / PATCH_SIZE) * math.ceil(height / PATCH_SIZE)
+        if patches <= limit:
+            return width, height
+        scale = math.sqrt(limit * PATCH_SIZE ** 2 / (width * height))
+        # Подгоняем ширину под целое число патчей, чтобы не превысить лимит после округления
+        scaled_patches = width * scale / PATCH_SIZE
+        scale *= math.floor(scaled_patches) / scaled_patches
+        return max(1, int(width * scale)), max(1, int(height * scale))
+
+    # Тайловые модели: вписываем в 2048x2048, затем короткая сторона не больше 768
+    scale = min(1.0, 2048 / max(width, height))
+    short_side = min(width, height) * scale
+    if short_side > 768:
+        scale *= 768 / short_side
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def paper_level(gray: Image.Image) -> int:
+    """Уровень белого бумаги: яркость, светлее которой 5% пикселей (блики и шум не в счёт)"""
+    histogram = gray.histogram()
+    total, seen = sum(histogram), 0
+    for level in range(255, -1, -1):
+        seen += histogram[level]
+        if seen >= total * 0.05:
+            return level
+    return 255
+
+
+def crop_to_page(img: Image.Image) -> Image.Image:
+    """Обрезает фон вокруг страницы (стол, руки); цветные полосы самой страницы - шапку, картинки у края - оставляет.
+
+    Рамка страницы - строки и столбцы, где больше половины пикселей - бумага; затем она расширяется,
+    пока полоса по цвету отличается от фона. Если фон не виден хотя бы с трёх сторон кадра
+    (скан, скриншот, фото вплотную), не обрезаем ничего.
+    """
+    thumb = img.convert("RGB")
+    thumb.thumbnail((256, 256))
+    # Сглаживаем, чтобы мелкий текст не рвал маску страницы
+    thumb = thumb.filter(ImageFilter.MedianFilter(5))
+    gray = thumb.convert("L")
+    threshold = paper_level(gray) * 0.6
+    paper = gray.point(lambda v: 255 if v > threshold else 0)
+    rows = [i for i, v in enumerate(paper.resize((1, paper.height), Image.BOX).getdata()) if v > 127]
+    cols = [i for i, v in enumerate(paper.resize((paper.width, 1), Image.BOX).getdata()) if v > 127]
+    if not rows or not cols:
+        return img
+
+    # Края кадра: фон - там, где бумаги меньше половины
+    w, h = thumb.size
+    edge = max(2, int(min(w, h) * BORDER_SHARE))
+    strips = [(0, 0, w, edge), (0, h - edge, w, h), (0, 0, edge, h), (w - edge, 0, w, h)]
+    background = [box for box in strips if ImageStat.Stat(paper.crop(box)).mean[0] < 128]
+    if len(background) < 3:
+        return img
+    stats = [ImageStat.Stat(thumb.crop(box)) for box in background]
+    background_color = [sum(stat.mean[c] * stat.count[c] for stat in stats) / sum(stat.count[c] for stat in stats)
+                        for c in range(3)]
+
+    def is_background(box):
+        color = ImageStat.Stat(thumb.crop(box)).mean
+        return math.dist(color, background_color) < BACKGROUND_DISTANCE
+
+    left, top, right, bottom = cols[0], rows[0], cols[-1] + 1, rows[-1] + 1
+    while top > 0 and not is_background((left, top - 1, right, top)):
+        top -= 1
+    while bottom < h and not is_background((left, bottom, right, bottom + 1)):
+        bottom += 1
+    while left > 0 and not is_background((left - 1, top, left, bottom)):
+        left -= 1
+    while right < w and not is_background((right, top, right + 1, bottom)):
+        right += 1
+
+    if (right - left) * (bottom - top) < CROP_MIN_AREA * w * h:
+        return img
+
+    sx, sy = img.width / w, img.height / h
+    margin = 4  # немного запаса, чтобы не срезать поля с номерами упражнений
+    return img.crop((
+        max(0, int((left - margin) * sx)),
+        max(0, int((top - margin) * sy)),
+        min(img.width, int((right + margin) * sx)),
+        min(img.height, int((bottom + margin) * sy)),
+    ))
+
+
+def encode_to_budget(img: Image.Image, max_bytes: int) -> bytes:
+    """Кодирует в JPEG, понижая качество, а затем и размер, пока не уложимся в бюджет"""
+    while True:
+        for quality in JPEG_QUALITIES:
+            buf = io.BytesIO()
+            img.save(buf, format="JPEG", quality=quality, optimize=True)
+            if buf.tell() <= max_bytes:
+                return buf.getvalue()
+        if min(img.size) < 512:
+            return buf.getvalue()
+        img = img.resize((int(img.width * 0.85), int(img.height * 0.85)), Image.LANCZOS)
+
+
+def image_size(image_bytes: bytes) -> Optional[tuple[int, int]]:
+    """Размер изображения (читается только заголовок); None, если Pillow его не понимает"""
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def prepare_image(image_bytes: bytes, model: str, detail: str = "high") -> bytes:
+    """Поворачивает по EXIF, обрезает до страницы, уменьшает до целевого числа патчей (тайлов) и сжимает"""
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        img = ImageOps.exif_transpose(img)
+    except Exception as e:
+        logging.warning(f"Не удалось обработать изображение, отправляем как есть: {e}")
+        return image_bytes
+
+    original_size = img.size
+    img = img.convert("RGB")
+    img = crop_to_page(img)
+    target = fit_size(img.width, img.height, model, detail)
+    if target != img.size:
+        img = img.resize(target, Image.LANCZOS)
+
+    result = encode_to_budget(img, IMAGE_MAX_BYTES)
+    logging.info(
+        f"Image prepared: {len(image_bytes)} -> {len(result)} bytes, "
+        f"{original_size[0]}x{original_size[1]} -> {img.width}x{img.height}, "
+        f"~{estimate_image_tokens(*original_size, model, max_patches=MAX_PATCHES)} -> "
+        f"~{estimate_image_tokens(img.width, img.height, model, detail)} image tokens"
+    )
+    return result
@@ -0,0 +1,145 @@
+import io
+import os
+import logging
+from functools import lru_cache
+
+from PIL import Image, ImageFilter, ImageOps, ImageStat
+
+from app.image_prep import crop_to_page
+from app.page_hash import DESKEW_MAX_ANGLE, DESKEW_SIDE, row_profile_score
+
+# Быстрая проверка фото до генерации: резкость, экспозиция, разрешение, ориентация текста.
+# QUALITY_CHECK=0 - отключить; пороги - через переменные окружения
+QUALITY_CHECK = os.getenv("QUALITY_CHECK", "1") != "0"
+MIN_SHARPNESS = float(os.getenv("QUALITY_MIN_SHARPNESS", 100))  # дисперсия лапласиана
+MIN_BRIGHTNESS = float(os.getenv("QUALITY_MIN_BRIGHTNESS", 60))  # средняя яркость страницы, 0..255
+MAX_BRIGHTNESS = float(os.getenv("QUALITY_MAX_BRIGHTNESS", 245))
+MAX_CLIPPED = float(os.getenv("QUALITY_MAX_CLIPPED", 0.15))  # доля страницы, выжженной бликом, см. glare_share
+MIN_SIDE = int(os.getenv("QUALITY_MIN_SIDE", 600))  # короткая сторона фото, px
+MAX_ROTATION_RATIO = float(os.getenv("QUALITY_MAX_ROTATION_RATIO", 1.5))  # столбцы/строки, см. text_direction_ratio
+ANALYSIS_SIDE = 1024  # анализируем уменьшенную копию - порог резкости задан для этого масштаба
+
+GLARE_GRID = 16  # страницу делим на 16x16 клеток
+GLARE_LEVEL = 248  # клетка ярче этого целиком - выжжена
+INK_LEVEL = 100  # темнее - текст или рисунок, рядом с ним видно, какого цвета бумага
+
+EXIF_ORIENTATION = 0x0112
+LAPLACIAN = ImageFilter.Kernel((3, 3), [0, 1, 0, 1, -4, 1, 0, 1, 0], scale=1, offset=128)
+
+
+def sharpness(gray: Image.Image) -> float:
+    """Дисперсия лапласиана: у размытого фото мало резких перепадов яркости"""
+    return ImageStat.Stat(gray.filter(LAPLACIAN)).var[0]
+
+
+def quantile(histogram: list[int], share: float) -> int:
+    """Яркость, темнее которой доля share пикселей"""
+    limit, seen = sum(histogram) * share, 0
+    for level, count in enumerate(histogram):
+        seen += count
+        if seen >= limit:
+            return level
+    return 255
+
+
+def glare_share(gray: Image.Image) -> float:
+    """Доля страницы, выжженной бликом: клетки, целиком белее бумаги вокруг текста.
+
+    Сама белая бумага не в счёт: у скана и скриншота она и так 255 - тогда бликов не ищем.
+    На фото бумага рядом с текстом темнее, а блик стирает текст до сплошного белого.
+    """
+    paper, cells = [], []
+    cell_w, cell_h = gray.width / GLARE_GRID, gray.height / GLARE_GRID
+    for row in range(GLARE_GRID):
+        for col in range(GLARE_GRID):
+            box = (int(col * cell_w), int(row * cell_h), int((col + 1) * cell_w), int((row + 1) * cell_h))
+            histogram = gray.crop(box).histogram()
+            if not sum(histogram):
+                continue
+            darkest = quantile(histogram, 0.1)
+            cells.append(darkest)
+            if darkest < INK_LEVEL:
+                paper.append(quantile(histogram, 0.9))
+    if not paper:
+        return 0.0
+    paper.sort()
+    if paper[len(paper) // 2] >= GLARE_LEVEL:
+        return 0.0
+    return sum(1 for darkest in cells if darkest >= GLARE_LEVEL) / len(cells)
+
+
+def text_direction_ratio(gray: Image.Image) -> float:
+    """Насколько профиль столбцов полосатее профиля строк (см. page_hash.row_profile_score).
+
+    Строки текста дают полосатый профиль по вертикали: средние яркости строк пикселей сильно
+    различаются, столбцов - почти нет. У повёрнутой на 90° страницы наоборот, и отношение > 1.
+    Считается по середине страницы - поля, фон и крупные блоки вёрстки на результат почти не влияют.
+    Лучший угол в пределах DESKEW_MAX_ANGLE - на уменьшенной копии, как при выравнивании в page_hash.
+    """
+    thumb = gray.copy()
+    thumb.thumbnail((DESKEW_SIDE, DESKEW_SIDE))
+
+    def best_score(img):
+        # Фото обычно чуть наклонено - наклон размывает полосы, поэтому берём лучший угол
+        return max(row_profile_score(img, angle) for angle in range(-DESKEW_MAX_ANGLE, DESKEW_MAX_ANGLE + 1))
+
+    rows = best_score(thumb)
+    cols = best_score(thumb.transpose(Image.Transpose.ROTATE_90))
+    return cols / max(rows, 1e-6)
+
+
+def assess(image_bytes: bytes) -> dict:
+    """Метрики фото и найденные проблемы: {"ok", "problems", "metrics"}"""
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        # Размер с учётом поворота по EXIF - без декодирования пикселей
+        original = img.size[::-1] if img.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8) else img.size
+        # JPEG декодируется сразу в уменьшенном виде - это основная экономия времени
+        img.draft("L", (ANALYSIS_SIDE, ANALYSIS_SIDE))
+        img = ImageOps.exif_transpose(img).convert("L")
+    except Exception as e:
+        logging.warning(f"Quality check: не удалось открыть изображение: {e}")
+        return {"ok": False, "problems": ["не удалось открыть изображение"], "metrics": {}}
+
+    img.thumbnail((ANALYSIS_SIDE, ANALYSIS_SIDE))
+    page = crop_to_page(img)
+    metrics = {
+        "size": original,
+        "sharpness": round(sharpness(page), 1),
+        "brightness": round(ImageStat.Stat(page).mean[0], 1),
+        "clipped": round(glare_share(page), 3),
+        "rotation_ratio": round(text_direction_ratio(page), 2),
+    }
+
+    problems = []
+    if min(original) < MIN_SIDE:
+        problems.append(f"слишком маленькое разрешение ({original[0]}×{original[1]}) - сфотографируйте ближе")
+    if metrics["sharpness"] < MIN_SHARPNESS:
+        problems.append("фото размыто - текст на странице может не читаться")
+    if metrics["brightness"] < MIN_BRIGHTNESS:
+        problems.append("фото слишком тёмное")
+    elif metrics["brightness"] > MAX_BRIGHTNESS or metrics["clipped"] > MAX_CLIPPED:
+        problems.append("фото пересвечено - часть страницы может быть не видна")
+    if metrics["rotation_ratio"] > MAX_ROTATION_RATIO:
+        problems.append("страница, похоже, повёрнута набок - поверните фото")
+    return {"ok": not problems, "problems": problems, "metrics": metrics}
+
+
+@lru_cache(maxsize=256)
+def check_photo(path: str) -> dict:
+    """Проверка загруженного файла (результат кэшируется по пути - Gradio даёт каждой загрузке свой)"""
+    with open(path, "rb") as f:
+        result = assess(f.read())
+    logging.info(f"Quality check {os.path.basename(path)}: {result['metrics']} {result['problems'] or 'ok'}")
+    return result
+
+
+def quality_report(paths: list[str]) -> list[str]:
+    """Проблемы всех страниц одним списком (с номером страницы, если их несколько)"""
+    if not QUALITY_CHECK:
+        return []
+    report = []
+    for n, path in enumerate(paths, start=1):
+        for problem in check_photo(path)["problems"]:
+            report.append(f"Страница {n}: {problem}" if len(paths) > 1 else problem)
+    return report
@@ -0,0 +1,100 @@
+import os
+import time
+import uuid
+import base64
+import logging
+import tempfile
+
+import gradio as gr
+
+from app import http_client
+
+# Способ передачи страницы в модель (IMAGE_TRANSPORT):
+#   data_url - base64 прямо в запросе (по умолчанию, без лишних сетевых хопов)
+#   local    - короткоживущий файл, отдаваемый самим Gradio-приложением (нужен PUBLIC_URL)
+#   catbox   - загрузка на catbox.moe (используется и как запасной вариант)
+IMAGE_TRANSPORT = os.getenv("IMAGE_TRANSPORT", "data_url")
+PUBLIC_URL = os.getenv("PUBLIC_URL", "").rstrip("/")  # напр. https://user-space.hf.space
+SERVE_DIR = os.path.join(tempfile.gettempdir(), "lesson_plan_pages")
+SERVE_TTL = 10 * 60  # файлы для local живут 10 минут
+DATA_URL_MAX_BYTES = 20 * 1024 * 1024  # лимит API на одно изображение
+
+os.makedirs(SERVE_DIR, exist_ok=True)
+
+
+def guess_mime(image_bytes: bytes) -> str:
+    """Определяет MIME-тип изображения по сигнатуре"""
+    if image_bytes.startswith(b"\x89PNG"):
+        return "image/png"
+    if image_bytes.startswith(b"GIF8"):
+        return "image/gif"
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+def to_data_url(image_bytes: bytes) -> str:
+    """Кодирует изображение в data URL"""
+    if len(image_bytes) > DATA_URL_MAX_BYTES:
+        raise ValueError(f"изображение больше {DATA_URL_MAX_BYTES} байт")
+    encoded = base64.b64encode(image_bytes).decode("ascii")
+    return f"data:{guess_mime(image_bytes)};base64,{encoded}"
+
+
+def serve_locally(image_bytes: bytes) -> str:
+    """Сохраняет изображение во временную папку, которую раздаёт Gradio, и возвращает публичный URL"""
+    if not PUBLIC_URL:
+        raise ValueError("PUBLIC_URL не задан")
+    cleanup_served()
+    ext = guess_mime(image_bytes).split("/")[1]
+    path = os.path.join(SERVE_DIR, f"{uuid.uuid4().hex}.{ext}")
+    with open(path, "wb") as f:
+        f.write(image_bytes)
+    return f"{PUBLIC_URL}/gradio_api/file={path}"
+
+
+def cleanup_served() -> None:
+    """Удаляет отданные модели файлы старше SERVE_TTL"""
+    now = time.time()
+    for entry in os.scandir(SERVE_DIR):
+        try:
+            if now - entry.stat().st_mtime > SERVE_TTL:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def upload_to_catbox(file_bytes: bytes) -> str:
+    """Загружает файл на catbox.moe и возвращает URL"""
+    try:
+        response = http_client.post(
+            "https://catbox.moe/user/api.php",
+            files={"fileToUpload": file_bytes},
+            data={"reqtype": "fileupload"}
+        )
+        response.raise_for_status()
+        return response.text.strip()
+    except Exception as e:
+        logging.error(f"Ошибка загрузки изображения: {e}")
+        raise gr.Error("Не удалось загрузить изображение")
+
+
+TRANSPORTS = {
+    "data_url": to_data_url,
+    "local": serve_locally,
+    "catbox": upload_to_catbox,
+}
+
+
+def image_to_url(image_bytes: bytes) -> str:
+    """Возвращает URL изображения для input_image выбранным способом; при ошибке - через catbox"""
+    transport = TRANSPORTS.get(IMAGE_TRANSPORT)
+    if transport is None:
+        logging.warning(f"Неизвестный IMAGE_TRANSPORT={IMAGE_TRANSPORT}, используется catbox")
+        transport = upload_to_catbox
+    if transport is not upload_to_catbox:
+        try:
+            return transport(image_bytes)
+        except Exception as e:
+            logging.warning(f"Image transport {IMAGE_TRANSPORT} failed, falling back to catbox: {e}")
+    return upload_to_catbox(image_bytes)
@@ -0,0 +1,108 @@
+"""Сборка индекса базы знаний на диск.
+
+Запуск: python -m app.kb_indexer [--full]
+Индекс пишется в KB_INDEX_DIR (см. app/retrieval.py) и при старте приложения
+читается через mmap. Пересобираются только файлы, чей хэш изменился; --full - всё заново.
+"""
+import os
+import sys
+import json
+import time
+import logging
+from array import array
+
+from app.retrieval import (
+    INDEX_VERSION, KB_DIR, KB_INDEX_DIR, LENGTHS_FILE, LEXICON_FILE, MANIFEST_FILE, POSTINGS_FILE, TEXTS_FILE,
+    chunk_document, file_hash, kb_files, read_file,
+)
+
+
+def load_manifest(index_dir: str) -> dict:
+    try:
+        with open(os.path.join(index_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest.get("files", {}) if manifest.get("version") == INDEX_VERSION else {}
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    # Работающее приложение держит старый файл через mmap - подменяем файл целиком, а не переписываем
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def update_files(kb_dir: str, previous: dict, full: bool = False) -> tuple[dict, dict]:
+    """Фрагменты по файлам: неизменённые берём из манифеста, остальные разбираем заново"""
+    files, stats = {}, {"reused": 0, "indexed": 0}
+    for source in kb_files(kb_dir):
+        digest = file_hash(os.path.join(kb_dir, source))
+        entry = previous.get(source)
+        if not full and entry and entry["hash"] == digest:
+            files[source] = entry
+            stats["reused"] += 1
+            continue
+        chunks = [chunk for name, text in read_file(source, kb_dir) for chunk in chunk_document(name, text)]
+        files[source] = {"hash": digest, "chunks": chunks}
+        stats["indexed"] += 1
+    stats["removed"] = len(set(previous) - set(files))
+    return files, stats
+
+
+def compile_index(files: dict, index_dir: str) -> dict:
+    """Пишет списки вхождений, длины и тексты фрагментов в плоские файлы, словарь - в lexicon.json"""
+    chunks = [chunk for source in sorted(files) for chunk in files[source]["chunks"]]
+    postings = {}
+    texts = bytearray()
+    meta = []
+    lengths = array("I")
+    for i, chunk in enumerate(chunks):
+        for token, tf in chunk["terms"].items():
+            postings.setdefault(token, []).append((i, tf))
+        text = chunk["text"].encode("utf-8")
+        meta.append([chunk["source"], chunk["methodologies"], len(texts), len(text)])
+        texts += text
+        lengths.append(sum(chunk["terms"].values()))
+
+    flat = array("I")
+    terms = {}
+    for token in sorted(postings):
+        terms[token] = [len(flat) // 2, len(postings[token])]
+        for i, tf in postings[token]:
+            flat.extend((i, tf))
+
+    os.makedirs(index_dir, exist_ok=True)
+    write_atomic(os.path.join(index_dir, POSTINGS_FILE), flat.tobytes())
+    write_atomic(os.path.join(index_dir, LENGTHS_FILE), lengths.tobytes())
+    write_atomic(os.path.join(index_dir, TEXTS_FILE), bytes(texts))
+    lexicon = {
+        "version": INDEX_VERSION,
+        "byteorder": sys.byteorder,
+        "files": {source: entry["hash"] for source, entry in files.items()},
+        "avg_length": sum(lengths) / len(lengths) if lengths else 0.0,
+        "terms": terms,
+        "chunks": meta,
+    }
+    # lexicon.json - последним: по нему приложение определяет, что индекс собран
+    write_atomic(os.path.join(index_dir, LEXICON_FILE), json.dumps(lexicon, ensure_ascii=False).encode("utf-8"))
+    return {"chunks": len(chunks), "terms": len(terms), "bytes": flat.itemsize * len(flat) + len(texts)}
+
+
+def build(kb_dir: str = KB_DIR, index_dir: str = KB_INDEX_DIR, full: bool = False) -> None:
+    started = time.perf_counter()
+    files, stats = update_files(kb_dir, load_manifest(index_dir), full)
+    summary = compile_index(files, index_dir)
+    manifest = {"version": INDEX_VERSION, "files": files}
+    write_atomic(os.path.join(index_dir, MANIFEST_FILE), json.dumps(manifest, ensure_ascii=False).encode("utf-8"))
+    logging.info(
+        f"KB index {index_dir}: {stats['indexed']} files indexed, {stats['reused']} unchanged, "
+        f"{stats['removed']} removed; {summary['chunks']} chunks, {summary['terms']} terms, "
+        f"{summary['bytes'] / 1024:.0f} KB mapped; {time.perf_counter() - started:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    build(full="--full" in sys.argv[1:])
@@ -1,79 +1,155 @@
-# Список учебников для автоподстановки (серия + уровень)
-TEXTBOOKS = [
-    # Spotlight
-    "Spotlight Starter", "Spotlight 2", "Spotlight 3", "Spotlight 4",
-    "Spotlight 5", "Spotlight 6", "Spotlight 7", "Spotlight 8",
-    "Spotlight 9", "Spotlight 10", "Spotlight 11",
-
-    # English File
-    "English File Beginner", "English File Elementary", "English File Pre-Intermediate",
-    "English File Intermediate", "English File Upper-Intermediate", "English File Advanced",
-
-    # Headway
-    "Headway Beginner", "Headway Elementary", "Headway Pre-Intermediate",
-    "Headway Intermediate", "Headway Upper-Intermediate", "Headway Advanced",
-
-    # Solutions
-    "Solutions Elementary", "Solutions Pre-Intermediate", "Solutions Intermediate",
-    "Solutions Upper-Intermediate", "Solutions Advanced",
-
-    # Grammar in Use
-    "Basic Grammar in Use", "English Grammar in Use", "Advanced Grammar in Use",
-
-    # Starlight
-    "Starlight 2", "Starlight 3", "Starlight 4", "Starlight 5",
-    "Starlight 6", "Starlight 7", "Starlight 8", "Starlight 9",
-    "Starlight 10", "Starlight 11",
-
-    # Другие популярные
-    "Family and Friends Starter", "Family and Friends 1", "Family and Friends 2",
-    "Family and Friends 3", "Family and Friends 4", "Family and Friends 5",
-    "Family and Friends 6",
-    "Cutting Edge Starter", "Cutting Edge Elementary", "Cutting Edge Pre-Intermediate",
-    "Cutting Edge Intermediate", "Cutting Edge Upper-Intermediate", "Cutting Edge Advanced",
-    "Round-Up Starter", "Round-Up 1", "Round-Up 2", "Round-Up 3",
-    "Round-Up 4", "Round-Up 5", "Round-Up 6",
-
-    # Для взрослых (General English)
-    "Global Beginner", "Global Elementary", "Global Pre-Intermediate",
-    "Global Intermediate", "Global Upper-Intermediate", "Global Advanced",
-
-    "New English File Beginner", "New English File Elementary", "New English File Pre-Intermediate",
-    "New English File Intermediate", "New English File Upper-Intermediate", "New English File Advanced",
-
-    "Navigate A1", "Navigate A2", "Navigate B1", "Navigate B1+", "Navigate B2", "Navigate C1",
+import re
+from bisect import bisect_left
+from typing import Optional
+
+# Каталог учебников: серия, уровень, диапазон CEFR, возраст, издательство.
+# Уровень CEFR и возраст - ориентировочные, по описаниям издательств; "" - не знаем точно,
+# тогда модель определяет сама.
+GENERAL_LEVELS = ["Beginner", "Elementary", "Pre-Intermediate", "Intermediate", "Upper-Intermediate", "Advanced"]
+GENERAL_CEFR = {
+    "Starter": "A1", "Beginner": "A1", "Elementary": "A1–A2", "Pre-Intermediate": "A2–B1",
+    "Intermediate": "B1", "Upper-Intermediate": "B2", "Advanced": "C1",
+}
+OUP = "Oxford University Press"
+CUP = "Cambridge University Press"
+EXPRESS = "Express Publishing / Просвещение"
+
+
+def general(levels: list[str], age: str) -> list[tuple]:
+    """Уровни взрослой/подростковой линейки: Beginner ... Advanced"""
+    return [(level, GENERAL_CEFR[level], age) for level in levels]
+
+
+# levels: (уровень, CEFR, возраст); title - как складывается название, если не "серия уровень"
+SERIES = [
+    {"series": "Spotlight", "publisher": EXPRESS, "levels": [
+        ("Starter", "A1", "6-7"), ("2", "A1", "7-8"), ("3", "A1", "8-9"), ("4", "A1", "9-10"),
+        ("5", "A1–A2", "10-11"), ("6", "A2", "11-12"), ("7", "A2", "12-13"), ("8", "A2–B1", "13-14"),
+        ("9", "B1", "14-15"), ("10", "B1–B2", "15-16"), ("11", "B1–B2", "16-17"),
+    ]},
+    {"series": "English File", "publisher": OUP, "levels": general(GENERAL_LEVELS, "18+")},
+    {"series": "Headway", "publisher": OUP, "levels": general(GENERAL_LEVELS, "18+")},
+    {"series": "Solutions", "publisher": OUP, "levels": general(GENERAL_LEVELS[1:], "14-17")},
+    {"series": "Grammar in Use", "title": "{level} Grammar in Use", "publisher": CUP, "levels": [
+        ("Basic", "A1–B1", "14+"), ("English", "B1–B2", "14+"), ("Advanced", "C1–C2", "16+"),
+    ]},
+    {"series": "Starlight", "publisher": EXPRESS, "levels": [
+        ("2", "A1", "7-8"), ("3", "A1", "8-9"), ("4", "A1–A2", "9-10"), ("5", "A2", "10-11"),
+        ("6", "A2", "11-12"), ("7", "A2–B1", "12-13"), ("8", "B1", "13-14"), ("9", "B1", "14-15"),
+        ("10", "B1–B2", "15-16"), ("11", "B2", "16-17"),
+    ]},
+    {"series": "Family and Friends", "publisher": OUP, "levels": [
+        ("Starter", "Pre-A1", "5-6"), ("1", "Pre-A1", "6-7"), ("2", "A1", "7-8"), ("3", "A1", "8-9"),
+        ("4", "A1–A2", "9-10"), ("5", "A2", "10-11"), ("6", "A2–B1", "11-12"),
+    ]},
+    {"series": "Cutting Edge", "publisher": "Pearson", "levels": general(["Starter"] + GENERAL_LEVELS[1:], "16+")},
+    {"series": "Round-Up", "publisher": "Pearson", "levels": [
+        ("Starter", "Pre-A1", "6-8"), ("1", "A1", "8-9"), ("2", "A1", "9-10"), ("3", "A2", "10-11"),
+        ("4", "A2–B1", "11-13"), ("5", "B1", "12-14"), ("6", "B1–B2", "13-15"),
+    ]},
+    {"series": "Global", "publisher": "Macmillan", "levels": general(GENERAL_LEVELS, "18+")},
+    {"series": "New English File", "publisher": OUP, "levels": general(GENERAL_LEVELS, "18+")},
+    {"series": "Navigate", "publisher": OUP, "levels": [
+        ("A1", "A1", "18+"), ("A2", "A2", "18+"), ("B1", "B1", "18+"), ("B1+", "B1–B2", "18+"),
+        ("B2", "B2", "18+"), ("C1", "C1", "18+"),
+    ]},
+    {"series": "Innovations", "publisher": "National Geographic Learning", "levels": general(GENERAL_LEVELS, "18+")},
+    {"series": "Speakout", "publisher": "Pearson", "levels": general(["Starter"] + GENERAL_LEVELS[1:], "18+")},
+    {"series": "Market Leader", "publisher": "Pearson", "levels": general(GENERAL_LEVELS, "18+")},
+    {"series": "Business Result", "publisher": OUP, "levels": general(["Starter"] + GENERAL_LEVELS[1:], "18+")},
+    {"series": "Complete IELTS", "publisher": CUP, "levels": [
+        ("Bands 4-5", "B1", "16+"), ("Bands 5-6.5", "B2", "16+"), ("Bands 6.5-7.5", "C1", "16+"),
+    ]},
+    {"series": "Objective", "publisher": CUP, "levels": [
+        ("First", "B2", "16+"), ("Advanced", "C1", "16+"), ("Proficiency", "C2", "16+"),
+    ]},
+    {"series": "Ready for", "publisher": "Macmillan", "levels": [
+        ("IELTS", "B1–C1", "16+"), ("Advanced", "C1", "16+"), ("Proficiency", "C2", "16+"),
+    ]},
+    {"series": "Vocabulary in Use", "title": "{level} Vocabulary in Use", "publisher": CUP, "levels": [
+        ("Academic", "B2–C1", "16+"),
+    ]},
+    {"series": "Grammar for Academic Purposes", "title": "{series}", "publisher": "", "levels": [("", "", "18+")]},
+    {"series": "Oxford EAP", "publisher": OUP, "levels": general(GENERAL_LEVELS, "18+")},
+    # Специализированные - уровень у разных изданий разный, оставляем модели
+    *[
+        {"series": name, "title": "{series}", "publisher": "", "levels": [("", "", "18+")]}
+        for name in ("English for Medicine", "English for IT", "English for Engineers",
+                     "Legal English", "Financial English", "English for Tourism")
+    ],
+    {"series": "Academy Stars", "publisher": "Macmillan", "levels": [
+        ("Starter", "Pre-A1", "5-6"), ("1", "Pre-A1", "6-7"), ("2", "A1", "7-8"), ("3", "A1", "8-9"),
+        ("4", "A1–A2", "9-10"), ("5", "A2", "10-11"), ("6", "A2–B1", "11-12"),
+    ]},
+    {"series": "Guess What!", "publisher": CUP, "levels": [
+        ("1", "Pre-A1", "6-7"), ("2", "Pre-A1", "7-8"), ("3", "A1", "8-9"), ("4", "A1–A2", "9-10"),
+    ]},
+]
+
+# Плоский каталог: одна запись на учебник (серия + уровень)
+CATALOGUE = [
+    {
+        "title": series.get("title", "{series} {level}").format(series=series["series"], level=level),
+        "series": series["series"],
+        "level": level,
+        "cefr": cefr,
+        "age": age,
+        "publisher": series["publisher"],
+    }
+    for series in SERIES
+    for level, cefr, age in series["levels"]
+]
 
-    "Innovations Beginner", "Innovations Elementary", "Innovations Pre-Intermediate",
-    "Innovations Intermediate", "Innovations Upper-Intermediate", "Innovations Advanced",
-
-    "Speakout Starter", "Speakout Elementary", "Speakout Pre-Intermediate",
-    "Speakout Intermediate", "Speakout Upper-Intermediate", "Speakout Advanced",
-
-    # Бизнес-английский
-    "Market Leader Beginner", "Market Leader Elementary", "Market Leader Pre-Intermediate",
-    "Market Leader Intermediate", "Market Leader Upper-Intermediate", "Market Leader Advanced",
-
-    "Business Result Starter", "Business Result Elementary", "Business Result Pre-Intermediate",
-    "Business Result Intermediate", "Business Result Upper-Intermediate", "Business Result Advanced",
-
-    # Экзаменационные курсы
-    "Complete IELTS Bands 4-5", "Complete IELTS Bands 5-6.5", "Complete IELTS Bands 6.5-7.5",
-    "Objective First", "Objective Advanced", "Objective Proficiency",
-    "Ready for IELTS", "Ready for Advanced", "Ready for Proficiency",
-
-    # Для академических целей
-    "Academic Vocabulary in Use", "Grammar for Academic Purposes",
-    "Oxford EAP Beginner", "Oxford EAP Elementary", "Oxford EAP Pre-Intermediate",
-    "Oxford EAP Intermediate", "Oxford EAP Upper-Intermediate", "Oxford EAP Advanced",
-
-    # Специализированные
-    "English for Medicine", "English for IT", "English for Engineers",
-    "Legal English", "Financial English", "English for Tourism",
-
-    # Детские курсы (добавлено для полноты)
-    "Academy Stars Starter", "Academy Stars 1", "Academy Stars 2",
-    "Academy Stars 3", "Academy Stars 4", "Academy Stars 5", "Academy Stars 6",
-
-    "Guess What! 1", "Guess What! 2", "Guess What! 3", "Guess What! 4",
-
-]
\ No newline at end of file
+# Список учебников для автоподстановки (серия + уровень)
+TEXTBOOKS = [entry["title"] for entry in CATALOGUE]
+
+NON_WORD = re.compile(r"[^a-zа-я0-9+.]+")
+
+
+def normalize_title(name: str) -> str:
+    """Ключ для поиска: нижний регистр, без пунктуации ("Guess What! 2" -> "guess what 2")"""
+    return NON_WORD.sub(" ", str(name or "").lower().replace("ё", "е")).strip()
+
+
+# Индексы: хэш по нормализованному названию и отсортированные ключи для поиска по префиксу
+BY_TITLE = {normalize_title(entry["title"]): entry for entry in CATALOGUE}
+SORTED_TITLES = sorted(BY_TITLE)
+
+
+def find_textbook(name: str) -> Optional[dict]:
+    """Запись каталога по названию, которое ввёл учитель; None, если учебник не узнали.
+
+    Порядок: точное совпадение -> недописанное название, если оно однозначно ("english file int")
+    -> самое длинное известное название в начале строки ("Spotlight 5, модуль 3").
+    """
+    key = normalize_title(name)
+    if not key:
+        return None
+    entry = BY_TITLE.get(key)
+    if entry:
+        return entry
+
+    start = bisect_left(SORTED_TITLES, key)
+    matches = []
+    for title in SORTED_TITLES[start:start + 2]:
+        if title.startswith(key):
+            matches.append(title)
+    if len(matches) == 1:
+        return BY_TITLE[matches[0]]
+
+    words = key.split(" ")
+    for n in range(len(words) - 1, 0, -1):
+        entry = BY_TITLE.get(" ".join(words[:n]))
+        if entry:
+            return entry
+    return None
+
+
+def describe_textbook(entry: dict) -> str:
+    """Справка каталога одной строкой: "Spotlight 5 (Express Publishing / Просвещение), CEFR A1–A2, возраст 10-11" """
+    parts = [f"{entry['title']} ({entry['publisher']})" if entry["publisher"] else entry["title"]]
+    if entry["cefr"]:
+        parts.append(f"CEFR {entry['cefr']}")
+    if entry["age"]:
+        parts.append(f"возраст {entry['age']}")
+    return ", ".join(parts)
@@ -1,71 +1,65 @@
 import os
+import asyncio
 import logging
-import tempfile
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI
 import gradio as gr
-from docx import Document
-import requests
-from typing import Optional
+from typing import AsyncIterator, Optional
 
 import random
 from app.quotes import quotes
 from app.drawings import drawings
-from app.knowledge_base.textbooks import TEXTBOOKS
+from app.textbook_search import suggest_textbooks
+from app.knowledge_base.textbooks import describe_textbook, find_textbook
+from app.cache import make_key, normalize_params, plan_cache
+from app.image_transport import SERVE_DIR, image_to_url
+from app.image_prep import PATCH_MODELS, estimate_image_tokens, image_size, prepare_image
+from app.image_quality import quality_report
+from app import ocr
+from app.tokens import BUDGET_STRICT, fit_to_budget, log_usage
+from app.routing import choose_route, record as record_route
+from app.retrieval import get_index, retrieve_context
+from app.few_shot import few_shot_blocks
+from app.page_analysis import PAGE_ANALYSIS, describe_page, find_analysis, note_use, schedule_analysis
+from app.plan_sections import regenerate_section, section_labels, split_sections, stage_count
+from app.prompt_builder.prompt import build_params_block
+from app.queue_stats import GenerationLoad
+from app import export, feedback
 # --- Настройка ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 load_dotenv()
 api_key = os.getenv("API_KEY_openai")
-client = OpenAI(api_key=api_key) if api_key else None
+client = AsyncOpenAI(api_key=api_key) if api_key else None
 VS_ID = os.getenv("VECTOR_STORE_ID", "")  # vector store for file_search if needed
 
 # --- Утилиты ---
-def upload_to_catbox(file_bytes: bytes) -> str:
-    """Загружает файл на catbox.moe и возвращает URL"""
-    try:
-        response = requests.post(
-            "https://catbox.moe/user/api.php",
-            files={"fileToUpload": file_bytes},
-            data={"reqtype": "fileupload"},
-            timeout=10
-        )
-        response.raise_for_status()
-        return response.text.strip()
-    except Exception as e:
-        logging.error(f"Ошибка загрузки изображения: {e}")
-        raise gr.Error("Не удалось загрузить изображение")
+# .docx собирается в памяти, старые экспорты убирает фоновый поток
+export.start_janitor()
 
+# Индекс базы знаний - при старте (готовый с диска через mmap, если собран app.kb_indexer)
+get_index()
 
-def generate_docx(text: str) -> str:
-    """Сохраняет текст в .docx и возвращает путь"""
-    doc = Document()
-    for line in text.split("\n"):
-        doc.add_paragraph(line)
-    tmp = tempfile.gettempdir()
-    path = os.path.join(tmp, f"lesson_plan_{datetime.now().strftime('%Y%m%d%H%M%S')}.docx")
-    doc.save(path)
-    return path
+## Отзывы копятся в локальном спуле и досылаются в google-таблицу в фоне
+feedback.start_flusher()
 
-# названия textbooks для автозаполнения поля Учебник
-import json
+### ОСНОВНАЯ ФУНКЦИЯ ГЕНЕРАЦИИ
+# Потоковый режим: план появляется в поле вывода по мере генерации (STREAM_GENERATION=0 - отключить)
+STREAM_GENERATION = os.getenv("STREAM_GENERATION", "1") != "0"
+STREAM_UPDATE_INTERVAL = 0.15  # не чаще, чем раз в N секунд обновляем Markdown
 
-## Сохраняем отзыв через POST в google-таблицу
-GOOGLE_SHEET_URL = os.getenv("FEEDBACK_GS_URL")
+# Очередь: генерация ограничена отдельно от лёгких UI-событий
+GENERATION_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", 8))  # одновременных генераций
+QUEUE_MAX_SIZE = int(os.getenv("QUEUE_MAX_SIZE", 50))  # сверх этого - сразу отказ
+generation_load = GenerationLoad(GENERATION_CONCURRENCY, QUEUE_MAX_SIZE)
 
-def save_feedback(comment, rate):
-    payload = {
-        "comment": comment,
-        "rate": rate
-    }
-    try:
-        requests.post(GOOGLE_SHEET_URL, json=payload, timeout=3)
-    except Exception as e:
-        print(f"Ошибка при отправке отзыва: {e}")
+# Несколько страниц (разворот): обработка изображений - в общем пуле потоков
+MAX_EXTRA_PAGES = 2
+IMAGE_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("IMAGE_WORKERS", 4)), thread_name_prefix="image")
 
-### ОСНОВНАЯ ФУНКЦИЯ ГЕНЕРАЦИИ
-def generate_lesson_plan(
-        image_path: Optional[str],
+
+def collect_params(
         textbook: str,
         cefr: str,
         topic: str,
@@ -86,25 +80,9 @@ def generate_lesson_plan(
         # application: bool,
         # analysis: bool,
         # creativity: bool
-) -> str:
-
-    # Валидация API клиента
-    if not client:
-        raise gr.Error("API ключ не настроен")
-    # Проверка наличия изображения
-    if not image_path:
-        return "❗ Загрузите фото страницы учебника для генерации урока"
-
-    # Загружаем изображение и получаем URL
-    try:
-        with open(image_path, "rb") as f:
-            image_url = upload_to_catbox(f.read())
-    except Exception as e:
-        logging.error(f"Image upload error: {e}")
-        raise gr.Error("Не удалось загрузить изображение")
-
-    # Собираем текстовый prompt
-    lesson_params = {
+) -> dict:
+    """Собирает параметры урока для промпта"""
+    return fill_from_catalogue({
         'methodology': methodology,
         'target_language': target_language, # для PPP
         'textbook': textbook,
@@ -118,24 +96,59 @@ def generate_lesson_plan(
         'inventory': inventory,
         'hw_required': hw_required,
         'extra_info': extra_info
-    }
+    })
+
+
+def fill_from_catalogue(lesson_params: dict) -> dict:
+    """Если учебник есть в каталоге - добавляет справку о нём отдельной строкой и подставляет уровень CEFR,
+    не заполненный учителем. Название учебника остаётся как ввёл учитель (в нём бывают модуль, страница, Workbook).
+    """
+    entry = find_textbook(lesson_params['textbook'])
+    if entry is None:
+        return lesson_params
+    lesson_params['textbook_info'] = describe_textbook(entry)
+    filled = []
+    if not str(lesson_params['cefr'] or '').strip() and entry['cefr']:
+        lesson_params['cefr'] = entry['cefr']
+        filled.append('cefr')
+    logging.info(f"Textbook recognised: {entry['title']}; filled from catalogue: {', '.join(filled) or 'nothing'}")
+    return lesson_params
+
+
+def read_image(image_path: str) -> bytes:
+    """Читает загруженное фото страницы"""
+    try:
+        with open(image_path, "rb") as f:
+            return f.read()
+    except OSError as e:
+        logging.error(f"Image read error: {e}")
+        raise gr.Error("Не удалось загрузить изображение")
 
-    # Получаем готовый промпт
-    from app.prompt_builder.prompt import build_prompt
-    full_prompt = build_prompt(lesson_params)
 
+def encode_image(image_bytes: bytes, model: str, detail: str = "high") -> tuple[str, Optional[tuple[int, int]]]:
+    """Сжимает фото под сетку модели; возвращает URL для input_image и итоговый размер"""
+    prepared = prepare_image(image_bytes, model, detail)
+    return image_to_url(prepared), image_size(prepared)
+
+
+def build_request(prompt: str, image_urls: list[str], web_search: bool, route: dict, detail: str = "high") -> dict:
+    """Готовит аргументы для client.responses.create (без stream); без image_urls - только текст"""
     # Собираем входные данные согласно API
     input_content = [
         {
             "type": "input_text",
-            "text": full_prompt
-        },
-        {
-            "type": "input_image",
-            "image_url": image_url,
-            "detail": "high"
+            "text": prompt
         }
     ]
+    if len(image_urls) > 1:
+        input_content.append({"type": "input_text", "text": f"Страницы учебника по порядку ({len(image_urls)} шт.):"})
+    # Страницы - в порядке загрузки
+    for image_url in image_urls:
+        input_content.append({
+            "type": "input_image",
+            "image_url": image_url,
+            "detail": detail
+        })
 
     # Опции инструментов
     tools = []
@@ -148,23 +161,290 @@ def generate_lesson_plan(
         })
         tool_choice = {"type": "web_search_preview"}
 
-    # Вызов LLM
+    request = dict(
+        input=[{"role": "user", "content": input_content}],
+        model=route["model"], #  gpt-4o-mini    gpt-4.1 - см. app/routing.py
+        tools=tools or None,
+        tool_choice=tool_choice,
+        max_output_tokens=8192,
+    )
+    # reasoning поддерживают только reasoning-модели (o-серия)
+    if route.get("effort"):
+        request["reasoning"] = {"effort": route["effort"]}
+    return request
+
+
+def plan_cache_key(page_keys: list[str], lesson_params: dict, prompt: str, web_search: bool, route: dict) -> str:
+    """Ключ кэша: хэши страниц по порядку + нормализованные параметры + промпт + модель"""
+    return make_key(
+        page_keys,
+        normalize_params(lesson_params),
+        prompt,
+        {"model": route["model"], "effort": route.get("effort"), "web_search": bool(web_search)},
+    )
+
+
+async def read_pages(image_paths: list[str]) -> list[dict]:
+    """Читает страницы параллельно; повторно загруженные (тот же хэш) отбрасывает, порядок сохраняет"""
+    loop = asyncio.get_running_loop()
+    contents = await asyncio.gather(*(loop.run_in_executor(IMAGE_POOL, read_image, path) for path in image_paths))
+    pages = {}
+    for image_bytes in contents:
+        pages.setdefault(make_key(image_bytes), image_bytes)
+    if len(pages) < len(contents):
+        logging.info(f"Skipped {len(contents) - len(pages)} duplicate page(s)")
+    return [{"key": key, "bytes": image_bytes} for key, image_bytes in pages.items()]
+
+
+async def prepare_generation(image_paths: list[str], regenerate: bool, params: dict) -> dict:
+    """Готовит генерацию: {"key": ключ кэша, "text": план из кэша или None,
+    "request": аргументы для API, "estimate": оценка входных токенов, "route": маршрут}.
+
+    Подготовка страниц (сжатие + передача, все сразу в пуле потоков) и сборка промпта идут
+    параллельно; при попадании в кэш подготовка изображений отменяется.
+    """
+    from app.prompt_builder.prompt import build_prompt
+
+    web_search = params["web_search"]
+    lesson_params = collect_params(**params)
+    # Маршрут - с учётом полей, заполненных по каталогу учебников
+    route = choose_route({**params, **lesson_params})
+    # Опора на локальную базу знаний - поиск в памяти процесса, без сетевых вызовов
+    lesson_params['kb_context'] = retrieve_context(lesson_params)
+    lesson_params['few_shot'], lesson_params['few_shot_tl'] = few_shot_blocks(lesson_params)
+
+    pages = await read_pages(image_paths)
+    loop = asyncio.get_running_loop()
+    # Страница (или другое её фото) уже разобрана при прошлой генерации - изображение не отправляем,
+    # хватит описания. Ключ страницы для кэша планов - всегда по байтам самого фото
+    if PAGE_ANALYSIS:
+        found = await asyncio.gather(*(
+            loop.run_in_executor(IMAGE_POOL, find_analysis, page["key"], page["bytes"], params.get("textbook") or "")
+            for page in pages
+        ))
+    else:
+        found = [(None, None) for page in pages]
+    image_tasks = {}
+    for page, (analysis, page_hash) in zip(pages, found):
+        page.update(analysis=analysis, hash=page_hash)
+        if analysis is None:
+            image_tasks[page["key"]] = loop.run_in_executor(IMAGE_POOL, encode_image, page["bytes"], route["model"])
+    # Локальный OCR - в пуле процессов, параллельно со сжатием; уверенный текст заменяет изображение
+    ocr_tasks = {}
+    if ocr.available():
+        ocr_pool = ocr.get_pool()
+        ocr_tasks = {page["key"]: loop.run_in_executor(ocr_pool, ocr.run_ocr, page["bytes"])
+                     for page in pages if page["key"] in image_tasks}
+    ocr_started = time.monotonic()
     try:
-        response = client.responses.create(
-            input=[{"role": "user", "content": input_content}],
-            model="o4-mini", #  gpt-4o-mini    gpt-4.1
-            tools=tools or None,
-            tool_choice=tool_choice,
-            max_output_tokens=8192,
-            reasoning= {"effort":"medium"},
-            stream=False
+        prompt = await asyncio.to_thread(build_prompt, lesson_params)
+
+        key = plan_cache_key([page["key"] for page in pages], lesson_params, prompt, web_search, route)
+        if not regenerate:
+            entry = await asyncio.to_thread(plan_cache.get, key)
+            if entry:
+                logging.info(f"Plan cache hit: {key[:12]}")
+                for task in [*image_tasks.values(), *ocr_tasks.values()]:
+                    task.cancel()
+                return {"key": key, "text": entry["text"], "request": None, "estimate": None, "route": route}
+
+        encoded = await asyncio.gather(*image_tasks.values())
+        ocr_results = await recognize_pages(ocr_tasks, ocr_started)
+        ocr_seconds = time.monotonic() - ocr_started
+    except BaseException:
+        for task in [*image_tasks.values(), *ocr_tasks.values()]:
+            task.cancel()
+        raise
+    encoded = dict(zip(image_tasks, encoded))
+    ocr_mode = ocr.image_mode(ocr_results, route["model"])
+
+    image_urls, sizes, high_sizes, descriptions, sent = [], [], [], [], []
+    for n, page in enumerate(pages, start=1):
+        if page["analysis"]:
+            logging.info(f"Using cached page analysis {page['key'][:12]} instead of the image")
+            description = describe_page(page["analysis"])
+            descriptions.append(f"\n[Страница {n}]{description}" if len(pages) > 1 else description)
+            continue
+        image_url, size = encoded[page["key"]]
+        high_sizes.append(size)
+        if ocr_mode == "skip":
+            continue
+        image_urls.append(image_url)
+        sizes.append(size)
+        sent.append(page["bytes"])
+        # Страницу, по которой план переделывают, разбираем параллельно с генерацией - для следующих итераций.
+        # При первой генерации не разбираем: большинству хватает одного плана, лишний vision-вызов не окупится
+        if PAGE_ANALYSIS and (regenerate or await asyncio.to_thread(note_use, page["key"])):
+            schedule_analysis(client, page["key"], image_url, page["hash"])
+    if descriptions:
+        lesson_params['page_description'] = "".join(descriptions)
+    if ocr_mode != "high":
+        # Номера страниц - по порядку загрузки, а не среди распознанных (часть страниц описана по анализу)
+        numbers = [n for n, page in enumerate(pages, start=1) if page["key"] in ocr_tasks]
+        lesson_params['page_text'] = ocr.describe_ocr(ocr_results, ocr_mode, numbers if len(pages) > 1 else None)
+    if descriptions or ocr_mode != "high":
+        prompt = build_prompt(lesson_params)
+
+    # Оценка входных токенов до отправки; при превышении бюджета отключаем необязательное
+    start_detail = "low" if ocr_mode == "low" else "high"
+    prompt, detail, estimate = fit_to_budget(lesson_params, prompt, sizes, route["model"], detail=start_detail)
+    logging.info(f"Estimated input tokens: {estimate['total']} (text {estimate['text']}, image {estimate['image']})")
+    if detail == "low" and route["model"] in PATCH_MODELS and sent:
+        # Патчевые модели detail не учитывают - уменьшаем изображения сами, как заложено в оценке
+        reencoded = await asyncio.gather(*(
+            loop.run_in_executor(IMAGE_POOL, encode_image, image_bytes, route["model"], "low") for image_bytes in sent
+        ))
+        image_urls = [image_url for image_url, _ in reencoded]
+    if estimate["over_budget"]:
+        message = (f"Запрос больше бюджета ({estimate['total']} > {estimate['budget']} токенов) - "
+                   f"уберите дополнительные страницы или сократите комментарий")
+        if BUDGET_STRICT:
+            raise gr.Error(message)
+        gr.Warning(message)
+    ocr_stats = None
+    if ocr_results:
+        # Цена OCR (время) против экономии на vision (токены изображений в detail=high)
+        ocr_stats = {
+            "mode": ocr_mode,
+            "seconds": ocr_seconds,
+            "confidence": min(r["confidence"] for r in ocr_results if r) if any(ocr_results) else 0.0,
+            "image_tokens_saved": sum(
+                estimate_image_tokens(*size, route["model"], "high") for size in high_sizes if size
+            ) - estimate["image"],
+        }
+        logging.info(
+            f"OCR: {len(ocr_results)} page(s) in {ocr_stats['seconds']:.2f}s, "
+            f"min confidence {ocr_stats['confidence']:.0f}, images: {ocr_mode}, "
+            f"image tokens saved ~{ocr_stats['image_tokens_saved']}"
+        )
+    return {
+        "key": key,
+        "text": None,
+        "request": build_request(prompt, image_urls, web_search, route, detail),
+        "estimate": estimate,
+        "route": route,
+        "ocr": ocr_stats,
+    }
+
+
+async def recognize_pages(ocr_tasks: dict, started: float) -> list[Optional[dict]]:
+    """Результаты OCR по страницам; None - страница не распознана (ошибка или таймаут)"""
+    if not ocr_tasks:
+        return []
+    timeout = max(ocr.OCR_TIMEOUT - (time.monotonic() - started), 0)
+    done, pending = await asyncio.wait(ocr_tasks.values(), timeout=timeout)
+    for task in pending:
+        task.cancel()
+    if pending:
+        logging.warning(f"OCR timeout ({ocr.OCR_TIMEOUT:.0f}s): {len(pending)} page(s) not recognized")
+    results = []
+    for task in ocr_tasks.values():
+        if task not in done:
+            results.append(None)
+        elif task.exception():
+            logging.warning(f"OCR error: {task.exception()}")
+            results.append(None)
+        else:
+            results.append(task.result())
+    return results
+
+
+def log_latency(job: dict, latency: float) -> None:
+    """Время генерации рядом с временем OCR - чтобы сравнивать режимы (skip/low/high) по запросам"""
+    if job.get("ocr"):
+        logging.info(
+            f"OCR mode {job['ocr']['mode']}: OCR {job['ocr']['seconds']:.2f}s, generation {latency:.2f}s, "
+            f"image tokens saved ~{job['ocr']['image_tokens_saved']}"
         )
-        return response.output_text
+
+
+def page_paths(image_path: Optional[str], extra_images: Optional[list]) -> list[str]:
+    """Главная страница + дополнительные (не больше MAX_EXTRA_PAGES), в порядке загрузки"""
+    extra = [getattr(f, "name", f) for f in (extra_images or [])]
+    if len(extra) > MAX_EXTRA_PAGES:
+        raise gr.Error(f"Можно добавить не больше {MAX_EXTRA_PAGES} дополнительных страниц")
+    return [image_path] + extra
+
+
+async def generate_lesson_plan(image_path: Optional[str], regenerate: bool = False,
+                               extra_images: Optional[list] = None, **params) -> str:
+    """Генерирует план урока целиком (один ответ без стриминга)"""
+    # Валидация API клиента
+    if not client:
+        raise gr.Error("API ключ не настроен")
+    # Проверка наличия изображения
+    if not image_path:
+        return "❗ Загрузите фото страницы учебника для генерации урока"
+
+    job = await prepare_generation(page_paths(image_path, extra_images), regenerate, params)
+    if job["text"] is not None:
+        return job["text"]
+
+    # Вызов LLM
+    started = time.monotonic()
+    try:
+        response = await client.responses.create(**job["request"], stream=False)
+        text = response.output_text
+        log_usage(response.usage, job["estimate"])
+        record_route(job["route"], time.monotonic() - started, response.usage)
+        log_latency(job, time.monotonic() - started)
 
     except Exception as e:
         logging.error(f"Generation error: {e}")
         raise gr.Error(f"Ошибка генерации: {e}")
 
+    await asyncio.to_thread(plan_cache.put, job["key"], {"text": text})
+    return text
+
+
+async def stream_lesson_plan(image_path: Optional[str], regenerate: bool = False,
+                             extra_images: Optional[list] = None, **params) -> AsyncIterator[str]:
+    """Генерирует план урока потоково: отдаёт накопленный текст по мере прихода дельт"""
+    if not client:
+        raise gr.Error("API ключ не настроен")
+    if not image_path:
+        yield "❗ Загрузите фото страницы учебника для генерации урока"
+        return
+
+    job = await prepare_generation(page_paths(image_path, extra_images), regenerate, params)
+    if job["text"] is not None:
+        yield job["text"]
+        return
+
+    started = time.monotonic()
+    first_delta_at = None
+    text = ""
+    completed = False
+    try:
+        stream = await client.responses.create(**job["request"], stream=True)
+        async for event in stream:
+            if event.type == "response.output_text.delta":
+                if first_delta_at is None:
+                    first_delta_at = time.monotonic()
+                    logging.info(f"Time to first token: {first_delta_at - started:.2f}s")
+                text += event.delta
+                yield text
+            elif event.type == "response.completed":
+                # Финальный текст берём из ответа целиком - на случай пропущенных дельт
+                text = event.response.output_text or text
+                completed = True
+                log_usage(event.response.usage, job["estimate"])
+                record_route(job["route"], time.monotonic() - started, event.response.usage)
+                log_latency(job, time.monotonic() - started)
+            elif event.type in ("response.failed", "error"):
+                raise RuntimeError(getattr(event, "message", None) or event.type)
+    except gr.Error:
+        raise
+    except Exception as e:
+        logging.error(f"Generation error: {e}")
+        raise gr.Error(f"Ошибка генерации: {e}")
+
+    logging.info(f"Generation finished in {time.monotonic() - started:.2f}s")
+    # В кэш попадают только полностью завершённые ответы
+    if completed:
+        await asyncio.to_thread(plan_cache.put, job["key"], {"text": text})
+    yield text
+
 
 
 ########## ИНТЕРФЕЙС
@@ -197,6 +477,8 @@ css_path = os.path.join(os.path.dirname(__file__), "styles.css")
 with gr.Blocks(theme=theme, css_paths=css_path) as app:
     advanced_settings_visible = gr.State(value=False)  # Импортируем gr.State для хранения состояния
     feedback_visible = gr.State(False)  # Хранит, открыт ли блок отзыва
+    plan_text = gr.State("")  # Текст последнего готового плана - для экспорта в .docx
+    plan_params = gr.State({})  # Параметры формы, с которыми этот план сгенерирован - для перегенерации этапа
 
     gr.Markdown("# План урока английского языка", elem_classes=["main-title"])
     quote_box = gr.Markdown(random.choice(quotes), elem_classes=["quote-block"])
@@ -208,11 +490,26 @@ with gr.Blocks(theme=theme, css_paths=css_path) as app:
                 height=0,  # Автоматическая высота
                 container=False  # Не растягивать контейнер
             )
+            # Дополнительные страницы (разворот), до MAX_EXTRA_PAGES
+            show_extra = gr.Checkbox(label="Добавить страницы (разворот)", value=False)
+            extra_images = gr.File(
+                label=f"Дополнительные страницы (макс. {MAX_EXTRA_PAGES})",
+                file_types=["image"],
+                file_count="multiple",
+                type="filepath",
+                visible=False
+            )
+            # Предупреждение о качестве фото - сразу после загрузки
+            quality_box = gr.Markdown(visible=False, elem_classes=["quality-warning"])
 
             # Блок 1: Учебник
             with gr.Column(variant="panel"):
                 gr.Markdown("### 📚 Учебник", elem_classes=["block-title"])
                 textbook = gr.Textbox(label="Название учебника", placeholder="напр. English File Beginner", elem_id="textbook_input")
+                # Подсказки с сервера по мере ввода (с учётом опечаток и сокращений)
+                textbook_suggestions = gr.Radio(choices=[], show_label=False, container=False, visible=False)
+                # Справка каталога об узнанном учебнике: издательство, уровень, возраст
+                textbook_hint = gr.Markdown(visible=False)
 
                 cefr = gr.Dropdown(label="Уровень", choices=["", "A1", "A2", "B1", "B2", "C1", "C2"],
                                    value="", info="Выберите уровень")
@@ -269,6 +566,7 @@ with gr.Blocks(theme=theme, css_paths=css_path) as app:
                 web_search = gr.Checkbox(label="Доп. материалы из интернета")
 
             btn = gr.Button("Создать план", variant="primary", size="lg")
+            regen_btn = gr.Button("🔄 Сгенерировать заново", size="sm")
 
         # Правая колонка — результат (output)
         with gr.Column(elem_classes=["right-col"], scale=2):
@@ -280,11 +578,18 @@ with gr.Blocks(theme=theme, css_paths=css_path) as app:
                     hint_text,
                     elem_id="plan-output"
                 )
+                # .docx собирается только по запросу: кнопка готовит файл и показывает кнопку скачивания
+                export_btn = gr.Button("📄 Подготовить .docx", size="sm", visible=False)
                 # Кнопка скачивания (оставляем внутри панели)
                 download_btn = gr.DownloadButton(
                     label="⬇️ Скачать .docx",
                     visible=False
                 )
+                # Переделать один этап плана, не пересоздавая весь план
+                with gr.Group(visible=False) as section_panel:
+                    section_picker = gr.Dropdown(label="Этап плана", choices=[], interactive=True)
+                    section_wish = gr.Textbox(label="Что изменить", placeholder="напр. Начни урок с игры вместо обсуждения картинки")
+                    section_btn = gr.Button("🔁 Переделать этап", size="sm")
             # Кнопка "Помогите нам стать лучше"
             feedback_btn = gr.Button("💬 Помогите нам стать лучше", elem_classes=["feedback-button"])
 
@@ -343,78 +648,123 @@ with gr.Blocks(theme=theme, css_paths=css_path) as app:
     # Формат занятия - видимость поля если выбрано групповое
     def toggle_format(selected_format):
         return gr.update(visible=selected_format == "Групповое")
-    format_type.change(fn=toggle_format, inputs=format_type, outputs=group_settings)
+    format_type.change(fn=toggle_format, inputs=format_type, outputs=group_settings, queue=False)
 
     # Возраст - деактивация поля если нажато "Взрослые"
     def toggle_age(adult_checked):
         return gr.update(interactive=not adult_checked)
-    adults.change(fn=toggle_age, inputs=adults, outputs=age)
+    adults.change(fn=toggle_age, inputs=adults, outputs=age, queue=False)
 
     # Функция для переключения видимости Target language
     def toggle_target_language(methodology_value):
         return gr.update(visible=methodology_value == "PPP (Presentation-Practice-Production)")
-    methodology.change(fn=toggle_target_language, inputs=methodology, outputs=target_language)
-
-    # JS для автодополнения
-    app.load(
-        None,
-        None,
-        js=f"""
-        const textbooks = {TEXTBOOKS};
-
-        function setupAutocomplete() {{
-            const input = document.getElementById('textbook_input');
-            if (!input) return;
-
-            const datalist = document.createElement('datalist');
-            datalist.id = 'textbook_suggestions';
-
-            textbooks.forEach(book => {{
-                const option = document.createElement('option');
-                option.value = book;
-                datalist.appendChild(option);
-            }});
-
-            input.setAttribute('list', datalist.id);
-            document.body.appendChild(datalist);
-        }}
-
-        // Запускаем после загрузки
-        if (document.readyState === 'complete') {{
-            setupAutocomplete();
-        }} else {{
-            document.addEventListener('DOMContentLoaded', setupAutocomplete);
-        }}
-        """
+    methodology.change(fn=toggle_target_language, inputs=methodology, outputs=target_language, queue=False)
+
+    # Показываем/скрываем загрузку доп. страниц
+    def toggle_extra_images(show):
+        return gr.update(visible=show)
+    show_extra.change(fn=toggle_extra_images, inputs=show_extra, outputs=extra_images, queue=False)
+
+    # Проверка качества фото при загрузке (локально, доли секунды) - до траты времени и токенов на генерацию
+    def on_photos_change(image_path, extra):
+        if not image_path:
+            return gr.update(visible=False)
+        try:
+            problems = quality_report(page_paths(image_path, extra))
+        except gr.Error as e:
+            return gr.update(value=f"⚠️ {e.message}", visible=True)
+        if not problems:
+            return gr.update(visible=False)
+        items = "\n".join(f"- {problem}" for problem in problems)
+        return gr.update(value=f"⚠️ **Фото не подойдёт для генерации:**\n{items}\n\nПереснимите страницу.", visible=True)
+
+    for photo_input in (image, extra_images):
+        photo_input.change(
+            fn=on_photos_change,
+            inputs=[image, extra_images],
+            outputs=quality_box,
+            queue=False,
+            show_progress="hidden"
+        )
+
+    # Автодополнение учебника: индекс на сервере, в браузер уходят только подходящие названия
+    def on_textbook_input(query):
+        suggestions = suggest_textbooks(query)
+        # Полностью введённое название не подсказываем
+        if suggestions == [query.strip()]:
+            suggestions = []
+        return gr.update(choices=suggestions, value=None, visible=bool(suggestions))
+
+    textbook.input(
+        fn=on_textbook_input,
+        inputs=textbook,
+        outputs=textbook_suggestions,
+        queue=False,
+        trigger_mode="always_last",
+        show_progress="hidden",
+        api_name="suggest_textbooks"
     )
+
+    def pick_textbook(choice):
+        return choice, gr.update(choices=[], value=None, visible=False)
+
+    textbook_suggestions.select(
+        fn=pick_textbook,
+        inputs=textbook_suggestions,
+        outputs=[textbook, textbook_suggestions],
+        queue=False,
+        show_progress="hidden"
+    )
+
+    # Узнали учебник по каталогу - показываем справку, возраст учебника - подсказкой в поле "Возраст"
+    def on_textbook_change(name):
+        entry = find_textbook(name)
+        if entry is None:
+            return gr.update(visible=False), gr.update(placeholder="напр. 10–11")
+        hint = gr.update(value=f"📖 По каталогу: {describe_textbook(entry)}", visible=True)
+        return hint, gr.update(placeholder=f"по учебнику: {entry['age']}" if entry['age'] else "напр. 10–11")
+
+    textbook.change(
+        fn=on_textbook_change,
+        inputs=textbook,
+        outputs=[textbook_hint, age],
+        queue=False,
+        show_progress="hidden"
+    )
+
     ### СПИСОК ВСЕХ ПАРАМЕТРОВ ИНТЕРФЕЙСА
-    all_inputs = [
-        image,  # Gradio компонент, соответствует image_path в функциях
-        textbook,
-        cefr,
-        topic,
-        goal,
-        format_type,
-        num_students,
-        age,
-        adults,
-        level_match,
-        duration,
-        inventory,
-        extra_info,
-        methodology,
-        target_language,
-        hw_required,
-        web_search
-        # repetition,
-        # application,
-        # analysis,
-        # creativity
-    ]
+    # Имя параметра (как в on_generate) -> компонент; порядок - порядок аргументов on_generate
+    FORM = {
+        "image_path": image,  # Gradio компонент image
+        "extra_images": extra_images,
+        "textbook": textbook,
+        "cefr": cefr,
+        "topic": topic,
+        "goal": goal,
+        "format_type": format_type,
+        "num_students": num_students,
+        "age": age,
+        "adults": adults,
+        "level_match": level_match,
+        "duration": duration,
+        "inventory": inventory,
+        "extra_info": extra_info,
+        "methodology": methodology,
+        "target_language": target_language,
+        "hw_required": hw_required,
+        "web_search": web_search,
+        # "repetition": repetition,
+        # "application": application,
+        # "analysis": analysis,
+        # "creativity": creativity,
+    }
+    all_inputs = list(FORM.values())
+    FORM_FIELDS = list(FORM)
 
     # Коллбек генерации
-    def on_generate(
+    async def on_generate(
             image_path: Optional[str],  # Переименовано из image
+            extra_images: Optional[list],
             textbook: str,
             cefr: str,
             topic: str,
@@ -430,42 +780,178 @@ with gr.Blocks(theme=theme, css_paths=css_path) as app:
             methodology: str,
             target_language: str,
             hw_required: bool,
-            web_search: bool
+            web_search: bool,
             # repetition: bool,
             # application: bool,
             # analysis: bool,
             # creativity: bool
+            regenerate: bool = False  # True - не брать план из кэша
     ):
-        # Проверка обязательных полей
-        if not image_path or (not adults and not age):
-            return gr.update(value="❗ Заполните обязательные поля (отмечены *)"), gr.update(visible=False)
-
-        # Собираем все аргументы в словарь
+        # Собираем все аргументы в словарь (форма уже проверена в request_problem)
         kwargs = locals()
 
-        # Генерация плана
-        text = generate_lesson_plan(**kwargs)
+        # Генерация плана: в потоковом режиме показываем текст по мере готовности
+        if STREAM_GENERATION:
+            text = ""
+            last_update = 0.0
+            async for text in stream_lesson_plan(**kwargs):
+                now = time.monotonic()
+                if now - last_update >= STREAM_UPDATE_INTERVAL:
+                    last_update = now
+                    yield gr.update(value=text), gr.update(visible=False), gr.update(visible=False), "", gr.update()
+        else:
+            text = await generate_lesson_plan(**kwargs)
+
+        # DOCX не создаём сразу - только по кнопке, из сохранённого текста плана
+        ready = not text.startswith("❗")
+        # Параметры этого плана - перегенерация этапа опирается на них, а не на изменённую после форму
+        generated_with = {name: kwargs[name] for name in FORM_FIELDS if name not in ("image_path", "extra_images")}
+        yield (
+            gr.update(value=text),
+            gr.update(visible=ready),
+            gr.update(visible=False, value=None),
+            text if ready else "",
+            generated_with if ready else gr.update()
+        )
+
+    # Общая очередь генераций (план и перегенерация этапа): позиция, ожидание слота, учёт длительности.
+    # Заявка встаёт в очередь уже внутри обработчика, поэтому отменённая (закрыли вкладку) сразу из неё уходит
+    async def queued(updates: AsyncIterator, waiting_update=None):
+        try:
+            position, wait = generation_load.enqueue()
+        except OverflowError:
+            raise gr.Error("Сейчас очень много запросов — попробуйте через пару минут")
+        started = None
+        try:
+            if position:
+                message = f"⏳ Вы в очереди: перед вами {position}, ожидание около {max(1, round(wait / 60))} мин"
+            else:
+                message = "⏳ Составляем план..."
+            if waiting_update:
+                yield waiting_update(message)
+            elif position:
+                gr.Info(message)
+            await generation_load.start()
+            started = time.monotonic()
+            async for update in updates:
+                yield update
+        finally:
+            if started is None:
+                generation_load.cancel()
+            else:
+                generation_load.finish(time.monotonic() - started)
+
+    def plan_status(message):
+        return gr.update(value=message), gr.update(visible=False), gr.update(visible=False), "", gr.update()
+
+    # Проверки до очереди: незаполненная форма или непригодное фото не занимают в ней место
+    async def request_problem(args) -> Optional[str]:
+        fields = dict(zip(FORM_FIELDS, args))
+        if not fields["image_path"] or (not fields["adults"] and not fields["age"]):
+            return "❗ Заполните обязательные поля (отмечены *)"
+        # Непригодное фото (размыто, темно, мелко, повёрнуто) не отправляем в модель
+        problems = await asyncio.to_thread(quality_report, page_paths(fields["image_path"], fields["extra_images"]))
+        if problems:
+            return "❗ Фото не подходит для генерации: " + "; ".join(problems)
+        return None
+
+    async def generation(args, regenerate=False):
+        problem = await request_problem(args)
+        if problem:
+            yield plan_status(problem)
+            return
+        async for update in queued(on_generate(*args, regenerate=regenerate), plan_status):
+            yield update
+
+    async def run_generation(*args):
+        async for update in generation(args):
+            yield update
+
+    # Повторная генерация в обход кэша
+    async def on_regenerate(*args):
+        async for update in generation(args, regenerate=True):
+            yield update
+
+    # Ожидающие заявки держит queued(), поэтому лимит Gradio - с запасом на очередь
+    for button, handler in ((btn, run_generation), (regen_btn, on_regenerate)):
+        button.click(
+            fn=handler,
+            inputs=all_inputs,
+            outputs=[output, export_btn, download_btn, plan_text, plan_params],
+            concurrency_limit=GENERATION_CONCURRENCY + QUEUE_MAX_SIZE,
+            concurrency_id="generation"
+        )
+
+    # Экспорт по запросу: собираем .docx (повторно для того же плана - из памяти) и показываем скачивание
+    async def prepare_docx(text):
+        if not text:
+            return gr.update(), gr.update(visible=False)
+        path = await asyncio.to_thread(export.docx_for_plan, text)
+        return gr.update(visible=False), gr.update(visible=True, value=path)
+
+    export_btn.click(
+        fn=prepare_docx,
+        inputs=plan_text,
+        outputs=[export_btn, download_btn]
+    )
 
-        # Создание DOCX
-        docx_path = generate_docx(text) if not text.startswith("❗") else None
-        return gr.update(value=text), gr.update(visible=bool(docx_path), value=docx_path)
+    # Этапы готового плана - в выпадающий список (выбранный этап сохраняем, если он остался)
+    # Меньше двух этапов - план не разобрался на этапы, "этапом" был бы весь план: панель не показываем
+    def update_sections(text, current):
+        sections = split_sections(text) if text else []
+        labels = section_labels(sections) if stage_count(sections) >= 2 else []
+        value = current if current in labels else (labels[0] if labels else None)
+        return gr.update(choices=labels, value=value), gr.update(visible=bool(labels))
+
+    plan_text.change(
+        fn=update_sections,
+        inputs=[plan_text, section_picker],
+        outputs=[section_picker, section_panel],
+        queue=False
+    )
 
-    btn.click(
-        fn=on_generate,
-        inputs=all_inputs,
-        outputs=[output, download_btn]
+    # Перегенерация одного этапа: в модель уходит только этап + параметры занятия и оглавление
+    async def regenerate_section_text(text, label, wish, fields):
+        route = choose_route(fields)
+        try:
+            new_text = await regenerate_section(
+                client, text, label, wish, build_params_block(collect_params(**fields)), route
+            )
+        except Exception as e:
+            logging.error(f"Section regeneration error: {e}")
+            raise gr.Error(f"Не удалось переделать этап: {e}")
+        # Новый текст плана - .docx соберётся заново по кнопке
+        yield gr.update(value=new_text), new_text, gr.update(visible=True), gr.update(visible=False, value=None)
+
+    # Через ту же очередь, что и генерация плана: позиция в очереди - всплывающим сообщением
+    async def on_regenerate_section(text, label, wish, fields):
+        if not text or not label or not fields:
+            yield gr.update(), text, gr.update(), gr.update()
+            return
+        if not client:
+            raise gr.Error("API ключ не настроен")
+        async for update in queued(regenerate_section_text(text, label, wish, fields)):
+            yield update
+
+    section_btn.click(
+        fn=on_regenerate_section,
+        inputs=[plan_text, section_picker, section_wish, plan_params],
+        outputs=[output, plan_text, export_btn, download_btn],
+        concurrency_limit=GENERATION_CONCURRENCY + QUEUE_MAX_SIZE,
+        concurrency_id="generation"
     )
 
     # Логика: показать форму по нажатию на кнопку
     feedback_btn.click(
         fn=toggle_feedback_block,
         inputs=[feedback_visible],
-        outputs=[feedback_block, feedback_visible, feedback_confirmation]
+        outputs=[feedback_block, feedback_visible, feedback_confirmation],
+        queue=False
     )
 
     # Логика отправки обратной связи
     def send_feedback_fn(comment, rate):
-        save_feedback(comment, rate)  # Сохраняем отзыв
+        feedback.save_feedback(comment, rate)  # Сохраняем отзыв (без ожидания сети)
         return (
             gr.update(visible=False),  # свернуть форму
             False,  # сбросить состояние
@@ -481,6 +967,10 @@ with gr.Blocks(theme=theme, css_paths=css_path) as app:
         outputs=[feedback_block, feedback_visible, feedback_confirmation]
     )
 
+# Переполненная очередь отклоняет новые заявки сразу, а не копит их
+app.queue(max_size=QUEUE_MAX_SIZE)
+
 
 if __name__ == "__main__":
-    app.launch()
\ No newline at end of file
+    # SERVE_DIR раздаётся приложением для IMAGE_TRANSPORT=local
+    app.launch(allowed_paths=[SERVE_DIR])
\ No newline at end of file
@@ -0,0 +1,110 @@
+import io
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from PIL import Image, ImageOps
+
+from app.image_prep import PATCH_MODELS, crop_to_page
+
+# Локальное распознавание текста страницы (Tesseract). Если текст распознан уверенно,
+# изображение уходит в модель в detail=low (тайловые модели) или не уходит вовсе - дешевле и быстрее vision.
+# Нужны pytesseract и tesseract-ocr с языками (OCR_LANG); без них этап просто пропускается.
+# OCR=1 - включить
+OCR_ENABLED = os.getenv("OCR", "0") == "1"
+OCR_LANG = os.getenv("OCR_LANG", "eng+rus")
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", 2))
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", 15))  # сек на все страницы; дольше - работаем без OCR
+OCR_SKIP_IMAGE_CONFIDENCE = float(os.getenv("OCR_SKIP_IMAGE_CONFIDENCE", 90))  # выше - изображение не отправляем
+OCR_LOW_DETAIL_CONFIDENCE = float(os.getenv("OCR_LOW_DETAIL_CONFIDENCE", 70))  # выше - detail=low
+OCR_MIN_WORDS = 40  # меньше слов - страница в основном из картинок, без изображения не обойтись
+OCR_MIN_SIDE = 1800  # мелкие фото увеличиваем - Tesseract хуже читает мелкий шрифт
+
+try:
+    import pytesseract
+except ImportError:  # pytesseract не установлен
+    pytesseract = None
+
+# "1", "2a", "3." , "4)" в начале строки - номера упражнений
+EXERCISE_NUMBER = re.compile(r"^\s*(\d{1,2}[a-z]?)[.)]?\s+\S")
+
+_pool = None
+
+
+def available() -> bool:
+    return OCR_ENABLED and pytesseract is not None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    # Tesseract загружает CPU целиком - отдельные процессы, чтобы не мешать event loop и потокам
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=OCR_WORKERS)
+    return _pool
+
+
+def run_ocr(image_bytes: bytes) -> dict:
+    """Распознаёт страницу (выполняется в процессе пула): {"text", "confidence", "words", "exercises", "seconds"}"""
+    started = time.monotonic()
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes)))
+    img = crop_to_page(img.convert("RGB")).convert("L")
+    if max(img.size) < OCR_MIN_SIDE:
+        scale = OCR_MIN_SIDE / max(img.size)
+        img = img.resize((int(img.width * scale), int(img.height * scale)), Image.LANCZOS)
+
+    data = pytesseract.image_to_data(img, lang=OCR_LANG, output_type=pytesseract.Output.DICT)
+    lines = {}  # (блок, абзац, строка) -> слова
+    confidences = []
+    for i, word in enumerate(data["text"]):
+        conf = float(data["conf"][i])
+        if not word.strip() or conf < 0:
+            continue
+        confidences.append(conf)
+        lines.setdefault((data["block_num"][i], data["par_num"][i], data["line_num"][i]), []).append(word)
+
+    text_lines = [" ".join(words) for words in lines.values()]
+    exercises = []
+    for line in text_lines:
+        match = EXERCISE_NUMBER.match(line)
+        if match and match.group(1) not in exercises:
+            exercises.append(match.group(1))
+    return {
+        "text": "\n".join(text_lines),
+        "confidence": sum(confidences) / len(confidences) if confidences else 0.0,
+        "words": len(confidences),
+        "exercises": exercises,
+        "seconds": time.monotonic() - started,
+    }
+
+
+def image_mode(results: list[Optional[dict]], model: str) -> str:
+    """Как отправлять изображения по итогам OCR всех страниц: "skip", "low" или "high".
+
+    "low" - только для тайловых моделей: патчевые detail не учитывают, и уменьшенное изображение
+    было бы хуже без экономии токенов.
+    """
+    if not results or any(r is None for r in results):
+        return "high"
+    if all(r["confidence"] >= OCR_SKIP_IMAGE_CONFIDENCE and r["words"] >= OCR_MIN_WORDS for r in results):
+        return "skip"
+    if model not in PATCH_MODELS and all(r["confidence"] >= OCR_LOW_DETAIL_CONFIDENCE for r in results):
+        return "low"
+    return "high"
+
+
+def describe_ocr(results: list[dict], mode: str, page_numbers: Optional[list[int]] = None) -> str:
+    """Распознанный текст страниц для промпта; page_numbers - номера страниц в загрузке (если их несколько)"""
+    if mode == "skip":
+        header = "Текст страницы учебника распознан локально (изображение не прикладывается - опирайся на этот текст):"
+    else:
+        header = "Текст страницы учебника, распознанный локально (уточняй по изображению, возможны ошибки распознавания):"
+    parts = ["", header]
+    for n, result in enumerate(results):
+        if page_numbers:
+            parts.append(f"[Страница {page_numbers[n]}]")
+        if result["exercises"]:
+            parts.append(f"- Номера упражнений: {', '.join(result['exercises'])}")
+        parts.append(result["text"])
+    return "\n".join(parts) + "\n"
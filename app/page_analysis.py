@@ -0,0 +1,213 @@
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+import tempfile
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Optional
+
+from app import ocr
+from app.cache import DiskCache
+from app.knowledge_base.textbooks import find_textbook
+from app.page_hash import PageHashIndex, dhash
+
+# Анализ страницы: один vision-вызов на изображение (по хэшу), дальше планы строятся по тексту.
+# Окупается только при повторных генерациях по той же странице, поэтому выключен по умолчанию
+# (PAGE_ANALYSIS=1 - включить) и даже включённый запускается со второй генерации по странице.
+# Модель анализа - PAGE_ANALYSIS_MODEL
+PAGE_ANALYSIS = os.getenv("PAGE_ANALYSIS", "0") == "1"
+PAGE_ANALYSIS_MODEL = os.getenv("PAGE_ANALYSIS_MODEL", "gpt-4.1-mini")
+
+page_cache = DiskCache(
+    directory=os.getenv("PAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "lesson_page_cache")),
+    max_age=30 * 24 * 3600,
+    max_bytes=50 * 1024 * 1024,
+)
+
+ANALYSIS_PROMPT = """
+Ты — опытный ESL-методист. Внимательно изучи страницу учебника английского языка на изображении
+и опиши её так, чтобы по твоему описанию можно было составить план урока, не видя страницы.
+- textbook: название учебника (серия и уровень/класс), если узнаёшь по логотипам, оформлению, структуре; иначе пустая строка
+- cefr: примерный уровень CEFR (A1…C2) по сложности материала
+- topic: тема юнита/страницы
+- target_language: ключевая лексика, грамматика и функциональный язык страницы
+- exercises: все упражнения по порядку - номер как на странице, тип и содержание (инструкция, ключевые слова/предложения)
+- page_text: основной текст страницы (диалоги, тексты для чтения, таблицы) - близко к оригиналу, можно сокращать
+- visuals: что изображено на картинках и как это используется в заданиях
+"""
+
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "textbook": {"type": "string"},
+        "cefr": {"type": "string"},
+        "topic": {"type": "string"},
+        "target_language": {"type": "array", "items": {"type": "string"}},
+        "exercises": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "number": {"type": "string"},
+                    "type": {"type": "string"},
+                    "content": {"type": "string"},
+                },
+                "required": ["number", "type", "content"],
+                "additionalProperties": False,
+            },
+        },
+        "page_text": {"type": "string"},
+        "visuals": {"type": "string"},
+    },
+    "required": ["textbook", "cefr", "topic", "target_language", "exercises", "page_text", "visuals"],
+    "additionalProperties": False,
+}
+
+# Перцептивные хэши разобранных страниц - чтобы узнавать ту же страницу на другом фото
+page_hashes = PageHashIndex(os.path.join(page_cache.directory, "page_hashes.jsonl"))
+
+_in_flight = {}  # хэш изображения -> задача анализа (чтобы не анализировать одну страницу дважды)
+
+
+def get_analysis(image_key: str) -> Optional[dict]:
+    """Сохранённый анализ страницы или None"""
+    return page_cache.get(image_key)
+
+
+def note_use(image_key: str) -> bool:
+    """Отмечает генерацию по странице; True - по ней уже генерировали (учитель перегенерирует или меняет параметры)"""
+    seen_key = f"seen-{image_key}"
+    if page_cache.get(seen_key) is not None:
+        return True
+    page_cache.put(seen_key, {"seen": time.time()})
+    return False
+
+
+def exercise_numbers(values) -> set[str]:
+    return {re.sub(r"[^0-9a-z]", "", str(v).lower()) for v in values} - {""}
+
+
+def content_words(text: str) -> set[str]:
+    return set(re.findall(r"[a-zа-яё]{4,}", text.lower()))
+
+
+def confirm_match(analysis: dict, image_bytes: bytes, textbook: str = "") -> bool:
+    """Проверка почти-дубликата по содержанию: похожий хэш бывает и у разных страниц одной вёрстки.
+
+    Отказ, если учебник, указанный учителем, не совпадает с распознанным в анализе, или если
+    локальный OCR (когда включён) видит на фото другие номера упражнений и другой текст.
+    OCR - в пуле процессов ocr.get_pool(); не уложился в OCR_TIMEOUT - проверку по тексту пропускаем.
+    """
+    given, recognized = find_textbook(textbook), find_textbook(analysis.get("textbook", ""))
+    if given and recognized and given["title"] != recognized["title"]:
+        logging.info(f"Near-duplicate rejected: textbook {given['title']} != {recognized['title']}")
+        return False
+    if not ocr.available():
+        return True
+    future = ocr.get_pool().submit(ocr.run_ocr, image_bytes)
+    try:
+        recognized_page = future.result(timeout=ocr.OCR_TIMEOUT)
+    except FutureTimeout:
+        future.cancel()
+        logging.warning(f"OCR timeout ({ocr.OCR_TIMEOUT:.0f}s): near-duplicate accepted without text check")
+        return True
+    except Exception as e:
+        logging.warning(f"OCR error: {e}")
+        return True
+    ours = exercise_numbers(recognized_page["exercises"])
+    theirs = exercise_numbers(exercise["number"] for exercise in analysis.get("exercises", []))
+    if ours and theirs and not ours & theirs:
+        logging.info(f"Near-duplicate rejected: exercises {sorted(ours)} vs {sorted(theirs)}")
+        return False
+    words = content_words(recognized_page["text"])
+    known = content_words(analysis.get("page_text", "") + " " + " ".join(
+        exercise["content"] for exercise in analysis.get("exercises", [])
+    ))
+    if len(words) >= 20 and len(words & known) < 0.2 * len(words):
+        logging.info(f"Near-duplicate rejected: {len(words & known)} of {len(words)} OCR words match")
+        return False
+    return True
+
+
+def find_analysis(image_key: str, image_bytes: bytes, textbook: str = "") -> tuple[Optional[dict], Optional[int]]:
+    """Анализ этой страницы или её почти-дубликата (другое фото той же страницы).
+
+    Возвращает (анализ или None, перцептивный хэш фото). Найденный по хэшу анализ после проверки
+    сохраняется и под ключом этого фото; ключ самого фото не меняется - кэш планов по-прежнему по байтам.
+    """
+    analysis = get_analysis(image_key)
+    if analysis is not None:
+        return analysis, None
+    value = dhash(image_bytes)
+    if value is None:
+        return None, None
+    match = page_hashes.nearest(value)
+    if match:
+        distance, key = match
+        analysis = get_analysis(key)
+        if analysis is not None and confirm_match(analysis, image_bytes, textbook):
+            logging.info(f"Near-duplicate page {image_key[:12]} -> {key[:12]} (distance {distance})")
+            page_cache.put(image_key, analysis)
+            page_hashes.add(value, image_key)
+            return analysis, value
+    return None, value
+
+
+async def analyze_page(client, image_key: str, image_url: str, page_hash: Optional[int] = None) -> Optional[dict]:
+    """Извлекает структурированное описание страницы и кэширует его по хэшу изображения"""
+    try:
+        response = await client.responses.create(
+            model=PAGE_ANALYSIS_MODEL,
+            input=[{"role": "user", "content": [
+                {"type": "input_text", "text": ANALYSIS_PROMPT},
+                {"type": "input_image", "image_url": image_url, "detail": "high"},
+            ]}],
+            text={"format": {"type": "json_schema", "name": "page_analysis", "schema": ANALYSIS_SCHEMA, "strict": True}},
+            max_output_tokens=4096,
+        )
+        analysis = json.loads(response.output_text)
+    except Exception as e:
+        logging.error(f"Page analysis error: {e}")
+        return None
+
+    await asyncio.to_thread(page_cache.put, image_key, analysis)
+    if page_hash is not None:
+        await asyncio.to_thread(page_hashes.add, page_hash, image_key)
+    logging.info(f"Page analysed: {image_key[:12]} ({len(analysis['exercises'])} exercises)")
+    return analysis
+
+
+def schedule_analysis(client, image_key: str, image_url: str, page_hash: Optional[int] = None) -> None:
+    """Запускает анализ страницы в фоне, если он ещё не идёт - результат пригодится при следующей генерации"""
+    if image_key in _in_flight:
+        return
+    task = asyncio.create_task(analyze_page(client, image_key, image_url, page_hash))
+    _in_flight[image_key] = task
+    task.add_done_callback(lambda _: _in_flight.pop(image_key, None))
+
+
+def describe_page(analysis: dict) -> str:
+    """Текстовое описание страницы для промпта - вместо изображения"""
+    lines = [
+        "",
+        "Страница учебника (изображение не прикладывается - опирайся на это описание, оно составлено по фото страницы):",
+    ]
+    if analysis.get("textbook"):
+        lines.append(f"- Учебник (распознан): {analysis['textbook']}")
+    if analysis.get("cefr"):
+        lines.append(f"- Уровень (оценка): {analysis['cefr']}")
+    if analysis.get("topic"):
+        lines.append(f"- Тема страницы: {analysis['topic']}")
+    if analysis.get("target_language"):
+        lines.append(f"- Языковой материал: {'; '.join(analysis['target_language'])}")
+    if analysis.get("exercises"):
+        lines.append("- Упражнения:")
+        for exercise in analysis["exercises"]:
+            lines.append(f"  {exercise['number']}. [{exercise['type']}] {exercise['content']}")
+    if analysis.get("page_text"):
+        lines.append(f"- Текст страницы:\n{analysis['page_text']}")
+    if analysis.get("visuals"):
+        lines.append(f"- Иллюстрации: {analysis['visuals']}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,170 @@
+import io
+import os
+import json
+import logging
+import threading
+from typing import Optional
+
+from PIL import Image, ImageFilter, ImageOps
+
+# Перцептивный хэш страниц: разные фото одной страницы (ракурс, экспозиция, сжатие) дают близкие
+# хэши, хотя байты совпадать не будут. Индекс - BK-дерево по расстоянию Хэмминга, хранится в JSONL.
+# PAGE_HASH_DISTANCE - сколько из 256 бит могут отличаться у "той же" страницы
+PAGE_HASH_DISTANCE = int(os.getenv("PAGE_HASH_DISTANCE", 40))
+HASH_SIZE = 16  # 16x16 = 256 бит: 8x8 не различает страницы с одинаковой вёрсткой
+HASH_BITS = HASH_SIZE * HASH_SIZE
+DESKEW_SIDE = 512  # угол наклона ищем на уменьшенной копии
+DESKEW_MAX_ANGLE = 6  # градусов
+INSET = 0.03  # срезаем края страницы: там остатки фона после поворота и обрезки
+
+
+def row_profile_score(img: Image.Image, angle: float) -> float:
+    """Насколько полосатый профиль строк после поворота: у выровненного текста он самый контрастный"""
+    rotated = img.rotate(angle, resample=Image.BILINEAR)
+    # Только середина кадра - без чёрных углов, которые добавляет поворот
+    dx, dy = img.width // 5, img.height // 5
+    center = rotated.crop((dx, dy, img.width - dx, img.height - dy))
+    profile = list(center.resize((1, center.height), Image.BOX).getdata())
+    mean = sum(profile) / len(profile)
+    return sum((v - mean) ** 2 for v in profile)
+
+
+def skew_angle(img: Image.Image) -> float:
+    """Угол, на который надо повернуть фото, чтобы строки текста стали горизонтальными"""
+    thumb = img.copy()
+    thumb.thumbnail((DESKEW_SIDE, DESKEW_SIDE))
+    # Грубо с шагом 1°, затем точнее вокруг лучшего угла
+    best = max(range(-DESKEW_MAX_ANGLE, DESKEW_MAX_ANGLE + 1), key=lambda a: row_profile_score(thumb, a))
+    return max((best + step / 4 for step in range(-3, 4)), key=lambda a: row_profile_score(thumb, a))
+
+
+def page_box(gray: Image.Image) -> tuple[int, int, int, int]:
+    """Границы страницы: крайние строки и столбцы, где больше половины пикселей - бумага.
+
+    Порог - от уровня белого самой бумаги, а не от средней яркости кадра, поэтому границы
+    не сдвигаются при другой экспозиции.
+    """
+    thumb = gray.copy()
+    thumb.thumbnail((DESKEW_SIDE, DESKEW_SIDE))
+    thumb = thumb.filter(ImageFilter.MedianFilter(5))
+    histogram = thumb.histogram()
+    total, seen, white = sum(histogram), 0, 255
+    for level in range(255, -1, -1):
+        seen += histogram[level]
+        if seen >= total * 0.05:
+            white = level
+            break
+    mask = thumb.point(lambda v: 255 if v > white * 0.6 else 0)
+    rows = [i for i, v in enumerate(mask.resize((1, mask.height), Image.BOX).getdata()) if v > 127]
+    cols = [i for i, v in enumerate(mask.resize((mask.width, 1), Image.BOX).getdata()) if v > 127]
+    if not rows or not cols:
+        return 0, 0, gray.width, gray.height
+    sx, sy = gray.width / thumb.width, gray.height / thumb.height
+    return int(cols[0] * sx), int(rows[0] * sy), int((cols[-1] + 1) * sx), int((rows[-1] + 1) * sy)
+
+
+def dhash(image_bytes: bytes) -> Optional[int]:
+    """dHash страницы: знаки разностей яркости соседних ячеек на выровненной уменьшенной копии"""
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        img.draft("L", (DESKEW_SIDE * 2, DESKEW_SIDE * 2))
+        img = ImageOps.exif_transpose(img).convert("L")
+    except Exception as e:
+        logging.warning(f"Не удалось посчитать хэш страницы: {e}")
+        return None
+    img.thumbnail((DESKEW_SIDE * 2, DESKEW_SIDE * 2))
+    # Выравниваем наклон до обрезки: чёрные углы после поворота отбрасываются вместе с фоном
+    img = img.rotate(skew_angle(img), resample=Image.BICUBIC, expand=True, fillcolor=0)
+    # Обрезка до страницы убирает фон (стол, руки), который у каждого фото свой
+    img = img.crop(page_box(img))
+    dx, dy = int(img.width * INSET), int(img.height * INSET)
+    img = img.crop((dx, dy, img.width - dx, img.height - dy))
+    img = ImageOps.autocontrast(img.resize((HASH_SIZE + 1, HASH_SIZE), Image.BOX))
+    pixels = list(img.getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            right = pixels[row * (HASH_SIZE + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """BK-дерево: поиск всех хэшей в радиусе r без перебора всего индекса"""
+
+    def __init__(self):
+        self.root = None  # [хэш, ключ, {расстояние: потомок}]
+        self.size = 0
+
+    def add(self, value: int, key: str) -> None:
+        self.size += 1
+        if self.root is None:
+            self.root = [value, key, {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0 and node[1] == key:
+                self.size -= 1
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, key, {}]
+                return
+            node = child
+
+    def search(self, value: int, radius: int) -> list[tuple[int, str]]:
+        """[(расстояние, ключ)] в радиусе, ближайшие первыми"""
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                found.append((distance, node[1]))
+            # Неравенство треугольника: подходящие потомки - только с рёбрами в [d - r, d + r]
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return sorted(found)
+
+
+class PageHashIndex:
+    """Хэши уже разобранных страниц -> ключ изображения в кэше анализа; дописывается в JSONL"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tree = BKTree()
+        self.lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    # Хэши другого размера (старый формат индекса) с текущими несравнимы
+                    if len(entry["hash"]) == HASH_BITS // 4:
+                        self.tree.add(int(entry["hash"], 16), entry["key"])
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logging.error(f"Page hash index read error {path}: {e}")
+
+    def add(self, value: int, key: str) -> None:
+        with self.lock:
+            self.tree.add(value, key)
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"hash": f"{value:0{HASH_BITS // 4}x}", "key": key}) + "\n")
+            except OSError as e:
+                logging.error(f"Page hash index write error: {e}")
+
+    def nearest(self, value: int, radius: int = PAGE_HASH_DISTANCE) -> Optional[tuple[int, str]]:
+        """(расстояние, ключ) самой похожей страницы в радиусе или None"""
+        with self.lock:
+            found = self.tree.search(value, radius)
+        return found[0] if found else None
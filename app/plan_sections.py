@@ -0,0 +1,146 @@
+import re
+import logging
+from typing import Optional
+
+# Разбор готового плана на этапы и перегенерация одного этапа без пересоздания всего плана
+HEADING = re.compile(r"^ {0,3}(#{1,6})\s+(.+?)\s*#*\s*$")
+BOLD_LINE = re.compile(r"^\s*\*\*(.+?)\*\*:?\s*$")
+# Этапы без разметки: "Этап 1. Presentation (12 мин)", "Stage 2: Practice"
+STAGE_LINE = re.compile(r"^(?:этап|stage|step|шаг)\s*\d+\s*[.:)\-–—]?\s*\S.*$", re.IGNORECASE)
+# ... или строка с названием этапа: "Warm-up (5 мин)", "3. Production". Подпункты "2.1." не считаются
+STAGE_NAME = re.compile(
+    r"^(?:\d{1,2}[.)]\s*)?(?:warm[- ]?up|lead[- ]?in|presentation|practice|production|pre-|while-|post-|"
+    r"feedback|wrap[- ]?up|homework|cool[- ]?down|разминка|введение|презентация|практика|рефлексия|"
+    r"домашнее задание|подведение итогов)\w*\b.{0,60}$",
+    re.IGNORECASE,
+)
+MAX_STAGE_LINE = 80  # длиннее - это уже абзац текста, а не заголовок этапа
+INTRO_TITLE = "Начало плана"  # текст до первого этапа
+
+SECTION_PROMPT = """
+Ты — опытный ESL-методист. Учитель хочет переделать один этап готового плана урока.
+Перепиши ТОЛЬКО этот этап с учетом параметров занятия и пожелания учителя.
+Сохрани заголовок этапа, его место в структуре урока, примерную продолжительность и ссылки на упражнения учебника.
+Верни только новый текст этапа в Markdown, начиная с того же заголовка, без пояснений до и после.
+{params_block}
+Структура всего плана:
+{outline}
+
+Этап, который нужно переделать:
+{section}
+
+Пожелание учителя: {wish}
+"""
+DEFAULT_WISH = "сделай этап живее и полезнее, сохранив его цель"
+
+
+def plain_stage_lines(lines: list[str], pattern: re.Pattern) -> list[tuple[int, str]]:
+    """Строки-заголовки этапов без markdown-разметки (жирное и решётки по краям снимаем)"""
+    starts = []
+    for i, line in enumerate(lines):
+        title = line.strip().strip("*#").strip().rstrip(":")
+        if title and len(title) <= MAX_STAGE_LINE and pattern.match(title):
+            starts.append((i, title))
+    return starts
+
+
+def split_sections(text: str) -> list[dict]:
+    """Делит план на этапы по заголовкам верхнего уровня структуры.
+
+    Уровень - самый крупный заголовок, встречающийся в плане хотя бы дважды
+    (один заголовок обычно - название всего плана). Если markdown-заголовков нет,
+    ищем строки вида "Этап 1. ...", затем строки с названием этапа ("Warm-up", "Practice"),
+    затем строки, целиком выделенные жирным. Текст до первого заголовка -
+    отдельный раздел. Возвращает [{"title", "start", "end"}] - границы в строках.
+    """
+    lines = text.split("\n")
+    headings = []  # (номер строки, уровень, заголовок)
+    for i, line in enumerate(lines):
+        match = HEADING.match(line)
+        if match:
+            headings.append((i, len(match.group(1)), match.group(2).strip("* ")))
+    levels = sorted({level for _, level, _ in headings})
+    level = next((lv for lv in levels if sum(1 for _, l, _ in headings if l == lv) >= 2), None)
+    if level is not None:
+        starts = [(i, title) for i, l, title in headings if l == level]
+    else:
+        candidates = (
+            plain_stage_lines(lines, STAGE_LINE),
+            plain_stage_lines(lines, STAGE_NAME),
+            [(i, m.group(1).strip()) for i, line in enumerate(lines) if (m := BOLD_LINE.match(line))],
+        )
+        starts = next((found for found in candidates if len(found) >= 2), [])
+
+    sections = []
+    if not starts or starts[0][0] > 0:
+        first = starts[0][0] if starts else len(lines)
+        if "\n".join(lines[:first]).strip():
+            sections.append({"title": INTRO_TITLE, "start": 0, "end": first})
+    for n, (start, title) in enumerate(starts):
+        end = starts[n + 1][0] if n + 1 < len(starts) else len(lines)
+        sections.append({"title": title, "start": start, "end": end})
+    return sections
+
+
+def stage_count(sections: list[dict]) -> int:
+    """Сколько найдено настоящих этапов (без текста до первого заголовка)"""
+    return sum(1 for section in sections if section["title"] != INTRO_TITLE)
+
+
+def section_labels(sections: list[dict]) -> list[str]:
+    """Подписи этапов для выпадающего списка"""
+    return [f"{n + 1}. {section['title']}" for n, section in enumerate(sections)]
+
+
+def find_section(text: str, label: str) -> Optional[tuple[list[dict], int]]:
+    """Находит этап по подписи из списка; None, если план изменился и подписи нет"""
+    sections = split_sections(text)
+    labels = section_labels(sections)
+    if label not in labels:
+        return None
+    return sections, labels.index(label)
+
+
+def section_text(text: str, section: dict) -> str:
+    return "\n".join(text.split("\n")[section["start"]:section["end"]])
+
+
+def replace_section(text: str, section: dict, new_text: str) -> str:
+    """Вклеивает новый текст этапа на место старого"""
+    lines = text.split("\n")
+    new_lines = new_text.strip("\n").split("\n")
+    # Сохраняем пустую строку-разделитель перед следующим этапом
+    if section["end"] < len(lines) and new_lines[-1].strip():
+        new_lines.append("")
+    return "\n".join(lines[:section["start"]] + new_lines + lines[section["end"]:])
+
+
+async def regenerate_section(client, text: str, label: str, wish: str, params_block: str, route: dict) -> str:
+    """Перегенерирует один этап плана и возвращает план целиком с новым этапом"""
+    found = find_section(text, label)
+    if found is None:
+        raise ValueError(f"этап не найден: {label}")
+    sections, index = found
+    if stage_count(sections) < 2:
+        # План не разбился на этапы - "этап" был бы всем планом, а его не уместить в max_output_tokens
+        raise ValueError("в плане не найдены этапы")
+    section = sections[index]
+
+    prompt = SECTION_PROMPT.format(
+        params_block=params_block,
+        outline="\n".join(section_labels(sections)),
+        section=section_text(text, section),
+        wish=(wish or "").strip() or DEFAULT_WISH,
+    )
+    request = dict(
+        input=[{"role": "user", "content": [{"type": "input_text", "text": prompt}]}],
+        model=route["model"],
+        max_output_tokens=4096,
+    )
+    if route.get("effort"):
+        # Один этап - небольшая задача, хватает низкого effort
+        request["reasoning"] = {"effort": "low"}
+
+    response = await client.responses.create(**request)
+    logging.info(f"Section regenerated: {label} ({response.usage.input_tokens} in / {response.usage.output_tokens} out)")
+    return replace_section(text, section, response.output_text)
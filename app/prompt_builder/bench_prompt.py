@@ -0,0 +1,149 @@
+"""Микробенчмарк сборки промптов: python -m app.prompt_builder.bench_prompt [N]
+
+Сравнивает build_prompt (f-строка, кэшированные комментарии возраста и уровня)
+с прежней реализацией build_prompt (вложенная clean_value, сборка списка частей,
+посимвольный разбор возраста при каждом вызове), перенесённой без изменений.
+Отдельно меряется блок параметров: в полном промпте основное время уходит
+на копирование статического префикса (~7 тыс. символов), одинаковое для обеих версий.
+"""
+import sys
+import random
+import timeit
+
+from app.prompt_builder.prompt import METHODOLOGY_TIPS, PROMPT_INTRO, build_params_block, build_prompt
+
+
+# --- Прежняя реализация (эталон для сравнения), перенесена как есть ---
+
+def legacy_build_prompt(params):
+    # с обработкой пустых значений
+    def clean_value(value, default):
+        if value is None:
+            return default
+        if isinstance(value, str) and value.strip() == '':
+            return default
+        return value
+
+    # Статический префикс: роль + советы по методике (общие для всех уроков с этой методикой)
+    methodology_advice = METHODOLOGY_TIPS.get(params['methodology'], "")
+    static_prefix = PROMPT_INTRO + methodology_advice
+
+    # Переменная часть: параметры конкретного занятия
+    prompt_base = [
+        f"""
+
+Параметры занятия:
+- УМК: {clean_value(params.get('textbook'), "попробуй определи визуально через логотипы, заголовки, структуру")}
+- Уровень УМК по CEFR: {clean_value(params.get('cefr'), "определи по сложности текста/упражнений или по названию учебника")}
+- Тема: {clean_value(params.get('topic'), "выяви через ключевые слова/изображения на странице")}
+- Цель: {clean_value(params.get('goal'), "сформулируй сам 'К концу урока ученики смогут...'")}
+- Возраст: {params['age']} лет (учти: {_legacy_age_group_comment(params['age'])})
+- Продолжительность: {params['duration']} мин
+- Количество учеников: {params['num_students']} чел
+- Методология занятия: {params['methodology']}
+- Соответствие класса (ученика) уровню учебника: {params['level_match']} ({_legacy_level_match_comment(params['level_match'])})
+- Target language: {params.get('target_language') or 'определи самостоятельно по загруженной странице'}
+- Оборудование/инвентарь: {params.get('inventory') or "стандартный класс + проектор"}
+"""
+    ]
+
+    # Добавляем дополнительную информацию ТОЛЬКО если она есть
+    if params.get('extra_info'):
+        prompt_base.append(f"- Дополнительная информация от учителя: {params['extra_info']}\n")
+    if params.get('hw_required'):
+        prompt_base.append("- Разработай домашнее задание, логично вытекающее из урока\n")
+
+    # Объединяем все части в одну строку
+    return static_prefix + "".join(prompt_base)
+
+
+def _legacy_level_match_comment(level):
+    comments = {
+        'ниже': "материал проще уровня учеников - добавь усложнённые элементы",
+        'на уровне': "материал соответствует уровню учеников",
+        'выше': "материал сложнее уровня учеников - предусмотри дополнительные объяснения",
+        'mixed': "в группе разные уровни - подготовь дифференцированные задания"
+    }
+    return comments.get(level, "учти соответствие уровня материала и учеников")
+
+
+def _legacy_age_group_comment(age):
+    try:
+        # Преобразуем в строку на случай, если возраст пришёл как число
+        age_str = str(age).strip()
+
+        # Удаляем все нецифровые символы, кроме разделителей (пробел, дефис, запятая)
+        cleaned = ''.join(c if c.isdigit() or c in ' -,' else ' ' for c in age_str)
+
+        # Разбиваем по возможным разделителям
+        for separator in ['-', ' ', ',']:
+            if separator in cleaned:
+                age_parts = cleaned.split(separator)
+                # Берём первый попавшийся числовой элемент
+                for part in age_parts:
+                    if part.strip().isdigit():
+                        age_int = int(part.strip())
+                        break
+                break
+        else:
+            # Если не нашли разделителей - пробуем преобразовать целиком
+            age_int = int(cleaned) if cleaned.isdigit() else 0
+
+        # Определяем возрастную группу
+        if 6 <= age_int <= 12:
+            return "дети: фокус на играх, движении, визуалах, коротких активностях"
+        elif 13 <= age_int <= 17:
+            return "подростки: актуальные темы (напр. соцсети, игры), групповые проекты, элемент соревнования"
+        elif age_int > 17:
+            return "взрослые: кейсы из реальной жизни, профессиональные контексты, дискуссии"
+        else:
+            return "дошкольники: игровое обучение, максимальная наглядность, частая смена деятельности"
+
+    except (ValueError, AttributeError, TypeError):
+        return "учти возрастные особенности группы"
+
+
+def legacy_params_block(params):
+    """Блок параметров прежней реализации: полный промпт без статического префикса"""
+    return legacy_build_prompt(params)[len(PROMPT_INTRO) + len(METHODOLOGY_TIPS.get(params['methodology'], "")):]
+
+
+def sample_params(n: int, seed: int = 0) -> list[dict]:
+    """Набор типичных запросов: повторяющиеся возрасты и уровни, как у реальных учителей"""
+    rnd = random.Random(seed)
+    return [
+        {
+            'methodology': rnd.choice(list(METHODOLOGY_TIPS)),
+            'target_language': rnd.choice(["", "Present Perfect", "food vocabulary"]),
+            'textbook': rnd.choice(["", "Spotlight 5", "English File Intermediate"]),
+            'cefr': rnd.choice(["", "A2", "B1"]),
+            'topic': rnd.choice(["", "Daily routines"]),
+            'goal': "",
+            'num_students': rnd.randint(1, 30),
+            # Без "Взрослые": прежняя версия падала на нём (UnboundLocalError)
+            'age': rnd.choice(["10-11", "12 лет", "14", "30", "7"]),
+            'level_match': rnd.choice(["ниже", "на уровне", "выше", "mixed"]),
+            'duration': rnd.choice([45, 60, 90]),
+            'inventory': "",
+            'hw_required': rnd.random() < 0.5,
+            'extra_info': rnd.choice(["", "Класс весёлый"]),
+        }
+        for _ in range(n)
+    ]
+
+
+def compare(label: str, legacy_fn, current_fn, batch: list[dict]) -> None:
+    legacy = min(timeit.repeat(lambda: [legacy_fn(p) for p in batch], number=1, repeat=7))
+    current = min(timeit.repeat(lambda: [current_fn(p) for p in batch], number=1, repeat=7))
+    print(f"{label}, {len(batch)} prompts: legacy {legacy * 1000:.1f} ms, "
+          f"current {current * 1000:.1f} ms, speedup x{legacy / current:.2f}")
+
+
+def main(n: int = 10_000) -> None:
+    batch = sample_params(n)
+    compare("params block", legacy_params_block, build_params_block, batch)
+    compare("full prompt", legacy_build_prompt, build_prompt, batch)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -1,100 +1,139 @@
-def build_prompt(params):
-    # с обработкой пустых значений
-    def clean_value(value, default):
-        if value is None:
-            return default
-        if isinstance(value, str) and value.strip() == '':
-            return default
-        return value
-
-    # Создаем базовый промпт как список строк
-    prompt_base = [
-        f"""
+import re
+from functools import lru_cache
+
+from app.prompt_builder.methodology import METHODOLOGY_DATA
+
+# Статическая часть промпта - одинаковая для всех запросов. Идёт первой, чтобы общий префикс
+# запросов был максимальным и провайдер мог переиспользовать его кэш (prompt caching).
+# Всё, что зависит от конкретного урока, добавляется только после неё.
+PROMPT_INTRO = """
 Ты — опытный ESL-методист. Ты помогаешь учителям составлять грамотные и интересные планы занятий.
 Разработай план урока на материале загруженной страницы учебника. Максимально опирайся на этот материал. 
-Перед тем как генерировать план, обдумай этапы урока по методологии {params['methodology']} с учетом всех вводных параметров занятия.
+Перед тем как генерировать план, обдумай этапы урока по методологии, указанной в параметрах занятия, с учетом всех вводных параметров занятия.
 Будь гибким: адаптируй идеи под реальный контекст занятия, проявляй педагогическое чутьё, не копируй механически структуру. Главная цель — сделать урок живым и полезным!
 На всех этапах урока используй материал страницы как основной источник. Указывай номера упражнений в плане.
 Используй в плане условные визуальные схемы при необходимости - например, если нужно что-то нарисовать на доске или какую-то таблицу вынести в тетрадь - приведи общий (для понимания сути) набросок в плане.
+"""
+
+
+HW_LINE = "- Разработай домашнее задание, логично вытекающее из урока\n"
+
+# Что подставить, если учитель оставил поле пустым
+DEFAULTS = {
+    'textbook': "попробуй определи визуально через логотипы, заголовки, структуру",
+    'cefr': "определи по сложности текста/упражнений или по названию учебника",
+    'topic': "выяви через ключевые слова/изображения на странице",
+    'goal': "сформулируй сам 'К концу урока ученики смогут...'",
+}
+
+
+def build_prompt(params, compact=False):
+    # Статический префикс (роль + советы по методике) собран заранее - см. STATIC_PREFIXES.
+    # compact=True - краткая сводка методики вместо полного блока советов (для экономии токенов).
+    # Общие фрагменты примеров зависят только от методики и уровня - ставим их до параметров,
+    # чтобы они входили в кэшируемый префикс (см. app/few_shot.py)
+    prefixes = COMPACT_PREFIXES if compact else STATIC_PREFIXES
+    return (prefixes.get(params['methodology'], PROMPT_INTRO) + (params.get('few_shot') or '')
+            + build_params_block(params))
+
+
+def build_params_block(params):
+    """Переменная часть промпта - параметры конкретного занятия"""
+    age = params['age']
+    level_match = params['level_match']
+    suffix = f"""
 
 Параметры занятия:
-- УМК: {clean_value(params.get('textbook'), "попробуй определи визуально через логотипы, заголовки, структуру")}
-- Уровень УМК по CEFR: {clean_value(params.get('cefr'), "определи по сложности текста/упражнений или по названию учебника")}
-- Тема: {clean_value(params.get('topic'), "выяви через ключевые слова/изображения на странице")}
-- Цель: {clean_value(params.get('goal'), "сформулируй сам 'К концу урока ученики смогут...'")}
-- Возраст: {params['age']} лет (учти: {_get_age_group_comment(params['age'])})
+- УМК: {clean_value(params.get('textbook'), DEFAULTS['textbook'])}
+- Уровень УМК по CEFR: {clean_value(params.get('cefr'), DEFAULTS['cefr'])}
+- Тема: {clean_value(params.get('topic'), DEFAULTS['topic'])}
+- Цель: {clean_value(params.get('goal'), DEFAULTS['goal'])}
+- Возраст: {age} лет (учти: {_get_age_group_comment(age)})
 - Продолжительность: {params['duration']} мин
 - Количество учеников: {params['num_students']} чел
 - Методология занятия: {params['methodology']}
-- Соответствие класса (ученика) уровню учебника: {params['level_match']} ({_get_level_match_comment(params['level_match'])})
+- Соответствие класса (ученика) уровню учебника: {level_match} ({_get_level_match_comment(level_match)})
 - Target language: {params.get('target_language') or 'определи самостоятельно по загруженной странице'}
 - Оборудование/инвентарь: {params.get('inventory') or "стандартный класс + проектор"}
-
 """
-    ]
 
+    # Справка каталога об УМК - если учебник узнан (см. fill_from_catalogue в main.py)
+    if params.get('textbook_info'):
+        suffix += f"- УМК по каталогу: {params['textbook_info']}\n"
     # Добавляем дополнительную информацию ТОЛЬКО если она есть
     if params.get('extra_info'):
-        prompt_base.append(f"- Дополнительная информация от учителя: {params['extra_info']}\n")
+        suffix += f"- Дополнительная информация от учителя: {params['extra_info']}\n"
     if params.get('hw_required'):
-        prompt_base.append("- Разработай домашнее задание, логично вытекающее из урока\n")
-
-    # Объединяем все части в одну строку
-    base_prompt = "".join(prompt_base)
-
-    # Добавляем советы по методике
-    methodology_advice = METHODOLOGY_TIPS.get(params['methodology'], "")
-
-    return base_prompt + methodology_advice
+        suffix += HW_LINE
+    # Фрагменты локальной базы знаний (методика, примеры планов) - см. app/retrieval.py
+    if params.get('kb_context'):
+        suffix += params['kb_context']
+    # Этап из примеров планов под target language этого урока - см. app/few_shot.py
+    if params.get('few_shot_tl'):
+        suffix += params['few_shot_tl']
+    # Текстовое описание страницы - когда вместо изображения используется сохранённый анализ
+    if params.get('page_description'):
+        suffix += params['page_description']
+    # Текст страницы, распознанный локальным OCR - см. app/ocr.py
+    if params.get('page_text'):
+        suffix += params['page_text']
+    return suffix
+
+
+def clean_value(value, default):
+    """Подставляет значение по умолчанию вместо None и пустых строк"""
+    if value is None:
+        return default
+    if isinstance(value, str) and value.strip() == '':
+        return default
+    return value
 
 
 def is_empty_or_whitespace(text):
     """Проверяет, является ли текст пустым или содержит только пробельные символы"""
     return text is None or (isinstance(text, str) and text.strip() == '')
 
+
+LEVEL_MATCH_COMMENTS = {
+    'ниже': "материал проще уровня учеников - добавь усложнённые элементы",
+    'на уровне': "материал соответствует уровню учеников",
+    'выше': "материал сложнее уровня учеников - предусмотри дополнительные объяснения",
+    'mixed': "в группе разные уровни - подготовь дифференцированные задания"
+}
+
+
+@lru_cache(maxsize=64)
 def _get_level_match_comment(level):
-    comments = {
-        'ниже': "материал проще уровня учеников - добавь усложнённые элементы",
-        'на уровне': "материал соответствует уровню учеников",
-        'выше': "материал сложнее уровня учеников - предусмотри дополнительные объяснения",
-        'mixed': "в группе разные уровни - подготовь дифференцированные задания"
-    }
-    return comments.get(level, "учти соответствие уровня материала и учеников")
+    return LEVEL_MATCH_COMMENTS.get(level, "учти соответствие уровня материала и учеников")
+
+
+AGE_NUMBER = re.compile(r"\d+")
+
 
 def _get_age_group_comment(age):
-    try:
-        # Преобразуем в строку на случай, если возраст пришёл как число
-        age_str = str(age).strip()
-
-        # Удаляем все нецифровые символы, кроме разделителей (пробел, дефис, запятая)
-        cleaned = ''.join(c if c.isdigit() or c in ' -,' else ' ' for c in age_str)
-
-        # Разбиваем по возможным разделителям
-        for separator in ['-', ' ', ',']:
-            if separator in cleaned:
-                age_parts = cleaned.split(separator)
-                # Берём первый попавшийся числовой элемент
-                for part in age_parts:
-                    if part.strip().isdigit():
-                        age_int = int(part.strip())
-                        break
-                break
-        else:
-            # Если не нашли разделителей - пробуем преобразовать целиком
-            age_int = int(cleaned) if cleaned.isdigit() else 0
-
-        # Определяем возрастную группу
-        if 6 <= age_int <= 12:
-            return "дети: фокус на играх, движении, визуалах, коротких активностях"
-        elif 13 <= age_int <= 17:
-            return "подростки: актуальные темы (напр. соцсети, игры), групповые проекты, элемент соревнования"
-        elif age_int > 17:
-            return "взрослые: кейсы из реальной жизни, профессиональные контексты, дискуссии"
-        else:
-            return "дошкольники: игровое обучение, максимальная наглядность, частая смена деятельности"
-
-    except (ValueError, AttributeError, TypeError):
-        return "учти возрастные особенности группы"
+    # Нормализуем вход (число или строка) и классифицируем через кэш
+    return _classify_age(str(age).strip().lower())
+
+
+@lru_cache(maxsize=512)
+def _classify_age(age_str):
+    # "Взрослые" приходит вместо возраста, когда отмечен чекбокс
+    if age_str.startswith("взросл"):
+        return "взрослые: кейсы из реальной жизни, профессиональные контексты, дискуссии"
+
+    # Берём первое число из строки ("10-11", "12 лет", "13, 14")
+    match = AGE_NUMBER.search(age_str)
+    age_int = int(match.group()) if match else 0
+
+    # Определяем возрастную группу
+    if 6 <= age_int <= 12:
+        return "дети: фокус на играх, движении, визуалах, коротких активностях"
+    elif 13 <= age_int <= 17:
+        return "подростки: актуальные темы (напр. соцсети, игры), групповые проекты, элемент соревнования"
+    elif age_int > 17:
+        return "взрослые: кейсы из реальной жизни, профессиональные контексты, дискуссии"
+    else:
+        return "дошкольники: игровое обучение, максимальная наглядность, частая смена деятельности"
 
 
 
@@ -213,6 +252,22 @@ METHODOLOGY_TIPS = {
     """
 }
 
+# Статические префиксы для каждой методики собираются один раз при импорте
+STATIC_PREFIXES = {name: PROMPT_INTRO + tips for name, tips in METHODOLOGY_TIPS.items()}
+
+
+def _methodology_summary(name):
+    # "PPP (Presentation-Practice-Production)" -> METHODOLOGY_DATA["PPP"]
+    data = METHODOLOGY_DATA.get(name.split()[0])
+    if not data:
+        return ""
+    points = "\n".join(f"- {point}" for point in data["key_points"])
+    return f"\n[МЕТОДИКА {name}]\n{data['structure']}\n{points}\n"
+
+
+# Сокращённые префиксы - когда полный блок советов не помещается в бюджет токенов
+COMPACT_PREFIXES = {name: PROMPT_INTRO + _methodology_summary(name) for name in METHODOLOGY_TIPS}
+
 
 
 
@@ -0,0 +1,49 @@
+import math
+import asyncio
+from collections import deque
+
+
+class GenerationLoad:
+    """Очередь генерации: не больше concurrency заявок одновременно, остальные ждут слота.
+
+    Счётчики меняет только сам обработчик (enqueue -> start -> finish, либо cancel), поэтому
+    отменённая заявка (закрыли вкладку) сразу уходит из очереди. Недавние длительности - для оценки ожидания.
+    """
+
+    def __init__(self, concurrency: int, max_waiting: int, history: int = 20):
+        self.concurrency = concurrency
+        self.max_waiting = max_waiting
+        self.latencies = deque(maxlen=history)
+        self.active = 0
+        self.waiting = 0
+        self._slots = asyncio.Semaphore(concurrency)
+
+    def average_latency(self) -> float:
+        """Средняя длительность последних генераций (по умолчанию - 60 с)"""
+        return sum(self.latencies) / len(self.latencies) if self.latencies else 60.0
+
+    def enqueue(self) -> tuple[int, float]:
+        """Ставит заявку в очередь и возвращает (позиция, ожидание в секундах); при переполнении - OverflowError"""
+        if self.waiting >= self.max_waiting:
+            raise OverflowError("generation queue is full")
+        self.waiting += 1
+        # Сколько заявок должно завершиться, прежде чем освободится слот для этой
+        position = max(0, self.waiting + self.active - self.concurrency)
+        wait = math.ceil(position / self.concurrency) * self.average_latency() if position else 0.0
+        return position, wait
+
+    async def start(self) -> None:
+        """Ждёт свободный слот; при отмене во время ожидания заявка остаётся в очереди - снять через cancel()"""
+        await self._slots.acquire()
+        self.waiting -= 1
+        self.active += 1
+
+    def cancel(self) -> None:
+        """Заявка ушла из очереди, не дождавшись слота"""
+        self.waiting = max(0, self.waiting - 1)
+
+    def finish(self, duration: float) -> None:
+        """Обработка завершена - освобождаем слот и запоминаем длительность"""
+        self.active = max(0, self.active - 1)
+        self._slots.release()
+        self.latencies.append(duration)
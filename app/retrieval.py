@@ -0,0 +1,276 @@
+import os
+import re
+import sys
+import json
+import math
+import mmap
+import hashlib
+import logging
+from collections import Counter, defaultdict
+from typing import Optional
+
+# Локальный поиск по базе знаний (app/knowledge_base): заметки по методике, советы, чек-листы,
+# примеры планов. Индекс BM25 - в процессе, без удалённого vector store: готовый с диска
+# (собирается python -m app.kb_indexer в KB_INDEX_DIR) или, если его нет или он устарел, - при старте.
+# KB_RETRIEVAL=0 - отключить; KB_TOP_K - сколько фрагментов добавлять в промпт
+KB_RETRIEVAL = os.getenv("KB_RETRIEVAL", "1") != "0"
+KB_DIR = os.path.join(os.path.dirname(__file__), "knowledge_base")
+KB_INDEX_DIR = os.getenv("KB_INDEX_DIR", os.path.join(KB_DIR, ".index"))
+KB_TOP_K = int(os.getenv("KB_TOP_K", 3))
+CHUNK_CHARS = 900  # примерный размер фрагмента
+MIN_SCORE = 1.0  # слабее - не добавляем, чтобы не засорять промпт
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Индексируем только методические материалы (явный список): в папке лежат и заметки разработчиков
+# (test.md - проверки промпта, test_samples - входы/выходы модели), в промпт им попадать нельзя.
+# Примеры планов (LP_shots.py) сюда не входят - их по этапам подбирает app/few_shot.py
+KB_FILES = ("Methods.md", "check_list.md", "inspire.md", "tips.md")
+# Заметки разработчиков внутри методических файлов - в HTML-комментариях, они не индексируются
+DEV_NOTE = re.compile(r"<!--.*?-->", re.S)
+
+# Файлы индекса на диске
+INDEX_VERSION = 2
+LEXICON_FILE = "lexicon.json"  # словарь, метаданные фрагментов, sha256 файлов базы
+POSTINGS_FILE = "postings.u32"
+LENGTHS_FILE = "lengths.u32"
+TEXTS_FILE = "texts.bin"
+MANIFEST_FILE = "manifest.json"  # хэши файлов и их фрагменты - для пересборки только изменённого
+
+WORD = re.compile(r"[a-zа-яё]+|\d+")
+STOP_WORDS = {
+    "и", "в", "во", "на", "с", "со", "по", "к", "о", "об", "от", "до", "из", "за", "для", "не", "что", "как",
+    "это", "или", "а", "но", "то", "же", "ли", "бы", "их", "он", "она", "они", "мы", "вы", "ты", "я", "все",
+    "the", "a", "an", "and", "or", "of", "to", "in", "on", "for", "is", "are", "be", "with", "it", "at", "by",
+}
+METHODOLOGIES = ("ppp", "ttt")
+
+
+def stem(word: str) -> str:
+    """Грубая нормализация словоформ: обрезаем длинные слова (учеников/ученики -> учени)"""
+    return word[:5] if len(word) > 5 and not word.isdigit() else word
+
+
+def tokenize(text: str) -> list[str]:
+    return [stem(w) for w in WORD.findall(text.lower().replace("ё", "е")) if w not in STOP_WORDS]
+
+
+def split_chunks(text: str, size: int = CHUNK_CHARS) -> list[str]:
+    """Режет текст на фрагменты по абзацам, не длиннее size (длинный абзац - отдельным фрагментом)"""
+    chunks, current = [], ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) > size:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def kb_files(kb_dir: str = KB_DIR) -> list[str]:
+    """Файлы базы знаний из KB_FILES, которые есть в kb_dir"""
+    return [source for source in KB_FILES if os.path.isfile(os.path.join(kb_dir, source))]
+
+
+def file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def read_file(source: str, kb_dir: str = KB_DIR) -> list[tuple[str, str]]:
+    """Документы одного файла: [(источник, текст)] без заметок разработчиков"""
+    with open(os.path.join(kb_dir, source), "r", encoding="utf-8") as f:
+        return [(source, DEV_NOTE.sub("", f.read()))]
+
+
+def read_documents(kb_dir: str = KB_DIR) -> list[tuple[str, str]]:
+    return [document for source in kb_files(kb_dir) for document in read_file(source, kb_dir)]
+
+
+def chunk_document(source: str, text: str) -> list[dict]:
+    """Фрагменты документа: {"source", "text", "methodologies", "terms": {слово: частота}}"""
+    chunks = []
+    for chunk in split_chunks(text):
+        tokens = tokenize(chunk)
+        if tokens:
+            chunks.append({
+                "source": source,
+                "text": chunk,
+                "methodologies": sorted({m for m in METHODOLOGIES if m in tokens}),
+                "terms": dict(Counter(tokens)),
+            })
+    return chunks
+
+
+class KnowledgeIndex:
+    """BM25 по фрагментам базы знаний (индекс в памяти)"""
+
+    def __init__(self, chunks: list[dict]):
+        self.chunks = [{key: chunk[key] for key in ("source", "text", "methodologies")} for chunk in chunks]
+        self.tags = [set(chunk["methodologies"]) for chunk in chunks]
+        self.lengths = [sum(chunk["terms"].values()) for chunk in chunks]
+        self.postings = defaultdict(list)  # слово -> [(номер фрагмента, частота)]
+        for i, chunk in enumerate(chunks):
+            for token, tf in chunk["terms"].items():
+                self.postings[token].append((i, tf))
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+    @classmethod
+    def from_documents(cls, documents: list[tuple[str, str]]) -> "KnowledgeIndex":
+        return cls([chunk for source, text in documents for chunk in chunk_document(source, text)])
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def postings_for(self, token: str):
+        return self.postings.get(token, ())
+
+    def document_frequency(self, token: str) -> int:
+        return len(self.postings.get(token, ()))
+
+    def chunk(self, i: int) -> dict:
+        return self.chunks[i]
+
+    def idf(self, token: str) -> float:
+        df = self.document_frequency(token)
+        return math.log(1 + (len(self) - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = KB_TOP_K, methodology: Optional[str] = None) -> list[dict]:
+        """Лучшие k фрагментов по BM25; фрагменты только про другую методику пропускаем"""
+        scores = defaultdict(float)
+        for token in set(tokenize(query)):
+            idf = self.idf(token)
+            for i, tf in self.postings_for(token):
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[i] / self.avg_length)
+                scores[i] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        results = []
+        for i in sorted(scores, key=scores.get, reverse=True):
+            if scores[i] < MIN_SCORE or len(results) >= k:
+                break
+            tags = self.tags[i]
+            if methodology and tags and methodology not in tags:
+                continue
+            results.append({**self.chunk(i), "score": scores[i]})
+        return results
+
+
+class MappedKnowledgeIndex(KnowledgeIndex):
+    """Индекс, собранный python -m app.kb_indexer: списки вхождений, длины фрагментов и тексты
+    читаются из файлов через mmap без копирования; в память грузится только словарь (lexicon.json)"""
+
+    def __init__(self, index_dir: str = KB_INDEX_DIR):
+        with open(os.path.join(index_dir, LEXICON_FILE), "r", encoding="utf-8") as f:
+            lexicon = json.load(f)
+        if lexicon.get("version") != INDEX_VERSION or lexicon.get("byteorder") != sys.byteorder:
+            raise ValueError("index format mismatch, rebuild with python -m app.kb_indexer")
+        self.files = lexicon["files"]
+        self.terms = lexicon["terms"]  # слово -> [начало, число вхождений]
+        self.meta = lexicon["chunks"]  # [источник, методики, смещение текста, длина текста]
+        self.tags = [set(tags) for _, tags, _, _ in self.meta]
+        self.avg_length = lexicon["avg_length"]
+        self._maps = []
+        # (номер фрагмента, частота) парами подряд; по словам - в порядке lexicon["terms"]
+        self._postings = self._map(os.path.join(index_dir, POSTINGS_FILE), "I")
+        self.lengths = self._map(os.path.join(index_dir, LENGTHS_FILE), "I")
+        self._texts = self._map(os.path.join(index_dir, TEXTS_FILE), "B")
+
+    def _map(self, path: str, fmt: str) -> memoryview:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return memoryview(b"").cast(fmt)
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mm)
+        return memoryview(mm).cast(fmt)
+
+    def __len__(self) -> int:
+        return len(self.meta)
+
+    def postings_for(self, token: str):
+        entry = self.terms.get(token)
+        if entry is None:
+            return ()
+        start, count = entry
+        pairs = self._postings[2 * start:2 * (start + count)]
+        return zip(pairs[0::2], pairs[1::2])
+
+    def document_frequency(self, token: str) -> int:
+        entry = self.terms.get(token)
+        return entry[1] if entry else 0
+
+    def chunk(self, i: int) -> dict:
+        source, tags, offset, length = self.meta[i]
+        text = bytes(self._texts[offset:offset + length]).decode("utf-8")
+        return {"source": source, "text": text, "methodologies": tags}
+
+    def is_fresh(self, kb_dir: str = KB_DIR) -> bool:
+        """Те же файлы с тем же содержимым (sha256), что при сборке; база маленькая - хэши считаются быстро"""
+        current = {source: file_hash(os.path.join(kb_dir, source)) for source in kb_files(kb_dir)}
+        return current == self.files
+
+
+def methodology_key(methodology: str) -> Optional[str]:
+    """ "PPP (Presentation-Practice-Production)" -> "ppp" """
+    key = str(methodology or "").split(" ")[0].lower()
+    return key if key in METHODOLOGIES else None
+
+
+def build_query(params: dict) -> str:
+    """Запрос к базе знаний по параметрам занятия: методика, уровень, тема, цель, целевой язык"""
+    fields = ("cefr", "topic", "goal", "target_language")
+    return " ".join([methodology_key(params.get("methodology")) or ""] + [str(params.get(name) or "") for name in fields])
+
+
+def retrieve_context(params: dict, k: int = KB_TOP_K) -> str:
+    """Текст для промпта из k самых подходящих фрагментов; пустая строка, если ничего не нашлось"""
+    index = get_index()
+    if index is None:
+        return ""
+    results = index.search(build_query(params), k, methodology_key(params.get("methodology")))
+    if not results:
+        return ""
+    logging.info("KB context: " + ", ".join(f"{r['source']} ({r['score']:.1f})" for r in results))
+    parts = [f"[{r['source']}]\n{r['text']}" for r in results]
+    return (
+        "\nМатериалы методической базы (ориентир, не копируй дословно):\n"
+        + "\n---\n".join(parts) + "\n"
+    )
+
+
+def load_index() -> Optional[KnowledgeIndex]:
+    """Готовый индекс с диска, если он актуален; иначе сборка в памяти"""
+    if not KB_RETRIEVAL:
+        return None
+    if os.path.exists(os.path.join(KB_INDEX_DIR, LEXICON_FILE)):
+        try:
+            index = MappedKnowledgeIndex(KB_INDEX_DIR)
+            if index.is_fresh():
+                logging.info(f"Knowledge base index loaded from {KB_INDEX_DIR}: {len(index)} chunks")
+                return index
+            logging.warning("Knowledge base changed since the index was built - run python -m app.kb_indexer")
+        except (OSError, ValueError) as e:
+            logging.error(f"Knowledge base index load error: {e}")
+    try:
+        index = KnowledgeIndex.from_documents(read_documents())
+    except Exception as e:
+        logging.error(f"Knowledge base index error: {e}")
+        return None
+    logging.info(f"Knowledge base indexed: {len(index)} chunks, {len(index.postings)} terms")
+    return index
+
+
+_index = None
+_index_loaded = False
+
+
+def get_index() -> Optional[KnowledgeIndex]:
+    """Индекс загружается при первом обращении (индексатору, импортирующему модуль, он не нужен)"""
+    global _index, _index_loaded
+    if not _index_loaded:
+        _index = load_index()
+        _index_loaded = True
+    return _index
@@ -0,0 +1,119 @@
+import os
+import json
+import logging
+import threading
+from typing import Optional
+
+# Маршрутизация: модель и reasoning effort выбираются по сложности запроса.
+# Правила проверяются по порядку, срабатывает первое подходящее; последнее - без условий.
+# Свои правила можно задать JSON-файлом ROUTING_RULES_FILE в том же формате.
+DEFAULT_RULES = [
+    {
+        # Короткое занятие, почти всё заполнено учителем, без поиска - хватит низкого effort
+        "name": "light",
+        "when": {"max_duration": 45, "max_inferred": 1, "web_search": False},
+        "model": "o4-mini",
+        "effort": "low",
+    },
+    {
+        "name": "default",
+        "when": {},
+        "model": "o4-mini",
+        "effort": "medium",
+    },
+]
+
+# Цены, $ за 1M токенов: (вход, вход из кэша, выход)
+PRICES = {
+    "o4-mini": (1.10, 0.275, 4.40),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+}
+
+# Поля, которые модели придётся определить самой, если учитель их не заполнил
+INFERABLE_FIELDS = ("textbook", "cefr", "topic", "goal", "target_language")
+
+
+def load_rules() -> list[dict]:
+    path = os.getenv("ROUTING_RULES_FILE")
+    if not path:
+        return DEFAULT_RULES
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.error(f"Не удалось прочитать правила маршрутизации {path}: {e}")
+        return DEFAULT_RULES
+
+
+RULES = load_rules()
+
+
+def count_inferred(params: dict) -> int:
+    """Сколько полей модель должна вывести сама"""
+    return sum(1 for name in INFERABLE_FIELDS if not str(params.get(name) or "").strip())
+
+
+def _matches(when: dict, features: dict) -> bool:
+    if "max_duration" in when and features["duration"] > when["max_duration"]:
+        return False
+    if "min_duration" in when and features["duration"] < when["min_duration"]:
+        return False
+    if "max_inferred" in when and features["inferred"] > when["max_inferred"]:
+        return False
+    if "min_inferred" in when and features["inferred"] < when["min_inferred"]:
+        return False
+    if "format_type" in when and features["format_type"] != when["format_type"]:
+        return False
+    if "web_search" in when and features["web_search"] != when["web_search"]:
+        return False
+    return True
+
+
+def choose_route(params: dict) -> dict:
+    """Выбирает маршрут по параметрам формы: {"name", "model", "effort"}"""
+    features = {
+        "duration": int(params.get("duration") or 0),
+        "format_type": params.get("format_type"),
+        "web_search": bool(params.get("web_search")),
+        "inferred": count_inferred(params),
+    }
+    for rule in RULES:
+        if _matches(rule.get("when", {}), features):
+            route = {"name": rule["name"], "model": rule["model"], "effort": rule.get("effort")}
+            logging.info(f"Route {route['name']}: {route['model']}/{route['effort']} for {features}")
+            return route
+    return {"name": "fallback", "model": "o4-mini", "effort": "medium"}
+
+
+def estimate_cost(model: str, usage) -> Optional[float]:
+    """Стоимость запроса в $ по фактическому usage; None, если цены модели неизвестны"""
+    prices = PRICES.get(model)
+    if prices is None or usage is None:
+        return None
+    details = getattr(usage, "input_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) or 0
+    price_in, price_cached, price_out = prices
+    return ((usage.input_tokens - cached) * price_in + cached * price_cached
+            + usage.output_tokens * price_out) / 1_000_000
+
+
+_stats = {}  # имя маршрута -> {"count", "latency", "cost"}
+_stats_lock = threading.Lock()
+
+
+def record(route: dict, latency: float, usage) -> None:
+    """Копит и пишет в лог латентность и стоимость по маршруту"""
+    cost = estimate_cost(route["model"], usage)
+    with _stats_lock:
+        stats = _stats.setdefault(route["name"], {"count": 0, "latency": 0.0, "cost": 0.0})
+        stats["count"] += 1
+        stats["latency"] += latency
+        stats["cost"] += cost or 0.0
+        count, avg_latency, avg_cost = stats["count"], stats["latency"] / stats["count"], stats["cost"] / stats["count"]
+    cost_text = f"${cost:.4f}" if cost is not None else "n/a"
+    logging.info(
+        f"Route {route['name']} ({route['model']}/{route['effort']}): latency {latency:.1f}s, cost {cost_text}; "
+        f"avg over {count}: {avg_latency:.1f}s, ${avg_cost:.4f}"
+    )
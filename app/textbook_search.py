@@ -0,0 +1,119 @@
+import re
+from bisect import bisect_left
+from collections import defaultdict
+from functools import lru_cache
+
+from app.knowledge_base.textbooks import TEXTBOOKS
+
+# Поиск учебника по введённому тексту: опечатки ("spotlite 6"), сокращения уровней ("EF int"),
+# аббревиатуры серий ("nef", "ff 3"). Индекс строится один раз при импорте.
+LEVEL_WORDS = {
+    "starter", "beginner", "elementary", "pre", "intermediate", "upper", "advanced", "proficiency",
+    "a1", "a2", "b1", "b2", "c1", "c2",
+}
+STOP_WORDS = {"and", "for", "in", "of", "the"}
+TOKEN = re.compile(r"[a-zа-яё0-9]+\+?")
+MIN_SIMILARITY = 0.5  # порог похожести слов по биграммам (коэффициент Дайса)
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN.findall(text.lower().replace("ё", "е"))
+
+
+def bigrams(word: str) -> set[str]:
+    padded = f" {word} "
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+def series_acronyms(tokens: list[str]) -> set[str]:
+    """Аббревиатуры серии по словам до уровня: English File -> ef, Family and Friends -> ff, faf"""
+    series = []
+    for token in tokens:
+        if token in LEVEL_WORDS or token[0].isdigit():
+            break
+        series.append(token)
+    if len(series) < 2:
+        return set()
+    return {
+        "".join(t[0] for t in series),
+        "".join(t[0] for t in series if t not in STOP_WORDS),
+    }
+
+
+class TextbookIndex:
+    """Инвертированный индекс по словам названий + биграммный индекс словаря для нечёткого поиска"""
+
+    def __init__(self, titles: list[str]):
+        self.titles = list(titles)
+        self.title_tokens = []  # слова каждого названия (без аббревиатур) - для штрафа за лишние слова
+        self.postings = defaultdict(set)  # слово -> номера названий
+        for i, title in enumerate(self.titles):
+            tokens = tokenize(title)
+            self.title_tokens.append(set(tokens))
+            for token in set(tokens) | series_acronyms(tokens):
+                self.postings[token].add(i)
+
+        self.vocabulary = sorted(self.postings)
+        self.bigram_index = defaultdict(set)  # биграмма -> слова словаря
+        for word in self.vocabulary:
+            for gram in bigrams(word):
+                self.bigram_index[gram].add(word)
+        # Кэш сопоставления слов зависит от словаря конкретного индекса
+        self.match_token = lru_cache(maxsize=4096)(self._match_token)
+
+    def _match_token(self, query_token: str) -> tuple[tuple[str, float], ...]:
+        """Слова словаря, похожие на слово запроса, с оценкой 0..1"""
+        matches = {}
+        if query_token in self.postings:
+            matches[query_token] = 1.0
+        # Префикс: пользователь ещё печатает слово ("spotl", "int")
+        start = bisect_left(self.vocabulary, query_token)
+        for word in self.vocabulary[start:]:
+            if not word.startswith(query_token):
+                break
+            matches.setdefault(word, 0.9)
+        # Опечатки: похожесть по биграммам; цифры и короткие слова - только точно/по префиксу
+        if len(query_token) >= 4 and not query_token.isdigit():
+            grams = bigrams(query_token)
+            candidates = set().union(*(self.bigram_index.get(g, ()) for g in grams))
+            for word in candidates:
+                if word in matches:
+                    continue
+                word_grams = bigrams(word)
+                similarity = 2 * len(grams & word_grams) / (len(grams) + len(word_grams))
+                if similarity >= MIN_SIMILARITY:
+                    matches[word] = 0.8 * similarity
+        return tuple(matches.items())
+
+    def search(self, query: str, limit: int = 8) -> list[str]:
+        """Подходящие названия, лучшие первыми; каждое слово запроса должно с чем-то совпасть"""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        scores = None
+        for token in tokens:
+            token_scores = defaultdict(float)
+            for word, score in self.match_token(token):
+                for i in self.postings[word]:
+                    token_scores[i] = max(token_scores[i], score)
+            if scores is None:
+                scores = dict(token_scores)
+            else:
+                scores = {i: s + token_scores[i] for i, s in scores.items() if i in token_scores}
+            if not scores:
+                return []
+
+        def rank(i):
+            # Больше совпадений - выше; при равенстве - меньше лишних слов, затем порядок каталога
+            extra_words = len(self.title_tokens[i]) - len(tokens)
+            return -scores[i], extra_words, i
+
+        return [self.titles[i] for i in sorted(scores, key=rank)[:limit]]
+
+
+textbook_index = TextbookIndex(TEXTBOOKS)
+
+
+def suggest_textbooks(query: str, limit: int = 8) -> list[str]:
+    return textbook_index.search(query, limit)
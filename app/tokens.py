@@ -0,0 +1,101 @@
+import os
+import logging
+from typing import Optional
+
+from app.image_prep import estimate_image_tokens
+from app.prompt_builder.prompt import build_prompt
+
+# Учёт токенов: оценка входа до отправки, сверка с фактическим usage из ответа
+INPUT_TOKEN_BUDGET = int(os.getenv("INPUT_TOKEN_BUDGET", 12000))
+# INPUT_TOKEN_BUDGET_STRICT=1 - не отправлять запрос, который и после всех уступок не укладывается в бюджет
+BUDGET_STRICT = os.getenv("INPUT_TOKEN_BUDGET_STRICT", "0") == "1"
+EXTRA_INFO_MAX_CHARS = 400  # до скольких символов урезаем комментарий учителя при нехватке бюджета
+# Что убираем из промпта на шагах kb_context и few_shot
+DROPPABLE = {"kb_context": ("kb_context",), "few_shot": ("few_shot", "few_shot_tl")}
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken не установлен или нет доступа к файлам кодировки
+    _encoding = None
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Оценивает число токенов текста: точно через tiktoken, иначе по числу символов"""
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    # o200k: латиница ~4 символа на токен, кириллица ~3
+    ascii_chars = sum(1 for c in text if c.isascii())
+    return round(ascii_chars / 4 + (len(text) - ascii_chars) / 3)
+
+
+def estimate_request(prompt: str, image_sizes: list[Optional[tuple[int, int]]], model: str, detail: str) -> dict:
+    """Оценка входных токенов запроса: текст + изображения"""
+    text_tokens = estimate_text_tokens(prompt)
+    image_tokens = sum(estimate_image_tokens(*size, model, detail) for size in image_sizes if size)
+    return {"text": text_tokens, "image": image_tokens, "total": text_tokens + image_tokens, "detail": detail}
+
+
+def fit_to_budget(lesson_params: dict, prompt: str, image_sizes: list[Optional[tuple[int, int]]], model: str,
+                  budget: int = INPUT_TOKEN_BUDGET, detail: str = "high") -> tuple[str, str, dict]:
+    """Подгоняет запрос под бюджет входных токенов, поочерёдно отключая необязательное.
+
+    Шаги: убрать фрагменты базы знаний -> убрать фрагменты примеров планов -> урезать доп. информацию от учителя -> краткая сводка
+    методики вместо полного блока советов -> изображения в detail=low (патчевым моделям - уменьшенные, см.
+    image_prep.fit_size). detail - исходный (low, если страницу уже прочитал OCR). Возвращает (промпт, detail,
+    оценка); estimate["over_budget"] - не уложились даже после всех шагов.
+    """
+    estimate = estimate_request(prompt, image_sizes, model, detail)
+    estimate.update(budget=budget, over_budget=False)
+    if estimate["total"] <= budget:
+        return prompt, detail, estimate
+
+    params = dict(lesson_params)
+    compact = False
+    downgrades = []
+    steps = ("kb_context", "few_shot", "extra_info", "compact", "detail")
+    for step in steps:
+        if step in DROPPABLE:
+            if not any(params.get(key) for key in DROPPABLE[step]):
+                continue
+            params.update(dict.fromkeys(DROPPABLE[step], ""))
+        elif step == "extra_info":
+            extra = params.get("extra_info") or ""
+            if len(extra) <= EXTRA_INFO_MAX_CHARS:
+                continue
+            params["extra_info"] = extra[:EXTRA_INFO_MAX_CHARS] + "…"
+        elif step == "compact":
+            compact = True
+        elif step == "detail":
+            if detail == "low":
+                continue
+            detail = "low"
+        downgrades.append(step)
+        prompt = build_prompt(params, compact=compact)
+        estimate = estimate_request(prompt, image_sizes, model, detail)
+        if estimate["total"] <= budget:
+            break
+
+    logging.warning(
+        f"Token budget {budget} exceeded, downgraded: {', '.join(downgrades) or 'nothing to drop'}; "
+        f"estimate now {estimate['total']}"
+    )
+    estimate["downgrades"] = downgrades
+    estimate.update(budget=budget, over_budget=estimate["total"] > budget)
+    return prompt, detail, estimate
+
+
+def log_usage(usage, estimate: Optional[dict] = None) -> None:
+    """Пишет в лог оценку и фактический расход токенов, в т.ч. попадания в кэш промпта провайдера"""
+    if usage is None:
+        return
+    details = getattr(usage, "input_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) or 0
+    share = cached / usage.input_tokens if usage.input_tokens else 0
+    estimated = ""
+    if estimate:
+        estimated = f" [estimated {estimate['total']} = text {estimate['text']} + image {estimate['image']}]"
+    logging.info(
+        f"Usage: input={usage.input_tokens} (cached={cached}, {share:.0%}){estimated}, "
+        f"output={usage.output_tokens}"
+    )
@@ -0,0 +1,57 @@
+"""Синтетические страницы учебника и их "фото" для тестов обработки изображений"""
+import io
+import random
+
+from PIL import Image, ImageDraw, ImageEnhance, ImageFont
+
+WORDS = ("listen read repeat the school friend family house morning match write answer "
+         "questions about picture dialogue complete sentences with words from box holiday").split()
+
+
+def page(seed: int, layout: int = 0) -> Image.Image:
+    """Синтетическая страница учебника: шапка, две колонки текста, картинки; layout - шаблон вёрстки"""
+    text, blocks = random.Random(seed), random.Random(layout)
+    font = ImageFont.load_default(size=22)
+    img = Image.new("RGB", (1240, 1754), "white")
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((0, 0, 1240, 140), fill=(80, 120, 200))
+    draw.text((60, 40), f"Module {text.randrange(1, 10)}", font=ImageFont.load_default(size=40), fill="white")
+    y = 190
+    while y < 1600:
+        kind = blocks.choice(["text", "text", "pic"])
+        for x in (60, 650):
+            if kind == "pic":
+                draw.rectangle((x, y, x + 530, y + 260), fill=tuple(text.randrange(256) for _ in range(3)))
+                for _ in range(5):
+                    cx, cy = x + text.randrange(530), y + text.randrange(260)
+                    draw.ellipse((cx - 40, cy - 40, cx + 40, cy + 40), fill=tuple(text.randrange(256) for _ in range(3)))
+            else:
+                for i in range(6):
+                    line = " ".join(text.choice(WORDS) for _ in range(text.randrange(5, 9)))
+                    draw.text((x, y + i * 34), line, font=font, fill="black")
+        y += 290
+    return img
+
+
+def photo(img: Image.Image, angle: float = 0.0, brightness: float = 1.0, scale: float = 1.0) -> bytes:
+    """Фото страницы на столе: фон, поворот, экспозиция, масштаб, JPEG"""
+    margin = 120
+    out = Image.new("RGB", (img.width + 2 * margin, img.height + 2 * margin), (90, 70, 50))
+    out.paste(img, (margin, margin))
+    out = out.rotate(angle, resample=Image.BICUBIC, fillcolor=(90, 70, 50))
+    out = ImageEnhance.Brightness(out).enhance(brightness)
+    if scale != 1.0:
+        out = out.resize((int(out.width * scale), int(out.height * scale)), Image.LANCZOS)
+    buf = io.BytesIO()
+    out.save(buf, "JPEG", quality=80)
+    return buf.getvalue()
+
+
+def text_page() -> Image.Image:
+    """Страница сплошного текста с широкими полями, без шапки и картинок"""
+    font = ImageFont.load_default(size=22)
+    img = Image.new("RGB", (1240, 1754), "white")
+    draw = ImageDraw.Draw(img)
+    for y in range(150, 1600, 40):
+        draw.text((150, y), "listen and repeat the words, then answer the questions", font=font, fill="black")
+    return img
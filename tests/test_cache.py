@@ -0,0 +1,62 @@
+import os
+import time
+
+from app.cache import DiskCache, make_key, normalize_params
+
+VALUE = {"text": "x" * 1000}
+
+
+def age(cache, key, seconds):
+    """Сдвигает время записи в прошлое"""
+    path = cache._path(key)
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_put_get(tmp_path):
+    cache = DiskCache(str(tmp_path), max_age=60, max_bytes=1_000_000)
+    cache.put("a", VALUE)
+    assert cache.get("a") == VALUE
+    assert cache.get("missing") is None
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_expired_entry_removed(tmp_path):
+    cache = DiskCache(str(tmp_path), max_age=60, max_bytes=1_000_000)
+    cache.put("a", VALUE)
+    age(cache, "a", 120)
+    assert cache.get("a") is None
+    assert not os.path.exists(cache._path("a"))
+
+
+def test_oldest_evicted_over_size_limit(tmp_path):
+    size = len('{"text": ""}') + 1000
+    cache = DiskCache(str(tmp_path), max_age=3600, max_bytes=3 * size)
+    for i, key in enumerate("abc"):
+        cache.put(key, VALUE)
+        age(cache, key, 100 - i)
+    cache.put("d", VALUE)
+    assert cache.get("a") is None
+    assert all(cache.get(key) == VALUE for key in "bcd")
+
+
+def test_evict_drops_expired(tmp_path):
+    cache = DiskCache(str(tmp_path), max_age=60, max_bytes=1_000_000)
+    cache.put("old", VALUE)
+    cache.put("new", VALUE)
+    age(cache, "old", 120)
+    cache.evict()
+    assert sorted(os.listdir(tmp_path)) == ["new.json"]
+
+
+def test_corrupted_entry_is_a_miss(tmp_path):
+    cache = DiskCache(str(tmp_path), max_age=60, max_bytes=1_000_000)
+    with open(cache._path("a"), "w", encoding="utf-8") as f:
+        f.write("{not json")
+    assert cache.get("a") is None
+
+
+def test_key_separates_parts():
+    assert make_key("ab", "c") != make_key("a", "bc")
+    assert make_key({"b": 1, "a": 2}) == make_key({"a": 2, "b": 1})
+    assert normalize_params({"topic": "  Food   and  drinks ", "goal": None}) == {"topic": "Food and drinks", "goal": ""}
@@ -0,0 +1,80 @@
+import io
+import os
+import time
+
+import pytest
+from docx import Document
+
+from app import export
+
+PLAN = "План урока\n1. Warmer\n2. Presentation: present simple"
+
+
+@pytest.fixture
+def export_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_DIR", str(tmp_path))
+    monkeypatch.setattr(export, "_memo", export.OrderedDict())
+    return tmp_path
+
+
+def make_file(directory, name, size, age):
+    path = directory / name
+    path.write_bytes(b"x" * size)
+    past = time.time() - age
+    os.utime(path, (past, past))
+    return path
+
+
+def test_render_in_memory():
+    doc = Document(io.BytesIO(export.render_docx(PLAN)))
+    assert [p.text for p in doc.paragraphs] == PLAN.split("\n")
+
+
+def test_materialize_unique_names(export_dir):
+    data = export.render_docx(PLAN)
+    first, second = export.materialize(data), export.materialize(data)
+    assert first != second
+    assert sorted(os.listdir(export_dir)) == sorted([os.path.basename(first), os.path.basename(second)])
+
+
+def test_janitor_removes_expired(export_dir, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_MAX_AGE", 60)
+    make_file(export_dir, "old.docx", 10, 120)
+    make_file(export_dir, "new.docx", 10, 1)
+    export.cleanup_exports()
+    assert os.listdir(export_dir) == ["new.docx"]
+
+
+def test_janitor_keeps_size_limit(export_dir, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_MAX_AGE", 3600)
+    monkeypatch.setattr(export, "EXPORT_MAX_BYTES", 250)
+    for i, name in enumerate(["a.docx", "b.docx", "c.docx"]):
+        make_file(export_dir, name, 100, 30 - i)
+    export.cleanup_exports()
+    assert sorted(os.listdir(export_dir)) == ["b.docx", "c.docx"]
+
+
+def test_docx_built_once_per_plan(export_dir, monkeypatch):
+    calls = []
+    render = export.render_docx
+    monkeypatch.setattr(export, "render_docx", lambda text: calls.append(text) or render(text))
+    path = export.docx_for_plan(PLAN)
+    assert export.docx_for_plan(PLAN) == path
+    assert calls == [PLAN]
+    assert export.docx_for_plan(PLAN + "\n3. Practice") != path
+    assert len(calls) == 2
+
+
+def test_docx_rebuilt_after_cleanup(export_dir):
+    path = export.docx_for_plan(PLAN)
+    os.remove(path)
+    again = export.docx_for_plan(PLAN)
+    assert again != path
+    assert os.path.exists(again)
+
+
+def test_memo_bounded(export_dir, monkeypatch):
+    monkeypatch.setattr(export, "MEMO_SIZE", 2)
+    for i in range(4):
+        export.docx_for_plan(f"{PLAN}\n{i}")
+    assert len(export._memo) == 2
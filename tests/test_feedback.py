@@ -0,0 +1,128 @@
+import json
+import sqlite3
+
+import pytest
+import requests
+
+from app import feedback, http_client
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"HTTP {self.status_code}")
+
+
+class Sheet:
+    """Таблица: отвечает заданными кодами по очереди (дальше - 200) и запоминает тела запросов"""
+
+    def __init__(self, *codes):
+        self.codes = list(codes)
+        self.bodies = []
+
+    def post(self, url, json=None, **kwargs):
+        self.bodies.append(json)
+        code = self.codes.pop(0) if self.codes else 200
+        if isinstance(code, Exception):
+            raise code
+        return Response(code)
+
+
+@pytest.fixture
+def spool(tmp_path, monkeypatch):
+    monkeypatch.setattr(feedback, "SPOOL_PATH", str(tmp_path / "spool.sqlite3"))
+    monkeypatch.setattr(feedback, "GOOGLE_SHEET_URL", "https://script.google.com/macros/s/test/exec")
+    monkeypatch.setattr(feedback, "BATCH_POST", False)
+    return monkeypatch
+
+
+def sheet(monkeypatch, *codes):
+    fake = Sheet(*codes)
+    monkeypatch.setattr(http_client, "post", fake.post)
+    return fake
+
+
+def rows(table):
+    with sqlite3.connect(feedback.SPOOL_PATH) as conn:
+        return conn.execute(f"SELECT * FROM {table} ORDER BY id").fetchall()
+
+
+def test_saved_then_delivered(spool):
+    fake = sheet(spool)
+    feedback.save_feedback("Отличный план", 5)
+    feedback.save_feedback("Мало игр", 3)
+    assert len(rows("feedback")) == 2
+    assert feedback.flush() == 2
+    assert fake.bodies == [{"comment": "Отличный план", "rate": 5}, {"comment": "Мало игр", "rate": 3}]
+    assert rows("feedback") == []
+
+
+def test_network_error_keeps_rows(spool):
+    sheet(spool, requests.ConnectionError("offline"))
+    feedback.save_feedback("a", 4)
+    feedback.save_feedback("b", 4)
+    assert feedback.flush() == 0
+    assert [attempts for *_, attempts in rows("feedback")] == [1, 0]
+    # Таблица снова доступна - уходит всё
+    sheet(spool)
+    assert feedback.flush() == 2
+
+
+def test_server_error_retried(spool):
+    sheet(spool, 503)
+    feedback.save_feedback("a", 4)
+    assert feedback.flush() == 0
+    assert len(rows("feedback")) == 1
+
+
+def test_rejected_goes_to_dead_letter(spool):
+    sheet(spool, 400)
+    feedback.save_feedback("bad", 1)
+    feedback.save_feedback("good", 5)
+    assert feedback.flush() == 1
+    assert rows("feedback") == []
+    dead = rows("feedback_dead")
+    assert len(dead) == 1
+    assert json.loads(dead[0][1])["comment"] == "bad"
+    assert dead[0][-1] == "rejected"
+
+
+def test_too_many_attempts_go_to_dead_letter(spool):
+    spool.setattr(feedback, "MAX_ATTEMPTS", 2)
+    sheet(spool, 502, 502)
+    feedback.save_feedback("a", 4)
+    feedback.flush()
+    assert len(rows("feedback")) == 1
+    feedback.flush()
+    assert rows("feedback") == []
+    assert rows("feedback_dead")[0][-1] == "2 attempts"
+
+
+def test_batch_post(spool):
+    spool.setattr(feedback, "BATCH_POST", True)
+    fake = sheet(spool)
+    for i in range(3):
+        feedback.save_feedback(f"c{i}", i)
+    assert feedback.flush() == 3
+    assert fake.bodies == [{"rows": [{"comment": f"c{i}", "rate": i} for i in range(3)]}]
+
+
+def test_rejected_batch_sent_one_by_one(spool):
+    spool.setattr(feedback, "BATCH_POST", True)
+    fake = sheet(spool, 400, 200, 422, 200)
+    for i in range(3):
+        feedback.save_feedback(f"c{i}", i)
+    assert feedback.flush() == 2
+    assert len(fake.bodies) == 4
+    assert [json.loads(row[1])["comment"] for row in rows("feedback_dead")] == ["c1"]
+
+
+def test_no_url_no_flush(spool):
+    spool.setattr(feedback, "GOOGLE_SHEET_URL", None)
+    fake = sheet(spool)
+    feedback.save_feedback("a", 4)
+    assert feedback.flush() == 0
+    assert fake.bodies == []
@@ -0,0 +1,70 @@
+import pytest
+
+from app import few_shot
+from app.prompt_builder.prompt import build_prompt
+from app.tokens import estimate_text_tokens
+
+PPP = "PPP (Presentation-Practice-Production)"
+PARAMS = {
+    "textbook": "Spotlight 5",
+    "cefr": "A2",
+    "age": "10-11",
+    "duration": 45,
+    "num_students": 10,
+    "methodology": PPP,
+    "level_match": "на уровне",
+}
+
+
+def picked_tokens(methodology, cefr, max_tokens):
+    return sum(stage["tokens"] for _, stage in few_shot.base_stages(methodology, cefr, max_tokens))
+
+
+@pytest.mark.parametrize("max_tokens", [120, 300, 500, 700, 2000])
+def test_stages_fit_token_cap(max_tokens):
+    stages = few_shot.base_stages("ppp", 2, max_tokens)
+    assert stages
+    assert picked_tokens("ppp", 2, max_tokens) <= max_tokens
+    # По одному этапу на тип
+    kinds = [stage["kind"] for _, stage in stages]
+    assert len(kinds) == len(set(kinds))
+
+
+def test_bigger_cap_takes_more():
+    assert picked_tokens("ppp", 2, 300) < picked_tokens("ppp", 2, 700)
+
+
+def test_core_stages_first():
+    kinds = {stage["kind"] for _, stage in few_shot.base_stages("ppp", 2, 700)}
+    assert {"presentation", "practice"} <= kinds
+
+
+def test_disabled_or_unknown_methodology():
+    assert few_shot.select_examples("ppp", 2, 0) == ""
+    assert few_shot.select_examples("", 2) == ""
+    assert few_shot.select_tl_example("ppp", 2, "present perfect", 0) == ""
+    assert few_shot.select_tl_example("ppp", 2, "") == ""
+
+
+def test_tl_example_capped_and_not_repeated():
+    base = few_shot.select_examples("ppp", 2)
+    extra = few_shot.select_tl_example("ppp", 2, "past simple", 60)
+    assert extra
+    body = extra.split("]\n", 1)[1]
+    assert estimate_text_tokens(body.rstrip("…\n")) <= 60
+    assert body.strip() not in base
+
+
+def test_shared_examples_in_cached_prefix():
+    """Общие фрагменты одинаковы для разных уроков и стоят до параметров занятия"""
+    prompts = []
+    for topic, tl in (("Family", "have got"), ("Holidays", "past simple")):
+        params = dict(PARAMS, topic=topic, target_language=tl)
+        params["few_shot"], params["few_shot_tl"] = few_shot.few_shot_blocks(params)
+        prompts.append(build_prompt(params))
+    base = few_shot.few_shot_blocks(PARAMS)[0]
+    assert base
+    for prompt in prompts:
+        assert prompt.index(base) < prompt.index("Параметры занятия:")
+    shared = len(prompts[0].split("Параметры занятия:")[0])
+    assert prompts[0][:shared] == prompts[1][:shared]
@@ -0,0 +1,47 @@
+import io
+
+import pytest
+from PIL import Image, ImageDraw
+
+from app.image_prep import IMAGE_MAX_PATCHES, PATCH_SIZE, crop_to_page, fit_size
+from pages import page, photo
+
+
+def open_rgb(data: bytes) -> Image.Image:
+    return Image.open(io.BytesIO(data)).convert("RGB")
+
+
+def header_rows(img: Image.Image) -> int:
+    """Строки кадра, которые в среднем синие - шапка синтетической страницы"""
+    profile = img.resize((1, img.height), Image.BOX).getdata()
+    return sum(1 for r, g, b in profile if b > 150 and r < 120)
+
+
+def test_scan_is_not_cropped():
+    scan = page(1)
+    assert crop_to_page(scan).size == scan.size
+
+
+@pytest.mark.parametrize("variant", [dict(), dict(angle=3), dict(scale=0.5)])
+def test_photo_keeps_coloured_header(variant):
+    img = open_rgb(photo(page(1), **variant))
+    cropped = crop_to_page(img)
+    assert header_rows(cropped) >= header_rows(img) > 0
+    assert cropped.width * cropped.height < 0.9 * img.width * img.height  # стол всё-таки срезан
+
+
+def test_plain_page_on_table_is_cropped():
+    plain = Image.new("RGB", (1240, 1754), "white")
+    draw = ImageDraw.Draw(plain)
+    for y in range(100, 1700, 40):
+        draw.text((80, y), "listen and repeat the words " * 3, fill="black")
+    img = open_rgb(photo(plain))
+    cropped = crop_to_page(img)
+    assert cropped.width < img.width - 150 and cropped.height < img.height - 150
+
+
+@pytest.mark.parametrize("size", [(1480, 1994), (4000, 3000), (3000, 4000)])
+def test_fit_size_targets_patch_budget(size):
+    w, h = fit_size(*size, "o4-mini")
+    assert -(-w // PATCH_SIZE) * -(-h // PATCH_SIZE) <= IMAGE_MAX_PATCHES
+    assert abs(w / h - size[0] / size[1]) < 0.02
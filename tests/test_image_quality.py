@@ -0,0 +1,73 @@
+import io
+
+import pytest
+from PIL import Image, ImageDraw, ImageEnhance, ImageFilter
+
+from app.image_quality import assess
+from pages import page, photo, text_page
+
+OVEREXPOSED = "фото пересвечено - часть страницы может быть не видна"
+SIDEWAYS = "страница, похоже, повёрнута набок - поверните фото"
+PAGES = [page(1), page(2, layout=2), page(3, layout=3), text_page()]
+
+
+def encode(img: Image.Image, fmt: str = "PNG") -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, fmt)
+    return buf.getvalue()
+
+
+def with_glare(img: Image.Image, area: float) -> Image.Image:
+    """Страница при обычном свете с бликом: размытое белое пятно на доле area страницы, текст под ним стёрт"""
+    img = ImageEnhance.Brightness(img).enhance(0.85)
+    mask = Image.new("L", img.size, 0)
+    radius = int((area * img.width * img.height / 3.14) ** 0.5)
+    ImageDraw.Draw(mask).ellipse((500 - radius, 800 - radius, 500 + radius, 800 + radius), fill=255)
+    return Image.composite(Image.new("RGB", img.size, "white"), img, mask.filter(ImageFilter.GaussianBlur(40)))
+
+
+@pytest.mark.parametrize("fmt", ["PNG", "JPEG"])
+def test_clean_scan_passes(fmt):
+    result = assess(encode(page(1), fmt))
+    assert result["ok"], result
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+@pytest.mark.parametrize("variant", [dict(), dict(angle=3), dict(brightness=0.75), dict(brightness=1.25)])
+def test_photos_pass(seed, variant):
+    result = assess(photo(page(seed), **variant))
+    assert result["ok"], result
+
+
+@pytest.mark.parametrize("n", range(len(PAGES)))
+@pytest.mark.parametrize("as_photo", [False, True])
+def test_upright_page_is_not_sideways(n, as_photo):
+    data = photo(PAGES[n], angle=2) if as_photo else encode(PAGES[n])
+    assert SIDEWAYS not in assess(data)["problems"]
+
+
+@pytest.mark.parametrize("n", range(len(PAGES)))
+@pytest.mark.parametrize("turn", [90, -90])
+@pytest.mark.parametrize("as_photo", [False, True])
+def test_sideways_page_is_rejected(n, turn, as_photo):
+    turned = PAGES[n].rotate(turn, expand=True)
+    data = photo(turned, angle=2) if as_photo else encode(turned)
+    assert SIDEWAYS in assess(data)["problems"]
+
+
+def test_glare_is_rejected():
+    result = assess(photo(with_glare(page(1), 0.4)))
+    assert OVEREXPOSED in result["problems"]
+
+
+def test_white_paper_is_not_glare():
+    assert assess(encode(page(1)))["metrics"]["clipped"] == 0.0
+
+
+def test_blurred_photo_is_rejected():
+    result = assess(encode(page(1).filter(ImageFilter.GaussianBlur(6)), "JPEG"))
+    assert "фото размыто - текст на странице может не читаться" in result["problems"]
+
+
+def test_unreadable_file():
+    assert assess(b"not an image")["problems"] == ["не удалось открыть изображение"]
@@ -0,0 +1,73 @@
+import os
+import json
+
+import pytest
+
+from app import kb_indexer, retrieval
+from app.retrieval import KnowledgeIndex, MappedKnowledgeIndex
+
+QUERIES = [
+    "ppp A2 food some any",
+    "ttt B1 past simple test teach test",
+    "warmer game young learners",
+    "concept checking questions timeline",
+    "nothing relevant here zzz",
+]
+
+
+@pytest.fixture
+def built(tmp_path):
+    index_dir = str(tmp_path / "index")
+    kb_indexer.build(retrieval.KB_DIR, index_dir, full=True)
+    return index_dir
+
+
+def test_mapped_equals_in_memory(built):
+    memory = KnowledgeIndex.from_documents(retrieval.read_documents())
+    mapped = MappedKnowledgeIndex(built)
+    assert len(mapped) == len(memory) > 0
+    assert mapped.avg_length == pytest.approx(memory.avg_length)
+    found_any = False
+    for methodology in (None, "ppp", "ttt"):
+        for query in QUERIES:
+            expected = memory.search(query, k=5, methodology=methodology)
+            found = mapped.search(query, k=5, methodology=methodology)
+            assert [(r["source"], r["text"]) for r in found] == [(r["source"], r["text"]) for r in expected]
+            assert [r["score"] for r in found] == pytest.approx([r["score"] for r in expected])
+            found_any = found_any or bool(found)
+    assert found_any
+
+
+def test_fresh_until_file_changes(tmp_path):
+    kb_dir = tmp_path / "kb"
+    kb_dir.mkdir()
+    for name in retrieval.KB_FILES:
+        (kb_dir / name).write_text(f"# {name}\nPresentation and practice stages.", encoding="utf-8")
+    index_dir = str(tmp_path / "index")
+    kb_indexer.build(str(kb_dir), index_dir)
+    assert MappedKnowledgeIndex(index_dir).is_fresh(str(kb_dir))
+    (kb_dir / retrieval.KB_FILES[0]).write_text("# Changed\nProduction stage.", encoding="utf-8")
+    assert not MappedKnowledgeIndex(index_dir).is_fresh(str(kb_dir))
+
+
+def test_incremental_rebuild_reuses_unchanged(tmp_path):
+    kb_dir = tmp_path / "kb"
+    kb_dir.mkdir()
+    for name in retrieval.KB_FILES:
+        (kb_dir / name).write_text(f"# {name}\nWarmer and feedback stages.", encoding="utf-8")
+    index_dir = str(tmp_path / "index")
+    kb_indexer.build(str(kb_dir), index_dir)
+    (kb_dir / retrieval.KB_FILES[0]).write_text("# Changed\nHomework ideas.", encoding="utf-8")
+    _, stats = kb_indexer.update_files(str(kb_dir), kb_indexer.load_manifest(index_dir))
+    assert stats == {"indexed": 1, "reused": len(retrieval.KB_FILES) - 1, "removed": 0}
+
+
+def test_format_mismatch_rejected(built):
+    path = os.path.join(built, retrieval.LEXICON_FILE)
+    with open(path, encoding="utf-8") as f:
+        lexicon = json.load(f)
+    lexicon["version"] = retrieval.INDEX_VERSION + 1
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(lexicon, f)
+    with pytest.raises(ValueError):
+        MappedKnowledgeIndex(built)
@@ -0,0 +1,41 @@
+import pytest
+
+from app import ocr
+
+TILE_MODEL = "gpt-4.1"  # тайловая модель: detail учитывается
+PATCH_MODEL = "o4-mini"
+
+
+def result(confidence, words=200, exercises=()):
+    return {"text": "Read the text. " * (words // 3), "confidence": confidence, "words": words,
+            "exercises": list(exercises)}
+
+
+@pytest.mark.parametrize("results, model, mode", [
+    ([result(95)], TILE_MODEL, "skip"),
+    ([result(95)], PATCH_MODEL, "skip"),
+    ([result(95), result(93)], TILE_MODEL, "skip"),
+    # Мало слов - страница в основном из картинок
+    ([result(95, words=10)], TILE_MODEL, "low"),
+    ([result(80)], TILE_MODEL, "low"),
+    # Патчевым моделям уменьшенное изображение ничего не экономит
+    ([result(80)], PATCH_MODEL, "high"),
+    ([result(50)], TILE_MODEL, "high"),
+    # Решение - по худшей странице
+    ([result(95), result(50)], TILE_MODEL, "high"),
+    ([result(95), result(80)], TILE_MODEL, "low"),
+])
+def test_image_mode(results, model, mode):
+    assert ocr.image_mode(results, model) == mode
+
+
+def test_missing_result_sends_image():
+    assert ocr.image_mode([result(95), None], TILE_MODEL) == "high"
+    assert ocr.image_mode([], TILE_MODEL) == "high"
+
+
+def test_describe_pages():
+    text = ocr.describe_ocr([result(95, exercises=["1", "2a"]), result(92)], "skip", page_numbers=[1, 2])
+    assert "изображение не прикладывается" in text
+    assert "[Страница 1]" in text and "[Страница 2]" in text
+    assert "- Номера упражнений: 1, 2a" in text
@@ -0,0 +1,47 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app import ocr, page_analysis
+
+ANALYSIS = {
+    "textbook": "Spotlight 5",
+    "page_text": "Module 3 Home sweet home. Read the text about the house and answer the questions.",
+    "exercises": [{"number": "1", "content": "Listen and repeat"}, {"number": "2", "content": "Read and match"}],
+}
+
+
+@pytest.fixture
+def fake_ocr(monkeypatch):
+    pool = ThreadPoolExecutor(1)
+    monkeypatch.setattr(ocr, "available", lambda: True)
+    monkeypatch.setattr(ocr, "get_pool", lambda: pool)
+    yield monkeypatch
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def recognized(text, exercises):
+    return lambda image_bytes: {"text": text, "exercises": exercises}
+
+
+def test_other_textbook_rejected():
+    assert not page_analysis.confirm_match(ANALYSIS, b"", "Starlight 5")
+
+
+def test_other_exercises_rejected(fake_ocr):
+    fake_ocr.setattr(ocr, "run_ocr", recognized("Ex 7 and 8", ["7", "8"]))
+    assert not page_analysis.confirm_match(ANALYSIS, b"")
+
+
+def test_same_exercises_accepted(fake_ocr):
+    fake_ocr.setattr(ocr, "run_ocr", recognized(ANALYSIS["page_text"], ["1", "2"]))
+    assert page_analysis.confirm_match(ANALYSIS, b"")
+
+
+def test_slow_ocr_skipped(fake_ocr):
+    fake_ocr.setattr(ocr, "OCR_TIMEOUT", 0.2)
+    fake_ocr.setattr(ocr, "run_ocr", lambda image_bytes: time.sleep(2))
+    started = time.monotonic()
+    assert page_analysis.confirm_match(ANALYSIS, b"")
+    assert time.monotonic() - started < 1
@@ -0,0 +1,71 @@
+import random
+
+import pytest
+
+from app.page_hash import HASH_BITS, PAGE_HASH_DISTANCE, BKTree, PageHashIndex, dhash, hamming
+from pages import page, photo
+
+
+@pytest.fixture(scope="module")
+def reference():
+    return dhash(photo(page(1)))
+
+
+@pytest.mark.parametrize("variant", [
+    dict(angle=3),
+    dict(angle=-2, brightness=0.75),
+    dict(brightness=1.25),
+    dict(scale=0.5),
+])
+def test_same_page_is_within_threshold(reference, variant):
+    assert hamming(reference, dhash(photo(page(1), **variant))) <= PAGE_HASH_DISTANCE
+
+
+@pytest.mark.parametrize("seed", [2, 3])
+def test_other_page_with_same_layout_is_beyond_threshold(reference, seed):
+    assert hamming(reference, dhash(photo(page(seed)))) > PAGE_HASH_DISTANCE
+
+
+def test_hash_has_full_width():
+    assert 0 <= dhash(photo(page(1))) < 2 ** HASH_BITS
+
+
+def test_unreadable_image_gives_none():
+    assert dhash(b"not an image") is None
+
+
+def test_bk_tree_matches_brute_force():
+    rnd = random.Random(7)
+    base = rnd.getrandbits(HASH_BITS)
+    # Кластер близких хэшей вокруг base и случайные далёкие
+    values = [base ^ sum(1 << rnd.randrange(HASH_BITS) for _ in range(rnd.randrange(40))) for _ in range(200)]
+    values += [rnd.getrandbits(HASH_BITS) for _ in range(200)]
+    tree = BKTree()
+    for i, value in enumerate(values):
+        tree.add(value, f"page-{i}")
+    assert tree.size == len(values)
+
+    for radius in (0, 10, 30, 60):
+        expected = sorted((hamming(base, v), f"page-{i}") for i, v in enumerate(values) if hamming(base, v) <= radius)
+        assert tree.search(base, radius) == expected
+
+
+def test_bk_tree_ignores_duplicate_entry():
+    tree = BKTree()
+    tree.add(5, "a")
+    tree.add(5, "a")
+    tree.add(5, "b")
+    assert tree.size == 2
+    assert tree.search(5, 0) == [(0, "a"), (0, "b")]
+
+
+def test_index_persists_and_skips_old_format(tmp_path):
+    path = tmp_path / "hashes.jsonl"
+    path.write_text('{"hash": "ffffffffffffffff", "key": "old-64-bit"}\n', encoding="utf-8")
+    value = dhash(photo(page(1)))
+    PageHashIndex(str(path)).add(value, "page-1")
+
+    index = PageHashIndex(str(path))
+    assert index.tree.size == 1
+    assert index.nearest(value) == (0, "page-1")
+    assert index.nearest(value ^ ((1 << (PAGE_HASH_DISTANCE + 1)) - 1)) is None
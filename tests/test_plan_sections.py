@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from app.plan_sections import INTRO_TITLE, find_section, replace_section, section_text, split_sections, stage_count
+
+SAMPLE = os.path.join(os.path.dirname(__file__), "..", "app", "knowledge_base", "test_samples", "PPP_Spotlight 5_1.md")
+
+
+@pytest.fixture(scope="module")
+def sample_plan():
+    # До разделителя в файле - копия промпта, после - план, который вернула модель
+    with open(SAMPLE, "r", encoding="utf-8") as f:
+        text = f.read()
+    return text.split("#######################", 1)[1].lstrip("\n")
+
+
+def test_sample_plan_splits_into_stages(sample_plan):
+    sections = split_sections(sample_plan)
+    assert [s["title"] for s in sections] == [
+        INTRO_TITLE,
+        "Этап 1. Presentation (12 мин, 20%)",
+        "Этап 2. Practice (25 мин, 40%)",
+        "Этап 3. Production (18 мин, 30%)",
+    ]
+    assert stage_count(sections) == 3
+    # Этапы покрывают план целиком и без пересечений
+    assert sections[0]["start"] == 0 and sections[-1]["end"] == len(sample_plan.split("\n"))
+    assert all(a["end"] == b["start"] for a, b in zip(sections, sections[1:]))
+
+
+def test_subitems_are_not_stages(sample_plan):
+    titles = [s["title"] for s in split_sections(sample_plan)]
+    assert not any(title.startswith("1.1.") for title in titles)
+
+
+@pytest.mark.parametrize("text, titles", [
+    ("## Warm-up\nпесня\n\n## Practice\nупражнение 2\n", ["Warm-up", "Practice"]),
+    ("Цель: ...\n\nStage 1: Lead-in\nвопросы\nStage 2: Reading\nтекст\n", [INTRO_TITLE, "Stage 1: Lead-in", "Stage 2: Reading"]),
+    ("Warm-up (5 мин)\nпесня\nPresentation (10 мин)\nкартинки\nProduction (15 мин)\nролевая игра\n",
+     ["Warm-up (5 мин)", "Presentation (10 мин)", "Production (15 мин)"]),
+    ("**Разминка**\nигра\n**Практика**\nупражнения\n", ["Разминка", "Практика"]),
+])
+def test_plain_and_markdown_stage_lines(text, titles):
+    assert [s["title"] for s in split_sections(text)] == titles
+
+
+def test_text_without_stages_is_not_split():
+    sections = split_sections("Просто текст плана\nбез этапов")
+    assert [s["title"] for s in sections] == [INTRO_TITLE]
+    assert stage_count(sections) == 0
+
+
+def test_replace_section_keeps_other_stages(sample_plan):
+    sections, index = find_section(sample_plan, "3. Этап 2. Practice (25 мин, 40%)")
+    new_text = replace_section(sample_plan, sections[index], "Этап 2. Practice (25 мин, 40%)\nновые упражнения")
+    after = split_sections(new_text)
+    assert [s["title"] for s in after] == [s["title"] for s in sections]
+    assert section_text(new_text, after[2]).strip() == "Этап 2. Practice (25 мин, 40%)\nновые упражнения"
+    assert section_text(new_text, after[3]) == section_text(sample_plan, sections[3])
+
+
+def test_unknown_label_is_not_found(sample_plan):
+    assert find_section(sample_plan, "9. Этап 9") is None
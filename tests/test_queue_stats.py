@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from app.queue_stats import GenerationLoad
+
+
+def test_enqueue_reports_position_and_wait():
+    load = GenerationLoad(concurrency=2, max_waiting=10)
+    load.latencies.extend([30.0, 50.0])
+    # Два свободных слота - ждать не нужно
+    assert load.enqueue() == (0, 0.0)
+    assert load.enqueue() == (0, 0.0)
+    assert load.enqueue() == (1, 40.0)
+    assert load.enqueue() == (2, 40.0)
+    assert load.enqueue() == (3, 80.0)
+    assert load.waiting == 5
+
+
+def test_full_queue_rejected():
+    load = GenerationLoad(concurrency=1, max_waiting=2)
+    load.enqueue()
+    load.enqueue()
+    with pytest.raises(OverflowError):
+        load.enqueue()
+    assert load.waiting == 2
+
+
+def test_start_finish_cycle():
+    async def scenario():
+        load = GenerationLoad(concurrency=1, max_waiting=5)
+        load.enqueue()
+        await load.start()
+        assert (load.waiting, load.active) == (0, 1)
+
+        # Второй ждёт слот, пока первый не закончит
+        load.enqueue()
+        second = asyncio.create_task(load.start())
+        await asyncio.sleep(0)
+        assert not second.done()
+        load.finish(12.0)
+        await second
+        assert (load.waiting, load.active) == (0, 1)
+        load.finish(8.0)
+        assert load.active == 0
+        assert load.average_latency() == 10.0
+
+    asyncio.run(scenario())
+
+
+def test_cancel_while_waiting():
+    async def scenario():
+        load = GenerationLoad(concurrency=1, max_waiting=5)
+        load.enqueue()
+        await load.start()
+        load.enqueue()
+        waiting = asyncio.create_task(load.start())
+        await asyncio.sleep(0)
+        # Вкладку закрыли - обработчик снимает заявку с очереди сам
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        load.cancel()
+        assert load.waiting == 0
+        load.finish(5.0)
+        # Слот освободился и достаётся следующей заявке
+        load.enqueue()
+        await asyncio.wait_for(load.start(), timeout=1)
+        assert (load.waiting, load.active) == (0, 1)
+
+    asyncio.run(scenario())
+
+
+def test_default_latency_without_history():
+    load = GenerationLoad(concurrency=1, max_waiting=5)
+    assert load.average_latency() == 60.0
+    load.enqueue()
+    assert load.enqueue() == (1, 60.0)
@@ -0,0 +1,52 @@
+from app import retrieval
+from app.retrieval import KnowledgeIndex, tokenize
+
+DOCUMENTS = [
+    ("ppp.md", "PPP lesson. Presentation of the present perfect: concept checking questions, timeline, "
+               "drilling the form. Controlled practice then freer production."),
+    ("ttt.md", "TTT lesson. Test first: students try the task, the teacher notes gaps in past simple, "
+               "teaches the missing forms and tests again."),
+    ("games.md", "Warmers and games for young learners: songs, flashcards, running dictation, "
+                 "board race. Short energetic activities between stages."),
+]
+
+
+def test_best_match_first():
+    index = KnowledgeIndex.from_documents(DOCUMENTS)
+    results = index.search("present perfect timeline concept checking", k=3)
+    assert results[0]["source"] == "ppp.md"
+    assert [r["score"] for r in results] == sorted((r["score"] for r in results), reverse=True)
+
+
+def test_top_k_and_min_score():
+    index = KnowledgeIndex.from_documents(DOCUMENTS)
+    assert len(index.search("lesson students teacher games songs", k=1)) == 1
+    # Слов из базы в запросе нет - ничего не добавляем
+    assert index.search("quantum chromodynamics", k=3) == []
+
+
+def test_other_methodology_skipped():
+    index = KnowledgeIndex.from_documents(DOCUMENTS)
+    sources = [r["source"] for r in index.search("lesson practice tests forms", k=3, methodology="ppp")]
+    assert "ttt.md" not in sources
+    assert "ppp.md" in sources
+
+
+def test_rare_term_outweighs_common():
+    index = KnowledgeIndex.from_documents(DOCUMENTS)
+    rare, common = tokenize("flashcards lesson")
+    assert index.idf(rare) > index.idf(common)
+
+
+def test_only_whitelisted_files_indexed(tmp_path):
+    for name in (*retrieval.KB_FILES, "test.md"):
+        (tmp_path / name).write_text("# Notes\nPresentation stage <!-- dev: check prompt --> tips", encoding="utf-8")
+    assert retrieval.kb_files(str(tmp_path)) == list(retrieval.KB_FILES)
+    documents = retrieval.read_documents(str(tmp_path))
+    assert all("dev:" not in text for _, text in documents)
+
+
+def test_query_from_params():
+    query = retrieval.build_query({"methodology": "PPP (Presentation-Practice-Production)", "cefr": "A2",
+                                   "topic": "Food", "target_language": "some/any"})
+    assert query.split()[:3] == ["ppp", "A2", "Food"]
@@ -0,0 +1,45 @@
+import pytest
+
+from app import routing
+
+FULL = {"textbook": "Spotlight 5", "cefr": "A1", "topic": "Food", "goal": "order a meal", "target_language": "some/any"}
+
+
+@pytest.mark.parametrize("params, route", [
+    (dict(FULL, duration=45), "light"),
+    (dict(FULL, duration=45, topic=""), "light"),  # одно поле модель определит сама
+    (dict(FULL, duration=45, topic="", goal=" "), "default"),
+    (dict(FULL, duration=60), "default"),
+    (dict(FULL, duration=45, web_search=True), "default"),
+    ({"duration": 45}, "default"),
+])
+def test_default_rules(params, route):
+    assert routing.choose_route(params)["name"] == route
+
+
+def test_count_inferred_treats_blank_as_missing():
+    assert routing.count_inferred(dict(FULL, goal="  ", cefr=None)) == 2
+
+
+def test_first_matching_rule_wins(monkeypatch):
+    monkeypatch.setattr(routing, "RULES", [
+        {"name": "individual", "when": {"format_type": "Индивидуальное"}, "model": "gpt-4.1-mini"},
+        {"name": "long", "when": {"min_duration": 90}, "model": "o4-mini", "effort": "high"},
+        {"name": "rest", "when": {}, "model": "o4-mini", "effort": "medium"},
+    ])
+    route = routing.choose_route({"format_type": "Индивидуальное", "duration": 90})
+    assert route == {"name": "individual", "model": "gpt-4.1-mini", "effort": None}
+    assert routing.choose_route({"format_type": "Групповое", "duration": 90})["name"] == "long"
+    assert routing.choose_route({"format_type": "Групповое", "duration": 60})["name"] == "rest"
+
+
+def test_fallback_when_no_rule_matches(monkeypatch):
+    monkeypatch.setattr(routing, "RULES", [{"name": "short", "when": {"max_duration": 30}, "model": "gpt-4.1-mini"}])
+    assert routing.choose_route({"duration": 60})["name"] == "fallback"
+
+
+def test_rules_file_errors_fall_back_to_defaults(monkeypatch, tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text("{not json", encoding="utf-8")
+    monkeypatch.setenv("ROUTING_RULES_FILE", str(path))
+    assert routing.load_rules() == routing.DEFAULT_RULES
@@ -0,0 +1,33 @@
+import pytest
+
+from app.textbook_search import TextbookIndex, suggest_textbooks
+
+
+@pytest.mark.parametrize("query, best", [
+    ("Spotlight 5", "Spotlight 5"),
+    ("spotlite 6", "Spotlight 6"),  # опечатка
+    ("EF int", "English File Intermediate"),  # сокращение уровня
+    ("nef", "New English File Beginner"),  # аббревиатура серии
+    ("ff 3", "Family and Friends 3"),
+])
+def test_best_suggestion(query, best):
+    assert suggest_textbooks(query)[0] == best
+
+
+def test_prefix_while_typing():
+    results = suggest_textbooks("spotl", limit=20)
+    assert results and all(title.startswith("Spotlight") for title in results)
+
+
+def test_every_query_word_must_match():
+    assert suggest_textbooks("spotlight zzzz") == []
+    assert suggest_textbooks("") == []
+
+
+def test_fewer_extra_words_rank_first():
+    index = TextbookIndex(["Go Getter 2", "Go Getter", "Go"])
+    assert index.search("go getter") == ["Go Getter", "Go Getter 2"]
+
+
+def test_limit():
+    assert len(suggest_textbooks("english", limit=3)) == 3
@@ -0,0 +1,23 @@
+import pytest
+
+from app.knowledge_base.textbooks import describe_textbook, find_textbook
+
+
+@pytest.mark.parametrize("name, title", [
+    ("Spotlight 5", "Spotlight 5"),
+    ("  spotlight-5 ", "Spotlight 5"),  # регистр и пунктуация
+    ("Spotlight 5, модуль 3", "Spotlight 5"),  # название в начале строки
+])
+def test_find_textbook(name, title):
+    assert find_textbook(name)["title"] == title
+
+
+def test_find_textbook_unknown():
+    assert find_textbook("Мой учебник") is None
+    assert find_textbook("") is None
+
+
+def test_describe_textbook():
+    assert describe_textbook(find_textbook("Spotlight 5")) == (
+        "Spotlight 5 (Express Publishing / Просвещение), CEFR A1–A2, возраст 10-11"
+    )
@@ -0,0 +1,69 @@
+from app import tokens
+from app.image_prep import estimate_image_tokens
+from app.prompt_builder.prompt import build_prompt
+
+PAGE = (1480, 1994)  # фото страницы с телефона
+PARAMS = {
+    "textbook": "Spotlight 5",
+    "cefr": "A1",
+    "topic": "",
+    "goal": "",
+    "age": "10-11",
+    "duration": 45,
+    "num_students": 10,
+    "methodology": "PPP (Presentation-Practice-Production)",
+    "level_match": "на уровне",
+    "extra_info": "ученики любят игры и песни. " * 40,
+    "kb_context": "\nМатериалы методической базы:\n" + "Presentation: контекст, eliciting, COW. " * 60,
+    "few_shot": "\nПримеры этапов:\n" + "Practice: gap-fill, matching, drills. " * 60,
+}
+
+
+def fit(budget, detail="high", model="o4-mini"):
+    return tokens.fit_to_budget(PARAMS, build_prompt(PARAMS), [PAGE], model, budget=budget, detail=detail)
+
+
+def test_within_budget_sends_as_is():
+    prompt, detail, estimate = fit(100_000)
+    assert prompt == build_prompt(PARAMS)
+    assert detail == "high"
+    assert not estimate["over_budget"]
+    assert "downgrades" not in estimate
+
+
+def test_degradation_order_when_nothing_fits():
+    prompt, detail, estimate = fit(1)
+    assert estimate["downgrades"] == ["kb_context", "few_shot", "extra_info", "compact", "detail"]
+    assert detail == "low"
+    assert estimate["over_budget"]
+    assert estimate["budget"] == 1
+    assert PARAMS["kb_context"] not in prompt and PARAMS["few_shot"] not in prompt
+    assert prompt.endswith("…\n")  # урезанная доп. информация - последняя строка
+
+
+def test_stops_at_first_step_that_fits():
+    without_kb = build_prompt(dict(PARAMS, kb_context=""))
+    budget = tokens.estimate_request(without_kb, [PAGE], "o4-mini", "high")["total"]
+    prompt, detail, estimate = fit(budget)
+    assert estimate["downgrades"] == ["kb_context"]
+    assert prompt == without_kb
+    assert detail == "high"
+    assert not estimate["over_budget"]
+
+
+def test_detail_step_skipped_when_already_low():
+    _, detail, estimate = fit(1, detail="low")
+    assert "detail" not in estimate["downgrades"]
+    assert detail == "low"
+
+
+def test_low_detail_shrinks_patch_model_images():
+    assert estimate_image_tokens(*PAGE, "o4-mini", "low") < estimate_image_tokens(*PAGE, "o4-mini", "high")
+    # Тайловые модели в detail=low платят только базу
+    assert estimate_image_tokens(*PAGE, "gpt-4o", "low") == 85
+    assert estimate_image_tokens(*PAGE, "gpt-4o-mini", "low") == 2833
+
+
+def test_missing_image_size_is_ignored():
+    estimate = tokens.estimate_request("текст", [None], "o4-mini", "high")
+    assert estimate["image"] == 0